@@ -0,0 +1,116 @@
+"""Rows/sec of the per-row (--engine python) and columnar (--engine numpy) engines for vInfo and vDisk.
+
+Both engines build the same VM plan against the same topology, shard by shard as the generator does,
+and write CSV to memory, so the numbers measure row generation and formatting only (no disk or ZIP I/O).
+
+Usage: python benchmarks/bench_columnar.py [--num_vms 20000] [--shard_size 5000] [--repeat 5] [--min_speedup 10]
+"""
+import argparse
+import io
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import rvtools_data_generator as gen
+
+SDK_SERVER, SDK_UUID = "vcenter.bench.local", "vcguid-bench"
+TABLES = ("vInfo", "vDisk")
+
+
+def build_topology(num_vms):
+    """Builds a fancy-complexity topology once; returns (complexity_params, plan, pickled ENVIRONMENT_DATA)."""
+    for kind in ("vms", "hosts", "clusters", "datastores", "networks", "resource_pools", "datacenters", "folders", "dvSwitches", "vswitches"):
+        gen.ENVIRONMENT_DATA[kind] = []
+    gen.set_run_seed(0)
+    complexity_params = gen.get_complexity_parameters("fancy", num_vms)
+    plan = gen._build_vinfo_topology(num_vms, SDK_SERVER, SDK_UUID, complexity_params)
+    return complexity_params, plan, pickle.dumps(dict(gen.ENVIRONMENT_DATA))
+
+
+def _shards(total, shard_size):
+    return [(start, min(start + shard_size, total)) for start in range(0, total, shard_size)]
+
+
+def run_python_engine(plan, total, complexity_params, shard_size):
+    timings = {table: [0, 0.0] for table in TABLES}
+    for shard_index, (lo, hi) in enumerate(_shards(total, shard_size)):
+        start = time.perf_counter()
+        vms = []
+        for vm_index, segment in gen._iter_vm_plan(plan, lo, hi):
+            with gen.use_rng_stream("vm", vm_index):
+                vms.append(gen._build_vm_record(vm_index, segment, SDK_SERVER, SDK_UUID, complexity_params, False, "mock"))
+        rows = gen._write_csv_stream(io.BytesIO(), (gen._vinfo_row_from_vm_record(vm_rec) for vm_rec in vms), gen.CSV_HEADERS["vInfo"], write_header=False)[0]
+        _add_timing(timings, "vInfo", rows, start)
+
+        start = time.perf_counter()
+        with gen.use_rng_stream("shard", shard_index, "vDisk"):
+            rows = gen._write_csv_stream(io.BytesIO(), gen._iter_vdisk_rows(complexity_params, vms=vms), gen.CSV_HEADERS["vDisk"], write_header=False)[0]
+        _add_timing(timings, "vDisk", rows, start)
+    return timings
+
+
+def run_numpy_engine(plan, total, complexity_params, shard_size):
+    timings = {table: [0, 0.0] for table in TABLES}
+    for shard_index, (lo, hi) in enumerate(_shards(total, shard_size)):
+        start = time.perf_counter()
+        vms, vinfo_block = gen.columnar_vm_records(plan, lo, hi, gen._np_stream("shard", shard_index, "vms"), SDK_SERVER, SDK_UUID, complexity_params)
+        rows = gen._write_csv_blocks_stream(io.BytesIO(), [vinfo_block], gen.CSV_HEADERS["vInfo"], write_header=False)[0]
+        _add_timing(timings, "vInfo", rows, start)
+
+        start = time.perf_counter()
+        vdisk_block = gen.columnar_vdisk_block(vms, gen._np_stream("shard", shard_index, "vDisk"), complexity_params)
+        rows = gen._write_csv_blocks_stream(io.BytesIO(), [vdisk_block], gen.CSV_HEADERS["vDisk"], write_header=False)[0]
+        _add_timing(timings, "vDisk", rows, start)
+    return timings
+
+
+def _add_timing(timings, table, rows, start):
+    timings[table][0] += rows
+    timings[table][1] += time.perf_counter() - start
+
+
+def best_rows_per_sec(engines, plan, total, complexity_params, shard_size, topology_blob, repeat):
+    """Best rows/sec per engine and table; engines alternate within each repeat so both see the same machine load."""
+    best = {name: {} for name in engines}
+    for _ in range(repeat):
+        for name, engine in engines.items():
+            with gen.TOPOLOGY.scratch_copy(pickle.loads(topology_blob)): # Every run starts from the same topology
+                timings = engine(plan, total, complexity_params, shard_size)
+            for table, (rows, seconds) in timings.items():
+                best[name][table] = max(best[name].get(table, 0.0), rows / seconds)
+    return best
+
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num_vms", type=int, default=20000)
+    parser.add_argument("--shard_size", type=int, default=5000, help="VMs per shard, as with the generator's --shard_size.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per engine; the best rows/sec is reported.")
+    parser.add_argument("--min_speedup", type=float, default=None, help="Exit non-zero if any table's speedup is below this.")
+    args = parser.parse_args(args_list)
+
+    if not gen.NUMPY_AVAILABLE:
+        sys.exit("NumPy is not installed (pip install numpy); nothing to compare.")
+
+    complexity_params, plan, topology_blob = build_topology(args.num_vms)
+    total = sum(count for count, _ in plan)
+    rates = best_rows_per_sec({"python": run_python_engine, "numpy": run_numpy_engine}, plan, total, complexity_params, args.shard_size, topology_blob, args.repeat)
+    python_rates, numpy_rates = rates["python"], rates["numpy"]
+
+    print(f"{total} VMs in shards of {args.shard_size}, best of {args.repeat}")
+    print(f"{'table':<8} {'python rows/s':>15} {'numpy rows/s':>15} {'speedup':>8}")
+    speedups = {}
+    for table in TABLES:
+        speedups[table] = numpy_rates[table] / python_rates[table]
+        print(f"{table:<8} {python_rates[table]:>15,.0f} {numpy_rates[table]:>15,.0f} {speedups[table]:>7.1f}x")
+
+    if args.min_speedup is not None and min(speedups.values()) < args.min_speedup:
+        sys.exit(f"Speedup below {args.min_speedup}x")
+    return speedups
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Scale benchmark of a full generator run (main() and every generate_*_csv) at growing VM counts.
+
+Each (path, size) run happens in a fresh child process, so peak RSS is per run. The random path uses
+--num_vms; the scenario path maps sample_config.yaml's profiles onto the scenario schema the generator
+reads and scales its VM and host counts to the size. For every run the report gives the wall time, peak
+RSS and ZIP size, wall and CPU time per stage (each table task, the sharded VM stage, the process pool,
+and the final ZIP step), and rows, bytes and rows/sec per table.
+
+Results are written as JSON (--output). With --baseline, they are compared against an earlier report, and
+changes beyond --tolerance are listed as regressions (--fail_on_regression exits non-zero on any).
+
+Usage: python benchmarks/bench_scale.py [--sizes 1000,10000,100000,1000000] [--paths random,scenario]
+           [--output bench_scale.json] [--baseline benchmarks/baseline_scale.json] [--tolerance 0.15] [--fail_on_regression]
+           [-- extra generator options, e.g. --workers 4 --engine numpy --direct_zip]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+SAMPLE_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sample_config.yaml'))
+VMS_PER_HOST = 40 # Host density of the scaled scenario
+ZIP_NAME = "bench.zip"
+
+
+def scaled_scenario(sample, num_vms):
+    """sample_config.yaml's datacenters and profiles in the generator's scenario schema, scaled to num_vms VMs."""
+    host_profiles = {p["name"]: {"cpu_sockets": p.get("cpu_sockets"), "cores_per_socket": p.get("cores_per_socket"), "memory_mib": p.get("memory_mib")}
+                     for p in sample.get("host_hardware_profiles", [])}
+    vm_profiles = {p["profile_name"]: {"vcpu": p.get("total_vcpus"), "memory_mb": p.get("memory_mib"), "os_options": [p.get("os_description_for_tools", "Other Guest OS")],
+                                       "disks": [{"size_gb": d.get("size_mib", 10240) // 1024, "thin_provisioned": d.get("thin_provisioned", True)} for d in p.get("disks", [])],
+                                       "nics": [{"network_label_hint": n.get("network_assignment_hint")} for n in p.get("nics", [])]}
+                   for p in sample.get("vm_profiles", [])}
+    deployments = [(plan["target_cluster_profile"], d["vm_profile_name"], d.get("count", 1)) for plan in sample.get("deployment_plan", []) for d in plan.get("vm_deployments", [])]
+    sample_total = sum(count for _, _, count in deployments) or 1
+    prefix = sample.get("global_settings", {}).get("datacenter_prefix", "")
+    host_profile_name = next(iter(host_profiles), None)
+
+    datacenters = []
+    remaining = num_vms
+    for dc_index, dc in enumerate(sample.get("datacenters", [])):
+        dc_share = remaining if dc_index == len(sample["datacenters"]) - 1 else num_vms // len(sample["datacenters"])
+        remaining -= dc_share
+        hosts_per_cluster = max(1, -(-dc_share // (VMS_PER_HOST * len(sample.get("cluster_profiles", [])) or 1)))
+        plan, placed = [], 0
+        for index, (cluster_profile, vm_profile, count) in enumerate(deployments):
+            scaled = dc_share - placed if index == len(deployments) - 1 else dc_share * count // sample_total
+            placed += scaled
+            plan.append({"profile_name": vm_profile, "target_cluster_profile": cluster_profile, "count": scaled})
+        datacenters.append({"name": prefix + dc["name"],
+                            "cluster_profiles": {cp["name"]: {"num_hosts": max(cp.get("hosts_per_cluster", 1), hosts_per_cluster), "host_hardware_profile": host_profile_name}
+                                                 for cp in sample.get("cluster_profiles", [])},
+                            "deployment_plan": plan})
+    return {"datacenters": datacenters, "host_hardware_profiles": host_profiles, "vm_profiles": vm_profiles}
+
+
+def run_child(spec):
+    """Runs one generator run in this process and returns its measurements."""
+    import rvtools_data_generator as gen
+
+    stages = {}
+    stages_lock = threading.Lock()
+    last_stage_end = [0.0]
+
+    def timed(stage_name, func):
+        def wrapper(*args, **kwargs):
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                name = stage_name(*args)
+                with stages_lock:
+                    stages[name] = {"wall_seconds": time.perf_counter() - wall, "cpu_seconds": time.thread_time() - cpu}
+                    last_stage_end[0] = max(last_stage_end[0], time.perf_counter())
+        return wrapper
+
+    gen.run_generation_task = timed(lambda name, task_config: name, gen.run_generation_task)
+    gen.run_sharded_vm_generation = timed(lambda *args: "sharded VM tables", gen.run_sharded_vm_generation)
+    gen.run_tasks_in_process_pool = timed(lambda *args: "process pool", gen.run_tasks_in_process_pool)
+
+    cli_args = ["--output_dir", spec["output_dir"], "--zip_filename", ZIP_NAME, "--force_overwrite", "--seed", "0", "--complexity", "fancy", "--num_vms", str(spec["num_vms"])]
+    if spec["path"] == "scenario":
+        cli_args += ["--config_file", spec["scenario_file"]]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        gen.main(cli_args + spec["extra_args"])
+    end = time.perf_counter()
+    stages["finish (ZIP)"] = {"wall_seconds": end - max(last_stage_end[0], start), "cpu_seconds": None}
+
+    stage_of_table = {table: "sharded VM tables" for table in gen.SHARDED_TABLES if "sharded VM tables" in stages}
+    tables = {}
+    for arcname, entry in gen.EXPORT_MANIFEST.items():
+        table = os.path.splitext(os.path.basename(arcname))[0]
+        stage = stages.get(stage_of_table.get(table, table)) or stages.get("process pool")
+        tables[table] = {"rows": entry["rows"], "bytes": entry["bytes"],
+                         "rows_per_sec": entry["rows"] / stage["wall_seconds"] if stage and stage["wall_seconds"] else None}
+    zip_path = os.path.join(spec["output_dir"], ZIP_NAME)
+    rss_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {"path": spec["path"], "num_vms": spec["num_vms"], "wall_seconds": end - start, "cpu_seconds": time.process_time() - cpu_start,
+            "peak_rss_mb": rss_kb / 1024, "zip_bytes": os.path.getsize(zip_path) if os.path.exists(zip_path) else 0,
+            "stages": stages, "tables": tables}
+
+
+def run_in_subprocess(spec):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{spec['path']} run at {spec['num_vms']} VMs failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Human-readable lines for every metric that moved beyond tolerance; returns (lines, regressions)."""
+    base_runs = {(run["path"], run["num_vms"]): run for run in baseline.get("runs", [])}
+    lines, regressions = [], 0
+
+    def check(label, new, old, higher_is_better):
+        nonlocal regressions
+        if not new or not old:
+            return
+        change = new / old - 1
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        better = change > tolerance if higher_is_better else change < -tolerance
+        if worse or better:
+            regressions += worse
+            lines.append(f"{'REGRESSION' if worse else 'improved  '} {label}: {old:,.2f} -> {new:,.2f} ({change:+.0%})")
+
+    for run in results["runs"]:
+        base = base_runs.get((run["path"], run["num_vms"]))
+        if base is None:
+            continue
+        prefix = f"{run['path']} {run['num_vms']:,} VMs"
+        check(f"{prefix} wall seconds", run["wall_seconds"], base["wall_seconds"], False)
+        check(f"{prefix} peak RSS MB", run["peak_rss_mb"], base["peak_rss_mb"], False)
+        for table, stats in run["tables"].items():
+            check(f"{prefix} {table} rows/sec", stats["rows_per_sec"], base["tables"].get(table, {}).get("rows_per_sec"), True)
+    return lines, regressions
+
+
+def print_report(results):
+    for run in results["runs"]:
+        print(f"\n{run['path']} path, {run['num_vms']:,} VMs: {run['wall_seconds']:.2f}s wall, {run['cpu_seconds']:.2f}s CPU, "
+              f"peak RSS {run['peak_rss_mb']:.0f} MB, ZIP {run['zip_bytes'] / (1 << 20):.1f} MB")
+        print(f"  {'stage':<20} {'wall s':>9} {'cpu s':>9}")
+        for name, stage in sorted(run["stages"].items(), key=lambda item: -item[1]["wall_seconds"]):
+            cpu = f"{stage['cpu_seconds']:.2f}" if stage["cpu_seconds"] is not None else "-"
+            print(f"  {name:<20} {stage['wall_seconds']:>9.2f} {cpu:>9}")
+        print(f"  {'table':<12} {'rows':>10} {'MB':>9} {'rows/s':>12}")
+        for table, stats in sorted(run["tables"].items()):
+            rate = f"{stats['rows_per_sec']:,.0f}" if stats["rows_per_sec"] else "-"
+            print(f"  {table:<12} {stats['rows']:>10,} {stats['bytes'] / (1 << 20):>9.2f} {rate:>12}")
+
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Comma-separated VM counts.")
+    parser.add_argument("--paths", default="random,scenario", help="Comma-separated subset of random,scenario.")
+    parser.add_argument("--output", default="bench_scale.json", help="Where to write the JSON results.")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Relative change reported as a regression or improvement.")
+    parser.add_argument("--fail_on_regression", action="store_true", help="Exit non-zero if any metric regressed beyond --tolerance.")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args, extra_args = parser.parse_known_args(args_list)
+
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return None
+
+    extra_args = [arg for arg in extra_args if arg != "--"]
+    paths = [path for path in args.paths.split(",") if path]
+    sample = None
+    if "scenario" in paths:
+        try:
+            import yaml
+        except ImportError:
+            sys.exit("The scenario path needs PyYAML (pip install pyyaml); use --paths random.")
+        with open(SAMPLE_CONFIG) as f:
+            sample = yaml.safe_load(f)
+
+    results = {"meta": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                        "extra_args": extra_args, "created": time.strftime("%Y-%m-%dT%H:%M:%S")}, "runs": []}
+    with tempfile.TemporaryDirectory(prefix="bench_scale_") as scratch:
+        for num_vms in (int(size) for size in args.sizes.split(",") if size):
+            for path in paths:
+                spec = {"path": path, "num_vms": num_vms, "output_dir": os.path.join(scratch, f"{path}_{num_vms}"), "extra_args": extra_args}
+                if path == "scenario":
+                    spec["scenario_file"] = os.path.join(scratch, f"scenario_{num_vms}.yaml")
+                    with open(spec["scenario_file"], "w") as f:
+                        yaml.safe_dump(scaled_scenario(sample, num_vms), f)
+                print(f"Running {path} path at {num_vms:,} VMs...", flush=True)
+                results["runs"].append(run_in_subprocess(spec))
+
+    print_report(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressions = compare(results, json.load(f), args.tolerance)
+        print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+        print("\n".join(lines) if lines else "  no changes beyond tolerance")
+        if regressions and args.fail_on_regression:
+            sys.exit(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
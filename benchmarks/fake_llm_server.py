@@ -0,0 +1,246 @@
+"""Local stand-in for the OpenAI chat-completions and Ollama chat APIs, for exercising the AI path offline.
+
+It answers the generator's prompts (one row, or a batched JSON array from --ai_batch_size) with JSON that
+passes the generator's per-table validation, echoing the VM, host, cluster and datastore names it was given.
+Latency, jitter and failures can be injected to benchmark --ai_concurrency, --ai_batch_size, --ai_cache and
+the circuit breaker. GET /stats returns request counts and the peak number of requests in flight.
+
+Usage: python benchmarks/fake_llm_server.py [--port 8765] [--latency 0.2] [--jitter 0.05] [--error_rate 0.05] [--bad_json_rate 0]
+Then:  OPENAI_API_KEY=dummy python rvtools_data_generator.py --use_ai --ai_provider openai --ai_base_url http://127.0.0.1:8765/v1 ...
+  or:  python rvtools_data_generator.py --use_ai --ai_provider ollama --ai_base_url http://127.0.0.1:8765 ...
+Use a separate --ai_cache directory (or none) so stand-in answers do not mix with real ones.
+"""
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TABLE_PATTERN = re.compile(r"\b(vInfo|vHost|vDisk|vNetwork|vCluster|vDatastore)\b")
+REQUEST_LINE = re.compile(r"^Request \d+: (\{.*\})$", re.MULTILINE)
+# Single-row prompt lines (from the generator's templates) and the prompt value each one carries
+PROMPT_LABELS = {
+    "Desired VM Name": "vm_name_hint", "Desired Host Name": "host_name_hint",
+    "- VM Name": "vm_name", "- VM Powerstate": "power_state", "- Associated Datastore": "datastore_name",
+    "- Disk Label": "disk_label", "- Disk Index": "disk_index", "- Disk Capacity (MiB)": "profile_disk_capacity_mib",
+    "- Network Adapter Label": "nic_label", "- Suggested Network Name": "network_name_hint", "- Suggested Adapter Type": "adapter_type_hint",
+    "- Cluster Name": "cluster_name", "- Datacenter Name": "datacenter_name",
+    "- Datastore Name": "datastore_name", "- Datastore Type": "datastore_type_hint", "- Is Local Datastore?": "is_local_ds",
+}
+GUEST_OSES = ["Microsoft Windows Server 2019 (64-bit)", "Microsoft Windows Server 2022 (64-bit)", "Ubuntu Linux (64-bit)", "Red Hat Enterprise Linux 8 (64-bit)"]
+CPU_MODELS = ["Intel(R) Xeon(R) Gold 6248R CPU @ 3.00GHz", "AMD EPYC 7543 32-Core Processor", "Intel(R) Xeon(R) Platinum 8380 CPU @ 2.30GHz"]
+
+
+def prompt_requests(text):
+    """(table, [values per requested row]) for the text of a generator prompt."""
+    match = TABLE_PATTERN.search(text)
+    table = match.group(1) if match else "vInfo"
+    batched = [json.loads(line) for line in REQUEST_LINE.findall(text)]
+    if batched:
+        return table, [_with_placement(values) for values in batched]
+    values = {}
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("{"): # The placement JSON filling vInfo/vHost {context}
+            try:
+                values.update(json.loads(stripped))
+            except ValueError:
+                pass
+        for label, name in PROMPT_LABELS.items():
+            if stripped.startswith(label) and ": " in stripped:
+                values[name] = stripped.rsplit(": ", 1)[1]
+    return table, [values]
+
+
+def _with_placement(values):
+    if isinstance(values.get("context"), str):
+        try:
+            return {**json.loads(values["context"]), **values}
+        except ValueError:
+            pass
+    return values
+
+
+def fake_row(table, values, rng):
+    """A row answer for table that passes the generator's validation, naming the entities in values."""
+    vm_name = values.get("vm_name_hint") or values.get("vm_name") or f"vm-{rng.randrange(10000):04d}"
+    if table == "vInfo":
+        powered_on = rng.random() < 0.85
+        provisioned = rng.choice([40960, 81920, 102400, 204800])
+        return {"VM Name": vm_name, "Powerstate": "poweredOn" if powered_on else "poweredOff",
+                "OS according to VMWare": rng.choice(GUEST_OSES),
+                "DNS Name": f"{vm_name}.corp.local" if powered_on else "", "IP Address": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}" if powered_on else "",
+                "vCPU": rng.choice([1, 2, 4, 8]), "Memory MB": rng.choice([2048, 4096, 8192, 16384]),
+                "Provisioned MB": provisioned, "In Use MB": int(provisioned * rng.uniform(0.2, 0.8)) if powered_on else 0,
+                "Annotation": rng.choice(["", "Web tier, staging", "Database server, do not power off", "Build agent"])}
+    if table == "vHost":
+        sockets, cores_per_socket = rng.choice([1, 2]), rng.choice([8, 16, 24])
+        return {"Name": values.get("host_name_hint", "esx01"), "Cluster": values.get("cluster_name", "Cluster"), "Datacenter": values.get("datacenter_name", "Datacenter"),
+                "CPUMhz": sockets * cores_per_socket * 2600, "CPU Model": rng.choice(CPU_MODELS), "CPU Sockets": sockets,
+                "CPU Cores": sockets * cores_per_socket, "MEM Size": rng.choice([262144, 524288, 786432]),
+                "ESXi Version": "VMware ESXi 7.0.3 build-21930508", "Vendor": "Dell Inc.", "Model": "PowerEdge R750"}
+    if table == "vDisk":
+        datastore, disk_index = values.get("datastore_name", "datastore1"), values.get("disk_index", 0)
+        return {"Disk": values.get("disk_label", "Hard disk 1"), "Capacity MB": rng.choice([20480, 51200, 102400, 204800]),
+                "Thin": rng.choice(["true", "false"]), "Disk Mode": "persistent", "Controller": "SCSI controller 0",
+                "Path": f"[{datastore}] {vm_name}/{vm_name}_{disk_index}.vmdk"}
+    if table == "vNetwork":
+        return {"Network adapter": values.get("nic_label", "Network adapter 1"), "Adapter Type": values.get("adapter_type_hint", "VMXNET3"),
+                "MAC Address": "00:50:56:" + ":".join(f"{rng.randrange(256):02x}" for _ in range(3)),
+                "Connected": "true", "Status": "OK", "Network Label": values.get("network_name_hint", "VM Network"),
+                "IP Address": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"}
+    if table == "vCluster":
+        return {"Name": values.get("cluster_name", "Cluster"), "HA enabled": "true", "DRS enabled": rng.choice(["true", "false"]),
+                "DRS default VM behavior": "fullyAutomated", "EVC mode": "intel-cascadelake"}
+    return {"Name": values.get("datastore_name", "datastore1"), "Type": values.get("datastore_type_hint", "VMFS"),
+            "Capacity MB": rng.choice([1048576, 2097152, 4194304]), "Accessible": "true"}
+
+
+class FakeLlmServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the injection settings and request counters."""
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, bad_json_rate=0.0, seed=None):
+        super().__init__(address, FakeLlmHandler)
+        self.latency, self.jitter = latency, jitter
+        self.error_rate, self.bad_json_rate = error_rate, bad_json_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rows": 0, "errors": 0, "bad_json": 0, "in_flight": 0, "peak_in_flight": 0}
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def draw(self):
+        """(delay, outcome, row rng) for one request, drawn under the lock."""
+        with self.lock:
+            delay = max(0.0, self.rng.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            roll = self.rng.random()
+            outcome = "error" if roll < self.error_rate else "bad_json" if roll < self.error_rate + self.bad_json_rate else "ok"
+            return delay, outcome, random.Random(self.rng.getrandbits(64))
+
+    def count(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+
+
+class FakeLlmHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, as the real providers allow
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "fake_llm_server"}]})
+        elif self.path.rstrip("/") == "/api/tags":
+            self._send_json(200, {"models": [{"name": "llama3", "model": "llama3"}]})
+        elif self.path.rstrip("/") == "/stats":
+            with self.server.lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        api = "openai" if self.path.rstrip("/") in ("/v1/chat/completions", "/chat/completions") else "ollama" if self.path.rstrip("/") == "/api/chat" else None
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if api is None:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        self.server.count(requests=1, in_flight=1)
+        try:
+            delay, outcome, rng = self.server.draw()
+            time.sleep(delay)
+            if outcome == "error":
+                self.server.count(errors=1)
+                self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+                return
+            messages = payload.get("messages", [])
+            table, requests = prompt_requests(messages[-1].get("content", "") if messages else "")
+            rows = [fake_row(table, values, rng) for values in requests]
+            self.server.count(rows=len(rows))
+            if outcome == "bad_json":
+                self.server.count(bad_json=1)
+                content = "Sure! Here is the data you asked for."
+            else:
+                content = json.dumps(rows if REQUEST_LINE.search(messages[-1].get("content", "")) else rows[0])
+            self._reply(api, payload, content)
+        finally:
+            self.server.count(in_flight=-1)
+
+    def _reply(self, api, payload, content):
+        model = payload.get("model", "fake-model")
+        if api == "openai":
+            if payload.get("stream"):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+                events = [{**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": content}, "finish_reason": None}]},
+                          {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}]
+                self._send_lines("text/event-stream", [f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"])
+                return
+            self._send_json(200, {"id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                                  "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                                  "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}})
+            return
+        created_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        message = {"model": model, "created_at": created_at, "message": {"role": "assistant", "content": content}, "done": True, "done_reason": "stop"}
+        if payload.get("stream", True): # Ollama streams unless told not to
+            self._send_lines("application/x-ndjson", [json.dumps({**message, "done": False}) + "\n",
+                                                      json.dumps({**message, "message": {"role": "assistant", "content": ""}}) + "\n"])
+        else:
+            self._send_json(200, message)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_lines(self, content_type, lines):
+        data = "".join(lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(host="127.0.0.1", port=0, **settings):
+    """Starts a FakeLlmServer on a daemon thread (port 0 picks a free port); call shutdown() when done."""
+    server = FakeLlmServer((host, port), **settings)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, name="fake-llm-server", daemon=True).start()
+    return server
+
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean seconds before each response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the latency, in seconds.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--bad_json_rate", type=float, default=0.0, help="Fraction of requests answered with text that is not JSON.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(args_list)
+
+    server = FakeLlmServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, bad_json_rate=args.bad_json_rate, seed=args.seed)
+    print(f"Serving OpenAI ({server.url}/v1) and Ollama ({server.url}) stand-ins; Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats))
+
+
+if __name__ == "__main__":
+    main()
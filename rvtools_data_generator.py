@@ -1,61 +1,117 @@
 # ASCII Art Logo Placeholder - Will be added in a later step
 
 import csv
+import io
 import os
 import random
 import string
 import datetime
-import uuid
 import ipaddress
 import time
 import zipfile
+import xml.sax.saxutils
 import threading
 import argparse
+import asyncio # Concurrent AI calls (--ai_concurrency)
+import collections
+import contextlib
+import cProfile # --profile_dir
 import json # For AI prompt context and parsing responses
+import hashlib # Per-table checksums for the export manifest
+import importlib
+import importlib.util
+import functools
+import itertools
+import operator
+import pickle
+import re
+import shutil
+import sqlite3 # --ai_cache response store
+import struct
+import tempfile
+import tracemalloc # --profile peak memory per stage
+import types
+import zlib # --save_env snapshots
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import sys # Added for main() refactor
-
-# Attempt to import GUI and AI libraries, but make them optional
 try:
-    import tkinter as tk
-    from tkinter import filedialog, messagebox, ttk
-    GUI_AVAILABLE = True
+    import resource # Worker CPU time and peak RSS for --profile; Unix only
 except ImportError:
-    GUI_AVAILABLE = False
+    resource = None
 
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+# Optional GUI, AI and speed-up libraries. Availability is checked without importing them (LangChain alone
+# takes seconds to import); each is imported the first time the feature that needs it is used.
+def _module_available(*names):
+    """True if every named top-level module is installed; nothing is imported."""
+    return all(importlib.util.find_spec(name) is not None for name in names)
 
-try:
-    import yaml
-    YAML_AVAILABLE = True
-except ImportError:
-    YAML_AVAILABLE = False
+class _LazyModule:
+    """Stands in for an optional module and imports it on first attribute access."""
 
-try:
-    from tqdm import tqdm
-    TQDM_AVAILABLE = True
-except ImportError:
-    TQDM_AVAILABLE = False
+    def __init__(self, name):
+        self._name = name
 
-try:
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value) # Later lookups are plain instance attributes
+        return value
+
+GUI_AVAILABLE = _module_available("tkinter", "_tkinter")
+
+OPENAI_AVAILABLE = _module_available("openai")
+
+YAML_AVAILABLE = _module_available("yaml")
+yaml = _LazyModule("yaml")
+
+TQDM_AVAILABLE = _module_available("tqdm")
+
+def tqdm(*args, **kwargs):
+    from tqdm import tqdm as progress_bar
+    return progress_bar(*args, **kwargs)
+
+NUMPY_AVAILABLE = _module_available("numpy")
+np = _LazyModule("numpy")
+
+# None until langchain_ready() / langchain_ollama_ready() first try the real imports. find_spec alone is not
+# enough: an installed package can lack a submodule used here (langchain 1.x has no langchain.prompts).
+LANGCHAIN_AVAILABLE = None
+LANGCHAIN_OLLAMA_AVAILABLE = None # Separate flag for Ollama parts
+
+@functools.lru_cache(maxsize=None)
+def _langchain():
+    """The LangChain classes the AI dispatcher uses, imported on first use."""
     from langchain_openai import ChatOpenAI
     from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
     from langchain_core.output_parsers import JsonOutputParser
-    from langchain_core.exceptions import OutputParserException # For error handling
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
-    # print("Langchain or langchain_openai not found. Real AI calls via LangChain will be disabled.")
+    return types.SimpleNamespace(ChatOpenAI=ChatOpenAI, ChatPromptTemplate=ChatPromptTemplate, SystemMessagePromptTemplate=SystemMessagePromptTemplate,
+                                 HumanMessagePromptTemplate=HumanMessagePromptTemplate, JsonOutputParser=JsonOutputParser)
 
-try:
-    from langchain_community.chat_models import ChatOllama # For Ollama
-    LANGCHAIN_OLLAMA_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_OLLAMA_AVAILABLE = False # Separate flag for Ollama parts
-    # print("langchain_community.chat_models not found. Ollama support via LangChain will be disabled.")
+def langchain_ready():
+    """True if the LangChain classes _langchain() returns import; resolved once per process."""
+    global LANGCHAIN_AVAILABLE
+    if LANGCHAIN_AVAILABLE is None:
+        try:
+            _langchain()
+            LANGCHAIN_AVAILABLE = True
+        except ImportError:
+            LANGCHAIN_AVAILABLE = False
+    return LANGCHAIN_AVAILABLE
+
+def langchain_ollama_ready():
+    """True if ChatOllama imports; resolved once per process."""
+    global LANGCHAIN_OLLAMA_AVAILABLE
+    if LANGCHAIN_OLLAMA_AVAILABLE is None:
+        try:
+            from langchain_community.chat_models import ChatOllama # noqa: F401
+            LANGCHAIN_OLLAMA_AVAILABLE = True
+        except ImportError:
+            LANGCHAIN_OLLAMA_AVAILABLE = False
+    return LANGCHAIN_OLLAMA_AVAILABLE
+
+def _is_output_parser_error(error):
+    exceptions = sys.modules.get("langchain_core.exceptions") # Loaded once a chain has been built
+    return exceptions is not None and isinstance(error, exceptions.OutputParserException)
 
 # --- Global Configuration & Constants ---
 LOGO = """
@@ -104,6 +160,8 @@ DEFAULT_OUTPUT_DIR = "RV_TOOL_ZIP_OUTPUT"
 DEFAULT_CSV_SUBDIR = "RVT_CSV"
 DEFAULT_ZIP_FILENAME = "RVTools_export_{timestamp}.zip"
 SCENARIO_EXAMPLE_FILENAME = "sample_config.yaml"
+MANIFEST_FILENAME = "manifest.json"
+SEEDED_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0) # Entry timestamp used with --seed so archives are byte-identical
 
 # --- Global Environment Data Store ---
 ENVIRONMENT_DATA = {
@@ -111,9 +169,222 @@ ENVIRONMENT_DATA = {
     "resource_pools": [], "datacenters": [], "folders": [], "dvSwitches": [],
     "vswitches": [], # For standard vSwitches primarily
     "sdk_server_map": {}, # To store SDK server name and its UUID
+    "vm_plan": [], # (count, segment) VM deployment plan of the last vInfo run, for --series
     "config": {} # To store parsed CLI args and complexity params
 }
 
+# --- Topology Store (hash indexes over ENVIRONMENT_DATA) ---
+# Compound identity keys; every other entity kind is keyed by its "name".
+_TOPOLOGY_KEY_FUNCS = {
+    "folders": lambda rec: (rec.get("name"), rec.get("datacenter")),
+    "vswitches": lambda rec: (rec.get("name"), rec.get("host")),
+}
+
+# Secondary (one-to-many) indexes per entity kind. A key func returning None skips the record.
+_TOPOLOGY_GROUP_FUNCS = {
+    "vms": {
+        "host": lambda rec: rec.get("host"),
+        "cluster": lambda rec: rec.get("cluster"),
+        "datacenter": lambda rec: rec.get("datacenter"),
+    },
+    "hosts": {
+        "cluster": lambda rec: rec.get("cluster"),
+        "datacenter": lambda rec: rec.get("datacenter"),
+    },
+    "clusters": {"datacenter": lambda rec: rec.get("datacenter")},
+    "datastores": {
+        "datacenter": lambda rec: rec.get("datacenter"),
+        "shared_datacenter": lambda rec: None if rec.get("is_local") else rec.get("datacenter"),
+    },
+    "networks": {"datacenter": lambda rec: rec.get("datacenter")},
+    "resource_pools": {"cluster": lambda rec: rec.get("cluster")},
+    "folders": {"datacenter": lambda rec: rec.get("datacenter")},
+}
+
+# Parent child-lists kept current by TopologyStore.add(): kind -> [(record field, parent kind, parent list)]
+_TOPOLOGY_PARENT_LINKS = {
+    "vms": [("host", "hosts", "vms_on_host"), ("cluster", "clusters", "vms"), ("datacenter", "datacenters", "vms")],
+    "hosts": [("cluster", "clusters", "hosts"), ("datacenter", "datacenters", "hosts")],
+    "clusters": [("datacenter", "datacenters", "clusters")],
+    "datastores": [("datacenter", "datacenters", "datastores")],
+    "networks": [("datacenter", "datacenters", "networks")],
+    "resource_pools": [("cluster", "clusters", "resource_pools")],
+}
+
+
+class TopologyStore:
+    """Name/host/cluster/datacenter hash indexes over the ENVIRONMENT_DATA entity lists.
+
+    Entities added through add()/add_if_absent() are indexed immediately and appended to
+    their parents' child lists (host "vms_on_host", cluster "hosts", ...). Records that older
+    code or tests append to (or swap into) ENVIRONMENT_DATA directly are picked up lazily on the
+    next lookup, so the lists stay the single source of truth. Inside read_only() the calling
+    thread may look records up but not add them.
+    """
+
+    def __init__(self, env_data):
+        self.env = env_data
+        self._lock = threading.RLock()
+        self._read_only = threading.local()
+        self._synced = {} # kind -> (list object, number of records indexed)
+        self._by_key = {}
+        self._groups = {}
+        self._substring_cache = {}
+
+    def _reset(self, kind, records):
+        self._synced[kind] = (records, 0)
+        self._by_key[kind] = {}
+        self._groups[kind] = {field: {} for field in _TOPOLOGY_GROUP_FUNCS.get(kind, {})}
+        self._substring_cache.pop(kind, None)
+
+    def _index(self, kind, rec):
+        key = _TOPOLOGY_KEY_FUNCS.get(kind, lambda r: r.get("name"))(rec)
+        self._by_key[kind].setdefault(key, rec) # First record wins, like the old next()/any() scans
+        for field, key_func in _TOPOLOGY_GROUP_FUNCS.get(kind, {}).items():
+            group_key = key_func(rec)
+            if group_key is not None:
+                self._groups[kind][field].setdefault(group_key, []).append(rec)
+        self._substring_cache.pop(kind, None)
+
+    def _sync(self, kind):
+        records = self.env.setdefault(kind, [])
+        tracked, count = self._synced.get(kind, (None, 0))
+        if tracked is not records or len(records) < count: # List swapped out or cleared
+            self._reset(kind, records)
+            count = 0
+        if len(records) > count:
+            for rec in records[count:]:
+                self._index(kind, rec)
+            self._synced[kind] = (records, len(records))
+
+    def _check_writable(self, kind):
+        if getattr(self._read_only, "task", None):
+            raise RuntimeError(f"{self._read_only.task} tried to add to ENVIRONMENT_DATA['{kind}'], but it declares no outputs")
+
+    @contextlib.contextmanager
+    def read_only(self, task_name):
+        """Makes add()/add_all_if_absent() raise in this thread for the block (tasks declaring no outputs).
+
+        Records themselves are not frozen: row generators must not write into them, which is why every
+        field they emit (UUIDs included) is filled in when the topology is built.
+        """
+        previous = getattr(self._read_only, "task", None)
+        self._read_only.task = task_name
+        try:
+            yield
+        finally:
+            self._read_only.task = previous
+
+    def add(self, kind, rec):
+        """Appends rec to ENVIRONMENT_DATA[kind], indexes it and links it into its parents."""
+        self._check_writable(kind)
+        with self._lock:
+            self._sync(kind)
+            self.env[kind].append(rec)
+            self._index(kind, rec)
+            self._synced[kind] = (self.env[kind], len(self.env[kind]))
+            for field, parent_kind, child_list in _TOPOLOGY_PARENT_LINKS.get(kind, []):
+                parent = self.find(parent_kind, rec.get(field))
+                if parent is not None:
+                    parent.setdefault(child_list, []).append(rec.get("name"))
+            return rec
+
+    def add_if_absent(self, kind, rec):
+        """Adds rec unless an entity with the same identity key exists; returns the stored record."""
+        with self._lock:
+            key = _TOPOLOGY_KEY_FUNCS.get(kind, lambda r: r.get("name"))(rec)
+            existing = self.find(kind, key)
+            return existing if existing is not None else self.add(kind, rec)
+
+    def add_all_if_absent(self, kind, records):
+        """add_if_absent() for a batch of records, syncing the kind once."""
+        self._check_writable(kind)
+        with self._lock:
+            self._sync(kind)
+            key_func = _TOPOLOGY_KEY_FUNCS.get(kind, lambda r: r.get("name"))
+            group_funcs = _TOPOLOGY_GROUP_FUNCS.get(kind, {}).items()
+            by_key, groups, stored = self._by_key[kind], self._groups[kind], self.env[kind]
+            for rec in records:
+                key = key_func(rec)
+                if key in by_key:
+                    continue
+                stored.append(rec)
+                by_key[key] = rec # Same bookkeeping as _index(), without its per-record lookups
+                for field, group_func in group_funcs:
+                    group_key = group_func(rec)
+                    if group_key is not None:
+                        groups[field].setdefault(group_key, []).append(rec)
+                for field, parent_kind, child_list in _TOPOLOGY_PARENT_LINKS.get(kind, []):
+                    parent = self.find(parent_kind, rec.get(field))
+                    if parent is not None:
+                        parent.setdefault(child_list, []).append(rec.get("name"))
+            self._synced[kind] = (stored, len(stored))
+            self._substring_cache.pop(kind, None)
+
+    def discard(self, kind, records):
+        """Removes records (matched by identity) from ENVIRONMENT_DATA[kind] and from their parents' child lists."""
+        self._check_writable(kind)
+        with self._lock:
+            unlinks = {} # id(parent list) -> (list, Counter of names to drop)
+            for rec in records:
+                for field, parent_kind, child_list in _TOPOLOGY_PARENT_LINKS.get(kind, []):
+                    parent = self.find(parent_kind, rec.get(field))
+                    if parent is not None and child_list in parent:
+                        unlinks.setdefault(id(parent[child_list]), (parent[child_list], collections.Counter()))[1][rec.get("name")] += 1
+            for names, drop in unlinks.values():
+                kept = []
+                for name in names:
+                    if drop[name] > 0:
+                        drop[name] -= 1
+                    else:
+                        kept.append(name)
+                names[:] = kept
+            doomed = {id(rec) for rec in records}
+            self.env[kind] = [rec for rec in self.env.get(kind, []) if id(rec) not in doomed] # New list: re-indexed on the next lookup
+
+    def find(self, kind, key):
+        """Returns the record for key (a name, or a (name, datacenter/host) tuple for folders/vswitches)."""
+        with self._lock:
+            self._sync(kind)
+            return self._by_key[kind].get(key)
+
+    def members(self, kind, field, value):
+        """Returns the records of kind whose group field equals value (e.g. vms on a host)."""
+        with self._lock:
+            self._sync(kind)
+            return self._groups[kind].get(field, {}).get(value, [])
+
+    def count(self, kind, field, value):
+        return len(self.members(kind, field, value))
+
+    @contextlib.contextmanager
+    def scratch_copy(self, env_snapshot):
+        """Swaps env_snapshot's lists in for the block, then restores the original lists and their indexes."""
+        with self._lock:
+            saved_env = dict(self.env)
+            saved_indexes = (dict(self._synced), dict(self._by_key), dict(self._groups), dict(self._substring_cache))
+            self.env.clear()
+            self.env.update(env_snapshot)
+            try:
+                yield self.env
+            finally:
+                self.env.clear()
+                self.env.update(saved_env)
+                self._synced, self._by_key, self._groups, self._substring_cache = saved_indexes
+
+    def names_containing(self, kind, substring):
+        """Names of kind containing substring (case-insensitive); cached until kind changes."""
+        with self._lock:
+            self._sync(kind)
+            cache = self._substring_cache.setdefault(kind, {})
+            needle = substring.lower()
+            if needle not in cache:
+                cache[needle] = [rec["name"] for rec in self.env[kind] if needle in rec["name"].lower()]
+            return cache[needle]
+
+
+TOPOLOGY = TopologyStore(ENVIRONMENT_DATA)
+
 # --- AI Prompt Templates ---
 VINFO_AI_PROMPT_TEMPLATE = """
 Generate realistic VMware vInfo data for a VM based on the provided context.
@@ -331,48 +602,216 @@ def _get_vdatastore_column_descriptions_for_prompt():
 - 'Accessible': boolean (true/false)
 """
 
+# --- Random Streams (--seed) ---
+# Every generator draws from current_rng(). Tables, shards and VMs each get their own stream derived
+# from the run seed and a key, so what one of them produces never depends on thread scheduling,
+# worker count or what ran before it.
+_RUN_SEED = None
+_RNG_LOCAL = threading.local()
+_DEFAULT_RNG = random.Random()
+
+def derive_seed(*key):
+    """Derives a 64-bit stream seed from the run seed and a key such as ("table", "vDisk")."""
+    digest = hashlib.sha256(repr((_RUN_SEED,) + key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def set_run_seed(seed=None):
+    """Sets the seed all streams derive from; None draws a fresh one from the OS. Returns it."""
+    global _RUN_SEED
+    _RUN_SEED = seed if seed is not None else random.SystemRandom().getrandbits(64)
+    _DEFAULT_RNG.seed(derive_seed("main"))
+    _RNG_LOCAL.sampler = None # Drop entropy pooled under the old seed
+    return _RUN_SEED
+
+def rng_stream(*key):
+    return random.Random(derive_seed(*key))
+
+def current_rng():
+    """The stream bound to this thread by use_rng_stream(), else the run's main stream."""
+    return getattr(_RNG_LOCAL, "rng", None) or _DEFAULT_RNG
+
+@contextlib.contextmanager
+def bind_rng(rng):
+    """Routes this thread's random draws to rng for the duration of the block; None leaves them as they are."""
+    if rng is None:
+        yield current_rng()
+        return
+    previous = getattr(_RNG_LOCAL, "rng", None), getattr(_RNG_LOCAL, "sampler", None)
+    _RNG_LOCAL.rng = rng
+    try:
+        yield rng
+    finally:
+        _RNG_LOCAL.rng, _RNG_LOCAL.sampler = previous
+
+def use_rng_stream(*key):
+    """Routes this thread's random draws to the stream for key for the duration of the block."""
+    return bind_rng(rng_stream(*key))
+
+set_run_seed()
+
+# --- Primitive Samplers ---
+# The generate_* helpers below run several times per row. Subnets, date bounds and formatters are parsed
+# once and cached, and PrimitiveSampler serves IPs, MACs, UUIDs and dates in batches from a pool of random
+# bytes refilled from the current stream with a single getrandbits() call.
+ENTROPY_POOL_BYTES = 512
+DEFAULT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+_EPOCH = datetime.datetime(1970, 1, 1)
+_UUID_V4_BITS = (0x4 << 76) | (0x2 << 62) # Version 4, RFC 4122 variant
+_UUID_KEEP_BITS = ((1 << 128) - 1) ^ (0xF << 76) ^ (0x3 << 62)
+
+@functools.lru_cache(maxsize=256)
+def parse_subnet(subnet_str):
+    """(network address as int, number of addresses, IP version) for a subnet string, or None if it is invalid."""
+    try:
+        subnet = ipaddress.ip_network(subnet_str, strict=False)
+    except ValueError:
+        return None
+    return int(subnet.network_address), subnet.num_addresses, subnet.version
+
+def format_ip(address, version=4):
+    if version == 4:
+        return f"{address >> 24}.{(address >> 16) & 0xFF}.{(address >> 8) & 0xFF}.{address & 0xFF}"
+    return str(ipaddress.IPv6Address(address))
+
+def format_uuids(hexed, prefix=""):
+    """Splits a hex string of whole 16-byte UUIDs into dashed UUID strings."""
+    return [f"{prefix}{hexed[i:i + 8]}-{hexed[i + 8:i + 12]}-{hexed[i + 12:i + 16]}-{hexed[i + 16:i + 20]}-{hexed[i + 20:i + 32]}"
+            for i in range(0, len(hexed), 32)]
+
+def format_macs(hexed):
+    """Splits a hex string of 3-byte NIC suffixes into MACs under the VMware 00:50:56 OUI."""
+    return [f"00:50:56:{hexed[i:i + 2]}:{hexed[i + 2:i + 4]}:{hexed[i + 4:i + 6]}" for i in range(0, len(hexed), 6)]
+
+@functools.lru_cache(maxsize=64)
+def epoch_bounds(start_date_str, end_date_str):
+    """(start, span) in epoch seconds covering every second from the start day to the end of the end day."""
+    start = datetime.datetime.strptime(start_date_str, "%Y-%m-%d")
+    end = datetime.datetime.strptime(end_date_str, "%Y-%m-%d")
+    return int((start - _EPOCH).total_seconds()), ((end - start).days + 1) * 86400
+
+@functools.lru_cache(maxsize=4096)
+def _day_string(day):
+    return (_EPOCH + datetime.timedelta(days=day)).strftime("%Y-%m-%d")
+
+def _format_default_date(seconds):
+    day, second = divmod(seconds, 86400)
+    hour, second = divmod(second, 3600)
+    minute, second = divmod(second, 60)
+    return f"{_day_string(day)} {hour:02d}:{minute:02d}:{second:02d}"
+
+@functools.lru_cache(maxsize=32)
+def date_formatter(date_format=DEFAULT_DATE_FORMAT):
+    """Epoch seconds -> string in date_format; the default format skips strftime."""
+    if date_format == DEFAULT_DATE_FORMAT:
+        return _format_default_date
+    return lambda seconds: (_EPOCH + datetime.timedelta(seconds=seconds)).strftime(date_format)
+
+class PrimitiveSampler:
+    """Batch samplers for the primitive generators, drawing from one random stream."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self._pool = b""
+        self._pos = 0
+
+    def take(self, nbytes):
+        """The next nbytes of the entropy pool, refilling it from the stream when it runs low."""
+        pos = self._pos
+        if pos + nbytes > len(self._pool):
+            size = max(nbytes, ENTROPY_POOL_BYTES)
+            self._pool = self._pool[pos:] + self.rng.getrandbits(8 * size).to_bytes(size, "big")
+            pos = 0
+        self._pos = pos + nbytes
+        return self._pool[pos:pos + nbytes]
+
+    def below(self, n, span):
+        """n ints uniform in [0, span), one 64-bit pool word each (modulo bias under span / 2**64)."""
+        if span <= 0:
+            raise ValueError(f"empty range for below(): {span}")
+        if span >= 1 << 32: # IPv6-sized ranges: draw exactly rather than take the bias
+            return [self.rng.randrange(span) for _ in range(n)]
+        return [word % span for word in struct.unpack(f">{n}Q", self.take(8 * n))]
+
+    def ips(self, n, subnet_str="192.168.1.0/24"):
+        """n host addresses from the subnet, excluding its network and broadcast addresses."""
+        parsed = parse_subnet(subnet_str)
+        if parsed is None:
+            return ["10.0.0.1"] * n # Fallback
+        base, num_addresses, version = parsed
+        if num_addresses <= 2:
+            return [format_ip(base, version)] * n
+        return [format_ip(base + 1 + offset, version) for offset in self.below(n, num_addresses - 2)]
+
+    def macs(self, n):
+        return format_macs(self.take(3 * n).hex())
+
+    def uuids(self, n, prefix=""):
+        """n random (version 4) UUID strings."""
+        raw = bytearray(self.take(16 * n))
+        raw[6::16] = bytes(b & 0x0F | 0x40 for b in raw[6::16]) # Version 4
+        raw[8::16] = bytes(b & 0x3F | 0x80 for b in raw[8::16]) # RFC 4122 variant
+        return format_uuids(raw.hex(), prefix)
+
+    def uuid(self, prefix=""):
+        """One UUID, skipping the batch path's list handling (generate_uuid runs several times per row)."""
+        hexed = f"{int.from_bytes(self.take(16), 'big') & _UUID_KEEP_BITS | _UUID_V4_BITS:032x}"
+        return f"{prefix}{hexed[:8]}-{hexed[8:12]}-{hexed[12:16]}-{hexed[16:20]}-{hexed[20:]}"
+
+    def dates(self, n, start_date_str="2020-01-01", end_date_str="2024-01-01", date_format=DEFAULT_DATE_FORMAT):
+        """n timestamps, each a uniformly random second from the start day to the end of the end day."""
+        start, span = epoch_bounds(start_date_str, end_date_str)
+        formatter = date_formatter(date_format)
+        return [formatter(start + offset) for offset in self.below(n, span)]
+
+    def strings(self, n, length, chars=string.ascii_letters + string.digits):
+        flat = "".join(self.rng.choices(chars, k=n * length))
+        return [flat[i:i + length] for i in range(0, n * length, length)] if length else [""] * n
+
+def current_sampler():
+    """The PrimitiveSampler for current_rng(), created on first use and kept until the stream changes."""
+    rng = current_rng()
+    sampler = getattr(_RNG_LOCAL, "sampler", None)
+    if sampler is None or sampler.rng is not rng:
+        sampler = _RNG_LOCAL.sampler = PrimitiveSampler(rng)
+    return sampler
+
 # --- Utility Functions ---
 def generate_random_string(length=10, prefix="", suffix="", chars=string.ascii_letters + string.digits):
-    return f"{prefix}{''.join(random.choice(chars) for _ in range(length))}{suffix}"
+    return f"{prefix}{current_sampler().strings(1, length, chars)[0]}{suffix}"
 
 def generate_random_integer(min_val=0, max_val=100):
-    return random.randint(min_val, max_val)
+    return current_rng().randint(min_val, max_val)
 
 def generate_random_float(min_val=0.0, max_val=100.0, precision=2):
-    return round(random.uniform(min_val, max_val), precision)
+    return round(current_rng().uniform(min_val, max_val), precision)
 
 def generate_random_boolean(true_probability=0.5):
-    return random.random() < true_probability
+    return current_rng().random() < true_probability
 
-def generate_random_date(start_date_str="2020-01-01", end_date_str="2024-01-01", date_format="%Y-%m-%d %H:%M:%S"):
-    start_date = datetime.datetime.strptime(start_date_str, "%Y-%m-%d")
-    end_date = datetime.datetime.strptime(end_date_str, "%Y-%m-%d")
-    time_diff = end_date - start_date
-    random_days = random.randrange(time_diff.days + 1)
-    random_seconds = random.randrange(86400)
-    return (start_date + datetime.timedelta(days=random_days, seconds=random_seconds)).strftime(date_format)
+def generate_random_date(start_date_str="2020-01-01", end_date_str="2024-01-01", date_format=DEFAULT_DATE_FORMAT):
+    return current_sampler().dates(1, start_date_str, end_date_str, date_format)[0]
 
 def generate_uuid(prefix=""):
-    return f"{prefix}{str(uuid.uuid4())}"
+    return current_sampler().uuid(prefix)
 
 def generate_mac_address():
-    return "00:50:56:%02x:%02x:%02x" % (random.randint(0, 0xff), random.randint(0, 0xff), random.randint(0, 0xff))
+    return current_sampler().macs(1)[0]
 
 def generate_ip_address(subnet_str="192.168.1.0/24"):
-    try:
-        subnet = ipaddress.ip_network(subnet_str, strict=False)
-        if subnet.num_addresses <= 2: return str(subnet.network_address)
-        return str(subnet.network_address + random.randint(1, subnet.num_addresses - 2))
-    except ValueError: return "10.0.0.1" # Fallback
+    return current_sampler().ips(1, subnet_str)[0]
 
 def generate_dns_name(base_name="example.com", prefix_len=5):
     return f"{generate_random_string(prefix_len, chars=string.ascii_lowercase + string.digits)}-{base_name}"
 
-def generate_os_name(profile_os_hints=None):
-    base_os_list = ["Windows Server 2022", "Windows Server 2019", "Ubuntu Linux (64-bit)", "CentOS Linux (64-bit)", "Red Hat Enterprise Linux 8", "VMware ESXi 7.0"]
+BASE_OS_LIST = ["Windows Server 2022", "Windows Server 2019", "Ubuntu Linux (64-bit)", "CentOS Linux (64-bit)", "Red Hat Enterprise Linux 8", "VMware ESXi 7.0"]
+
+def os_name_options(profile_os_hints=None):
     if profile_os_hints and isinstance(profile_os_hints, list) and len(profile_os_hints) > 0:
-        return random.choice(profile_os_hints + base_os_list) # Mix profile hints with base
-    return random.choice(base_os_list)
+        return profile_os_hints + BASE_OS_LIST # Mix profile hints with base
+    return BASE_OS_LIST
+
+def generate_os_name(profile_os_hints=None):
+    return current_rng().choice(os_name_options(profile_os_hints))
 
 def generate_vm_name(profile_vm_name_prefix="vm", scenario_vm_index=None):
     if scenario_vm_index is not None:
@@ -404,7 +843,7 @@ def generate_resource_pool_name(cluster_name, rp_name="DefaultRP"):
     return f"{cluster_name}/{rp_name}"
 
 def choose_randomly_from_list(data_list, default_value="N/A"):
-    return random.choice(data_list) if data_list else default_value
+    return current_rng().choice(data_list) if data_list else default_value
 
 def get_sdk_server_info(context_sdk_server_name=None, context_sdk_uuid=None):
     """Gets or creates SDK server name and UUID, ensuring consistency."""
@@ -421,6 +860,99 @@ def get_sdk_server_info(context_sdk_server_name=None, context_sdk_uuid=None):
     ENVIRONMENT_DATA["sdk_server_map"][default_sdk_server] = default_sdk_uuid
     return default_sdk_server, default_sdk_uuid
 
+# --- AI Response Cache (--ai_cache) ---
+# Validated LLM responses are kept in SQLite under the --ai_cache directory, keyed by provider, model,
+# prompt template and the normalized prompt context, so re-running a seeded scenario makes no LLM calls.
+# Entries expire after a maximum age and the least recently used ones are evicted past a size limit.
+AI_CACHE_FILENAME = "ai_responses.sqlite3"
+# Context entries that steer the dispatcher rather than the prompt; they never split cache entries
+_AI_CACHE_IGNORED_CONTEXT_KEYS = frozenset(("use_ai_cli_flag", "ai_provider_cli_arg", "ollama_model_name_cli_arg", "column_details_block"))
+_AI_CACHE = None
+_AI_CACHE_LOCK = threading.Lock()
+
+def ai_cache_key(provider, model, prompt_template, relevant_headers_key, context):
+    """SHA-256 over the provider, model, template and context (sorted keys, dispatcher flags dropped)."""
+    prompt_context = {k: v for k, v in context.items() if k not in _AI_CACHE_IGNORED_CONTEXT_KEYS}
+    payload = json.dumps([provider, model, relevant_headers_key, prompt_template, prompt_context], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AiResponseCache:
+    """SQLite store of AI responses with age expiry, LRU eviction by size and lifetime hit/miss counters.
+
+    Each thread gets its own connection and WAL mode lets worker processes share the file. Counters
+    live in the database so hits and misses in --workers processes are counted too.
+    """
+
+    def __init__(self, directory, max_bytes=256 << 20, max_age_seconds=30 * 86400):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, AI_CACHE_FILENAME)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.pid = os.getpid() # Connections must not cross a fork; get_ai_cache() reopens in children
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)", [("hits",), ("misses",)])
+            conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - max_age_seconds,))
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key):
+        """The cached response for key, or None; expired entries count as misses and are dropped."""
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.max_age_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", ("hits" if row is not None else "misses",))
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, value):
+        text = json.dumps(value, default=str)
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, text, len(text), now, now))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                victims = []
+                for victim_key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if total <= self.max_bytes: break
+                    victims.append((victim_key,))
+                    total -= size
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def stats(self):
+        """{"hits", "misses", "entries", "bytes"}; hits and misses are lifetime totals for this cache file."""
+        conn = self._connection()
+        stats = dict(conn.execute("SELECT name, value FROM counters"))
+        stats["entries"], stats["bytes"] = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return stats
+
+def get_ai_cache():
+    """The AiResponseCache for the run's --ai_cache directory, opened once per process; None when off."""
+    global _AI_CACHE
+    config = ENVIRONMENT_DATA.get("config", {})
+    directory = config.get("ai_cache")
+    if not directory:
+        return None
+    with _AI_CACHE_LOCK:
+        if _AI_CACHE is None or _AI_CACHE.directory != directory or _AI_CACHE.pid != os.getpid():
+            _AI_CACHE = AiResponseCache(directory, max_bytes=int(config.get("ai_cache_max_mb", 256) * (1 << 20)),
+                                        max_age_seconds=config.get("ai_cache_max_age_days", 30) * 86400)
+        return _AI_CACHE
+
 # --- AI Integration ---
 def _call_mock_ai(prompt_template, context, relevant_headers_key, entity_name_for_log, entity_specific_mock_func=None):
     """Simulates an AI call by using a dedicated mock data generation function."""
@@ -435,142 +967,1128 @@ def _call_mock_ai(prompt_template, context, relevant_headers_key, entity_name_fo
     return {"Annotation": f"Mock AI data for {entity_name_for_log}", "VM Name": context.get("vm_name_hint", "MockVM")}
 
 
+AI_PROVIDERS = ("openai", "ollama") # Providers reached through LangChain; "mock" never leaves the process
+AI_TABLES = ("vInfo", "vHost", "vDisk", "vNetwork", "vCluster", "vDatastore")
+_AI_SYSTEM_PROMPT = "You are an AI assistant. Your primary goal is to generate synthetic data based on user context. You MUST output a single, valid JSON object containing only the requested fields and no other text, explanations, or markdown formatting."
+_AI_BATCH_SYSTEM_PROMPT = "You are an AI assistant. Your primary goal is to generate synthetic data based on user context. You MUST output a single, valid JSON array with one object per numbered request, in request order, each containing only the requested fields, and no other text, explanations, or markdown formatting."
+
+def _ai_model_name(ai_provider, ollama_model_name_arg):
+    return ENVIRONMENT_DATA["config"].get("ai_model", "gpt-4o-mini") if ai_provider == "openai" else ollama_model_name_arg
+
+def llm_call_ready(request):
+    """True if a _get_ai_data_for_entity request (its keyword arguments) would be sent to a real provider."""
+    ai_provider = request.get("ai_provider", "mock")
+    if not (request.get("use_ai_enabled_globally") and ai_provider in AI_PROVIDERS and request["relevant_headers_key"] in AI_TABLES and langchain_ready()):
+        return False
+    return bool(os.getenv("OPENAI_API_KEY")) if ai_provider == "openai" else langchain_ollama_ready()
+
+def _new_llm_client(ai_provider, model_name):
+    base_url = ENVIRONMENT_DATA.get("config", {}).get("ai_base_url") # e.g. benchmarks/fake_llm_server.py
+    endpoint = {"base_url": base_url} if base_url else {}
+    if ai_provider == "openai":
+        return _langchain().ChatOpenAI(model_name=model_name, temperature=0.7, openai_api_key=os.getenv("OPENAI_API_KEY"), **endpoint)
+    from langchain_community.chat_models import ChatOllama
+    return ChatOllama(model=model_name, **endpoint)
+
+def _build_ai_chain(prompt_template, llm_provider):
+    """prompt | model | JSON parser, as invoked (or ainvoked) for each row."""
+    lc = _langchain()
+    system_message_prompt = lc.SystemMessagePromptTemplate.from_template(_AI_SYSTEM_PROMPT)
+    human_message_prompt = lc.HumanMessagePromptTemplate.from_template(prompt_template)
+    chat_prompt_template = lc.ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
+    return chat_prompt_template | llm_provider | lc.JsonOutputParser()
+
+def _build_ai_batch_chain(llm_provider):
+    """model | JSON parser for pre-rendered batch messages (no prompt template, so no brace escaping)."""
+    return llm_provider | _langchain().JsonOutputParser()
+
+class LlmProviderRegistry:
+    """One LangChain client per provider and model, and one compiled chain per prompt template, for the run.
+
+    Clients keep their HTTP connection pools, so rows reuse connections instead of opening new ones.
+    Safe to share between the table threads and the AI event loop.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid() # Clients hold sockets and do not survive a fork; get_llm_registry() rebuilds in children
+        self._clients = {}
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def client(self, ai_provider, model_name):
+        # The API key is part of the key so a changed OPENAI_API_KEY gets a new client
+        key = (ai_provider, model_name, os.getenv("OPENAI_API_KEY") if ai_provider == "openai" else None, ENVIRONMENT_DATA.get("config", {}).get("ai_base_url"))
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = _new_llm_client(ai_provider, model_name)
+            return self._clients[key]
+
+    def chain(self, ai_provider, model_name, prompt_template=None):
+        """The compiled chain for prompt_template, or the batch chain (model | parser) when it is None."""
+        llm_provider = self.client(ai_provider, model_name)
+        key = (id(llm_provider), prompt_template)
+        with self._lock:
+            if key not in self._chains:
+                self._chains[key] = _build_ai_chain(prompt_template, llm_provider) if prompt_template is not None else _build_ai_batch_chain(llm_provider)
+            return self._chains[key]
+
+_LLM_REGISTRY = None
+_LLM_REGISTRY_LOCK = threading.Lock()
+
+def get_llm_registry():
+    """The process's LlmProviderRegistry."""
+    global _LLM_REGISTRY
+    with _LLM_REGISTRY_LOCK:
+        if _LLM_REGISTRY is None or _LLM_REGISTRY.pid != os.getpid():
+            _LLM_REGISTRY = LlmProviderRegistry()
+        return _LLM_REGISTRY
+
+_COLUMN_DESCRIPTION_BUILDERS = {
+    "vInfo": _get_vinfo_column_descriptions_for_prompt, "vHost": _get_vhost_column_descriptions_for_prompt,
+    "vDisk": _get_vdisk_column_descriptions_for_prompt, "vNetwork": _get_vnetwork_column_descriptions_for_prompt,
+    "vCluster": _get_vcluster_column_descriptions_for_prompt, "vDatastore": _get_vdatastore_column_descriptions_for_prompt,
+}
+
+@functools.lru_cache(maxsize=None)
+def column_details_block(relevant_headers_key):
+    """The column_details_block prompt text for a table, built once per run."""
+    builder = _COLUMN_DESCRIPTION_BUILDERS.get(relevant_headers_key)
+    return builder() if builder else _get_column_descriptions_for_prompt(CSV_HEADERS.get(relevant_headers_key, []))
+
+def _add_column_details(context, relevant_headers_key):
+    if 'column_details_block' not in context and 'column_list' not in context:
+        context['column_details_block'] = column_details_block(relevant_headers_key)
+
+def _validate_ai_response(relevant_headers_key, ai_data):
+    """Checks the fields the row builders rely on and coerces their types in place; raises ValueError."""
+    if relevant_headers_key == "vInfo":
+        if not all(k in ai_data for k in ['VM Name', 'Powerstate', 'OS according to VMWare', 'Provisioned MB', 'In Use MB']): raise ValueError("vInfo AI response missing critical fields.")
+        ai_data['vCPU'] = int(ai_data.get('vCPU', 1)); ai_data['Memory MB'] = int(ai_data.get('Memory MB', 1024))
+        ai_data['Provisioned MB'] = int(ai_data.get('Provisioned MB', 0)); ai_data['In Use MB'] = int(ai_data.get('In Use MB', 0))
+    elif relevant_headers_key == "vHost":
+        if not all(k in ai_data for k in ['Name', 'Cluster', 'Datacenter', 'CPUMhz', 'CPU Sockets', 'CPU Cores', 'MEM Size', 'ESXi Version']): raise ValueError("vHost AI response missing critical fields.")
+        ai_data['CPUMhz'] = int(ai_data.get('CPUMhz', 2000)); ai_data['CPU Sockets'] = int(ai_data.get('CPU Sockets', 1))
+        ai_data['CPU Cores'] = int(ai_data.get('CPU Cores', 4)); ai_data['MEM Size'] = int(ai_data.get('MEM Size', 16384)) # MB
+        ai_data['VMs'] = int(ai_data.get('VMs', 0))
+    elif relevant_headers_key == "vDisk":
+        if not all(k in ai_data for k in ["Disk", "Capacity MB", "Thin"]): raise ValueError("vDisk AI response missing critical fields.")
+        ai_data["Capacity MB"] = int(ai_data.get("Capacity MB", 10240))
+        ai_data["Thin"] = str(ai_data.get("Thin", "true")).lower() == "true"
+    elif relevant_headers_key == "vNetwork":
+        if not all(k in ai_data for k in ["Network adapter", "Adapter Type", "MAC Address", "Connected"]): raise ValueError("vNetwork AI response missing critical fields.")
+        ai_data["Connected"] = str(ai_data.get("Connected", "true")).lower() == "true"
+    elif relevant_headers_key == "vCluster":
+        if not all(k in ai_data for k in ["Name", "HA enabled", "DRS enabled"]): raise ValueError("vCluster AI response missing critical fields.")
+        ai_data["HA enabled"] = str(ai_data.get("HA enabled", "true")).lower() == "true"
+        ai_data["DRS enabled"] = str(ai_data.get("DRS enabled", "true")).lower() == "true"
+    elif relevant_headers_key == "vDatastore":
+        if not all(k in ai_data for k in ["Name", "Type", "Capacity MB", "Accessible"]): raise ValueError("vDatastore AI response missing critical fields.")
+        ai_data["Capacity MB"] = int(ai_data.get("Capacity MB", 512000))
+        ai_data["Accessible"] = str(ai_data.get("Accessible", "true")).lower() == "true"
+    return ai_data
+
+def _mock_ai_response(context, entity_name_for_log, entity_specific_mock_func=None):
+    if entity_specific_mock_func:
+        return entity_specific_mock_func(context)
+    return {"Annotation": f"Generic mock AI data for {entity_name_for_log}", "Name": context.get("vm_name_hint") or context.get("host_name_hint","GenericMockEntity")}
+
 def _get_ai_data_for_entity(prompt_template, context, relevant_headers_key, entity_name_for_log, use_ai_enabled_globally=False, ai_provider="mock", ollama_model_name_arg="llama3", entity_specific_mock_func=None):
     """Dispatcher for getting AI data, either from a real AI or a mock function."""
     openai_api_key = os.getenv("OPENAI_API_KEY")
 
     # Unified condition for attempting real AI calls via LangChain
-    if use_ai_enabled_globally and ai_provider in ["openai", "ollama"] and \
-       relevant_headers_key in ["vInfo", "vHost", "vDisk", "vNetwork", "vCluster", "vDatastore"] and \
-       LANGCHAIN_AVAILABLE:
+    if use_ai_enabled_globally and ai_provider in AI_PROVIDERS and relevant_headers_key in AI_TABLES and langchain_ready():
 
         llm_provider = None
         provider_name_for_log = ""
 
+        # With --ai_archetypes, requests beyond the table's archetype slots are answered from the pool
+        archetype_request = dict(context=context, relevant_headers_key=relevant_headers_key, ai_provider=ai_provider, use_ai_enabled_globally=use_ai_enabled_globally)
+        archetype_pool = get_archetype_pool() if llm_call_ready(archetype_request) else None
+        if archetype_pool is not None and not archetype_pool.reserve(relevant_headers_key):
+            archetype_data = archetype_pool.sample(archetype_request)
+            if archetype_data is not None:
+                return archetype_data
+            archetype_pool = None # No archetype yet (slots still in flight elsewhere); ask the model without a slot
+
+        # A cached response for the same provider, model, template and context skips the call entirely
+        model_name = _ai_model_name(ai_provider, ollama_model_name_arg)
+        ai_cache = get_ai_cache()
+        cache_key = ai_cache_key(ai_provider, model_name, prompt_template, relevant_headers_key, context) if ai_cache is not None else None
+        cached_data = ai_cache.get(cache_key) if ai_cache is not None else None
+        if cached_data is not None:
+            if archetype_pool is not None:
+                archetype_pool.settle(archetype_request, cached_data)
+            return cached_data
+
         if ai_provider == "openai":
             if not openai_api_key:
                 print(f"Warning: OpenAI provider selected but OPENAI_API_KEY not found. Falling back to mock for {entity_name_for_log}.")
                 return entity_specific_mock_func(context) if entity_specific_mock_func else _call_mock_ai(prompt_template, context, relevant_headers_key, entity_name_for_log)
-            llm_provider = ChatOpenAI(
-                model_name=ENVIRONMENT_DATA["config"].get("ai_model", "gpt-4o-mini"),
-                temperature=0.7,
-                openai_api_key=openai_api_key
-            )
+            llm_provider = get_llm_registry().client(ai_provider, model_name)
             provider_name_for_log = "OpenAI"
         elif ai_provider == "ollama":
-            if not LANGCHAIN_OLLAMA_AVAILABLE:
+            if not langchain_ollama_ready():
                 print(f"Warning: Ollama provider selected but LangChain Ollama libraries not found. Falling back to mock for {entity_name_for_log}.")
                 return entity_specific_mock_func(context) if entity_specific_mock_func else _call_mock_ai(prompt_template, context, relevant_headers_key, entity_name_for_log)
             print(f"Using Ollama model: {ollama_model_name_arg}. Ensure Ollama server is running and model is pulled.")
-            llm_provider = ChatOllama(model=ollama_model_name_arg)
+            llm_provider = get_llm_registry().client(ai_provider, model_name)
             provider_name_for_log = "Ollama"
 
+        if llm_provider and not ai_provider_available(ai_provider):
+            llm_provider = None # Circuit open or --ai_time_budget spent: straight to mock, without a line per row
+            if archetype_pool is not None:
+                archetype_pool.settle(archetype_request, None)
+
         if llm_provider:
             print(f"\nAttempting REAL AI call via LangChain ({provider_name_for_log}) for {entity_name_for_log} ({relevant_headers_key})...")
             try:
-                output_parser = JsonOutputParser()
-                system_template_str = "You are an AI assistant. Your primary goal is to generate synthetic data based on user context. You MUST output a single, valid JSON object containing only the requested fields and no other text, explanations, or markdown formatting."
-                system_message_prompt = SystemMessagePromptTemplate.from_template(system_template_str)
-
-                if 'column_details_block' not in context and 'column_list' not in context:
-                    if relevant_headers_key == "vInfo": context['column_details_block'] = _get_vinfo_column_descriptions_for_prompt()
-                    elif relevant_headers_key == "vHost": context['column_details_block'] = _get_vhost_column_descriptions_for_prompt()
-                    elif relevant_headers_key == "vDisk": context['column_details_block'] = _get_vdisk_column_descriptions_for_prompt()
-                    elif relevant_headers_key == "vNetwork": context['column_details_block'] = _get_vnetwork_column_descriptions_for_prompt()
-                    elif relevant_headers_key == "vCluster": context['column_details_block'] = _get_vcluster_column_descriptions_for_prompt()
-                    elif relevant_headers_key == "vDatastore": context['column_details_block'] = _get_vdatastore_column_descriptions_for_prompt()
-                    else: context['column_details_block'] = _get_column_descriptions_for_prompt(CSV_HEADERS.get(relevant_headers_key, []))
-
-                human_message_prompt = HumanMessagePromptTemplate.from_template(prompt_template)
-                chat_prompt_template = ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
-                chain = chat_prompt_template | llm_provider | output_parser
-                ai_data = chain.invoke(context)
+                _add_column_details(context, relevant_headers_key)
+                chain = get_llm_registry().chain(ai_provider, model_name, prompt_template)
+                started = time.monotonic()
+                try:
+                    ai_data = chain.invoke(context)
+                except Exception:
+                    get_circuit_breaker(ai_provider).record(False, time.monotonic() - started)
+                    raise
+                get_circuit_breaker(ai_provider).record(True, time.monotonic() - started)
                 print(f"LangChain {provider_name_for_log} response for {entity_name_for_log} (parsed): {str(ai_data)[:200]}...")
+                _validate_ai_response(relevant_headers_key, ai_data)
 
-                # Validation logic
-                if relevant_headers_key == "vInfo":
-                    if not all(k in ai_data for k in ['VM Name', 'Powerstate', 'OS according to VMWare', 'Provisioned MB', 'In Use MB']): raise ValueError("vInfo AI response missing critical fields.")
-                    ai_data['vCPU'] = int(ai_data.get('vCPU', 1)); ai_data['Memory MB'] = int(ai_data.get('Memory MB', 1024))
-                    ai_data['Provisioned MB'] = int(ai_data.get('Provisioned MB', 0)); ai_data['In Use MB'] = int(ai_data.get('In Use MB', 0))
-                elif relevant_headers_key == "vHost":
-                    if not all(k in ai_data for k in ['Name', 'Cluster', 'Datacenter', 'CPUMhz', 'CPU Sockets', 'CPU Cores', 'MEM Size', 'ESXi Version']): raise ValueError("vHost AI response missing critical fields.")
-                    ai_data['CPUMhz'] = int(ai_data.get('CPUMhz', 2000)); ai_data['CPU Sockets'] = int(ai_data.get('CPU Sockets', 1))
-                    ai_data['CPU Cores'] = int(ai_data.get('CPU Cores', 4)); ai_data['MEM Size'] = int(ai_data.get('MEM Size', 16384)) # MB
-                    ai_data['VMs'] = int(ai_data.get('VMs', 0))
-                elif relevant_headers_key == "vDisk":
-                    if not all(k in ai_data for k in ["Disk", "Capacity MB", "Thin"]): raise ValueError("vDisk AI response missing critical fields.")
-                    ai_data["Capacity MB"] = int(ai_data.get("Capacity MB", 10240))
-                    ai_data["Thin"] = str(ai_data.get("Thin", "true")).lower() == "true"
-                elif relevant_headers_key == "vNetwork":
-                    if not all(k in ai_data for k in ["Network adapter", "Adapter Type", "MAC Address", "Connected"]): raise ValueError("vNetwork AI response missing critical fields.")
-                    ai_data["Connected"] = str(ai_data.get("Connected", "true")).lower() == "true"
-                elif relevant_headers_key == "vCluster":
-                    if not all(k in ai_data for k in ["Name", "HA enabled", "DRS enabled"]): raise ValueError("vCluster AI response missing critical fields.")
-                    ai_data["HA enabled"] = str(ai_data.get("HA enabled", "true")).lower() == "true"
-                    ai_data["DRS enabled"] = str(ai_data.get("DRS enabled", "true")).lower() == "true"
-                elif relevant_headers_key == "vDatastore":
-                    if not all(k in ai_data for k in ["Name", "Type", "Capacity MB", "Accessible"]): raise ValueError("vDatastore AI response missing critical fields.")
-                    ai_data["Capacity MB"] = int(ai_data.get("Capacity MB", 512000))
-                    ai_data["Accessible"] = str(ai_data.get("Accessible", "true")).lower() == "true"
-
+                if ai_cache is not None:
+                    ai_cache.put(cache_key, ai_data)
+                if archetype_pool is not None:
+                    archetype_pool.settle(archetype_request, ai_data)
                 return ai_data
-            except OutputParserException as ope:
-                print(f"LangChain OutputParserException ({provider_name_for_log}) for {entity_name_for_log}: {ope}")
             except Exception as e:
-                print(f"Error during LangChain {provider_name_for_log} API call for {entity_name_for_log}: {e}")
+                if _is_output_parser_error(e):
+                    print(f"LangChain OutputParserException ({provider_name_for_log}) for {entity_name_for_log}: {e}")
+                else:
+                    print(f"Error during LangChain {provider_name_for_log} API call for {entity_name_for_log}: {e}")
+            if archetype_pool is not None:
+                archetype_pool.settle(archetype_request, None)
             print(f"Falling back to mock data for {entity_name_for_log} due to LangChain/{ai_provider} error.")
             # Fall through to mock if any error in try block
 
     # Fallback logic for all other cases (e.g., AI disabled, provider is mock, or errors above)
     if use_ai_enabled_globally and ai_provider != "mock": # If AI was intended but conditions above weren't met or failed
-        if not LANGCHAIN_AVAILABLE:
+        if not langchain_ready():
             print(f"LangChain libraries not found. Falling back to mock for {entity_name_for_log}.")
         elif ai_provider == "openai" and not openai_api_key: # Already handled, but as a safeguard
              print(f"OpenAI API key not found. Falling back to mock for {entity_name_for_log}.")
-        elif ai_provider == "ollama" and not LANGCHAIN_OLLAMA_AVAILABLE: # Already handled
+        elif ai_provider == "ollama" and not langchain_ollama_ready(): # Already handled
              print(f"LangChain Ollama libraries not found. Falling back to mock for {entity_name_for_log}.")
-        elif relevant_headers_key not in ["vInfo", "vHost", "vDisk", "vNetwork", "vCluster", "vDatastore"]:
+        elif relevant_headers_key not in AI_TABLES:
              print(f"Real AI ({ai_provider}) not enabled for {relevant_headers_key}. Falling back to mock.")
         # else: the specific error was already printed in the try-except blocks
 
-    if entity_specific_mock_func:
-        return entity_specific_mock_func(context)
-
-    return {"Annotation": f"Generic mock AI data for {entity_name_for_log}", "Name": context.get("vm_name_hint") or context.get("host_name_hint","GenericMockEntity")}
+    return _mock_ai_response(context, entity_name_for_log, entity_specific_mock_func)
+
+
+# --- AI Archetypes (--ai_archetypes) ---
+# With --ai_archetypes K, only the first K LLM-bound requests of each table reach the model. Their validated
+# answers become that table's archetypes, and every later request is answered locally, at mock speed, by
+# amplify_archetype(): a randomly chosen archetype with the requesting entity's names swapped in, sizes
+# perturbed, and addresses and counts left to the row builders. Worker processes are seeded with the
+# parent's archetypes (archetype_handoff / install_archetype_pool) and hand back what they authored, and
+# VM shards stay in the parent until their tables are full, so the calls made do not depend on --workers.
+_ARCHETYPE_POOL = None
+_ARCHETYPE_POOL_LOCK = threading.Lock()
+
+# Context keys naming the entity (and its parents); an archetype's values are replaced wherever they appear
+_ARCHETYPE_IDENTITY_KEYS = {
+    "vInfo": ("vm_name_hint", "assigned_host_name", "assigned_cluster_name", "assigned_datacenter_name", "folder_name", "rp_name"),
+    "vHost": ("host_name_hint", "cluster_name", "datacenter_name"),
+    "vDisk": ("vm_name", "datastore_name", "disk_label"),
+    "vNetwork": ("vm_name", "nic_label", "network_name_hint"),
+    "vCluster": ("cluster_name", "datacenter_name"),
+    "vDatastore": ("datastore_name",),
+}
+# Fields that must name the requesting entity even if the model wrote something else
+_ARCHETYPE_NAME_FIELDS = {
+    "vInfo": {"VM Name": "vm_name_hint"},
+    "vHost": {"Name": "host_name_hint", "Cluster": "cluster_name", "Datacenter": "datacenter_name"},
+    "vDisk": {"Disk": "disk_label"},
+    "vNetwork": {"Network adapter": "nic_label"},
+    "vCluster": {"Name": "cluster_name"},
+    "vDatastore": {"Name": "datastore_name"},
+}
+# Unique or topology-derived fields the row builders fill in locally when they are absent
+_ARCHETYPE_LOCAL_FIELDS = {
+    "vHost": ("VMs",),
+    "vNetwork": ("MAC Address",),
+    "vCluster": ("Number of Hosts", "Number of VMs"),
+    "vDatastore": ("VM Count", "Free %", "Provisioned MB", "Provisioned %"),
+}
+_ARCHETYPE_JITTER_FIELDS = ("Provisioned MB", "In Use MB", "Capacity MB")
+ARCHETYPE_JITTER = 0.2 # Sizes vary by up to +/-20% around the archetype's
+
+def amplify_archetype(relevant_headers_key, example_context, example_data, context):
+    """A new AI response for context, derived from one archetype (its request context and validated data)."""
+    data = {field: value for field, value in example_data.items() if field not in _ARCHETYPE_LOCAL_FIELDS.get(relevant_headers_key, ())}
+    renames = {str(example_context[key]): str(context[key]) for key in _ARCHETYPE_IDENTITY_KEYS.get(relevant_headers_key, ())
+               if example_context.get(key) not in (None, "") and context.get(key) is not None}
+    if renames:
+        pattern = re.compile("|".join(re.escape(old) for old in sorted(renames, key=len, reverse=True)))
+        for field, value in data.items():
+            if isinstance(value, str):
+                data[field] = pattern.sub(lambda match: renames[match.group(0)], value)
+    for field, key in _ARCHETYPE_NAME_FIELDS.get(relevant_headers_key, {}).items():
+        if context.get(key) is not None:
+            data[field] = context[key]
+
+    rng = current_rng()
+    for field in _ARCHETYPE_JITTER_FIELDS:
+        if isinstance(data.get(field), (int, float)) and not isinstance(data[field], bool):
+            data[field] = int(data[field] * rng.uniform(1 - ARCHETYPE_JITTER, 1 + ARCHETYPE_JITTER))
+    if isinstance(data.get("In Use MB"), int) and isinstance(data.get("Provisioned MB"), int):
+        data["In Use MB"] = min(data["In Use MB"], data["Provisioned MB"])
+    if data.get("IP Address"):
+        data["IP Address"] = generate_ip_address()
+    return data
+
+class ArchetypePool:
+    """Up to size AI-authored archetypes per table, shared by the table threads of one process."""
+
+    def __init__(self, size, examples=None):
+        self.size = size
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._examples = {key: list(found) for key, found in (examples or {}).items()}
+        self._reserved = {key: len(found) for key, found in self._examples.items()}
+        self._seeded = dict(self._reserved) # Examples handed in by the parent; not reported back by handoff()
+        self.amplified = 0
+
+    def reserve(self, relevant_headers_key):
+        """True if this request should go to the model (the table still has a free archetype slot)."""
+        with self._lock:
+            reserved = self._reserved.get(relevant_headers_key, 0)
+            if reserved >= self.size:
+                return False
+            self._reserved[relevant_headers_key] = reserved + 1
+            return True
+
+    def settle(self, request, ai_data):
+        """Records a reserved request's outcome; a failed call frees its slot for a later request."""
+        relevant_headers_key = request["relevant_headers_key"]
+        with self._lock:
+            if ai_data is None:
+                self._reserved[relevant_headers_key] -= 1
+            else:
+                self._examples.setdefault(relevant_headers_key, []).append((dict(request["context"]), ai_data))
+
+    def sample(self, request):
+        """An amplified archetype for request, drawn from the current rng; None while the table has none."""
+        relevant_headers_key = request["relevant_headers_key"]
+        with self._lock:
+            examples = list(self._examples.get(relevant_headers_key, ()))
+            self.amplified += bool(examples)
+        if not examples:
+            return None
+        example_context, example_data = current_rng().choice(examples)
+        return amplify_archetype(relevant_headers_key, example_context, example_data, request["context"])
+
+    def full(self, tables):
+        """True once every table in tables has all of its archetypes (none still in flight)."""
+        with self._lock:
+            return all(len(self._examples.get(table, ())) >= self.size for table in tables)
+
+    def examples(self):
+        with self._lock:
+            return {key: list(found) for key, found in self._examples.items()}
+
+    def handoff(self):
+        """(archetypes authored here beyond the seeded ones, rows amplified here), for the parent's absorb()."""
+        with self._lock:
+            return {key: found[self._seeded.get(key, 0):] for key, found in self._examples.items() if len(found) > self._seeded.get(key, 0)}, self.amplified
+
+    def absorb(self, handoff):
+        """Adds a worker's handoff() to this pool, so later tasks reuse its archetypes and the summary counts its rows."""
+        authored, amplified = handoff
+        with self._lock:
+            for key, found in authored.items():
+                self._examples.setdefault(key, []).extend(found)
+                self._reserved[key] = self._reserved.get(key, 0) + len(found)
+            self.amplified += amplified
+
+    def stats(self):
+        with self._lock:
+            return {"archetypes": {key: len(examples) for key, examples in self._examples.items()}, "amplified": self.amplified}
+
+def get_archetype_pool():
+    """The process's ArchetypePool for --ai_archetypes, or None when the mode is off."""
+    global _ARCHETYPE_POOL
+    size = ENVIRONMENT_DATA.get("config", {}).get("ai_archetypes", 0)
+    if not size:
+        return None
+    with _ARCHETYPE_POOL_LOCK:
+        if _ARCHETYPE_POOL is None or _ARCHETYPE_POOL.size != size or _ARCHETYPE_POOL.pid != os.getpid():
+            _ARCHETYPE_POOL = ArchetypePool(size)
+        return _ARCHETYPE_POOL
+
+def archetype_handoff():
+    """The parent's archetypes to seed a worker with (see install_archetype_pool); None when the mode is off."""
+    archetype_pool = get_archetype_pool()
+    return archetype_pool.examples() if archetype_pool is not None else None
+
+def install_archetype_pool(examples):
+    """Worker side: a fresh pool seeded with the parent's archetypes; tables already full make no model calls."""
+    global _ARCHETYPE_POOL
+    size = ENVIRONMENT_DATA.get("config", {}).get("ai_archetypes", 0)
+    with _ARCHETYPE_POOL_LOCK:
+        _ARCHETYPE_POOL = ArchetypePool(size, examples) if examples is not None and size else None
+        return _ARCHETYPE_POOL
+
+
+# --- AI Circuit Breaker (--ai_breaker_p95, --ai_time_budget) ---
+# Each provider gets a CircuitBreaker. After AI_BREAKER_FAILURES consecutive failed calls, or once the p95
+# latency of recent calls passes --ai_breaker_p95, it opens: rows skip the provider and go straight to
+# mock data, quietly. After AI_BREAKER_COOLDOWN seconds one probe call is let through (half-open); success
+# closes the breaker, failure opens it again. Separately, --ai_time_budget sends every row to mock once the
+# run has spent that many seconds.
+AI_BREAKER_FAILURES = 5
+AI_BREAKER_COOLDOWN = 30.0 # Seconds before a half-open probe
+AI_BREAKER_WINDOW = 50 # Recent call latencies the p95 is taken over
+AI_BREAKER_MIN_SAMPLES = 10
+_CIRCUIT_BREAKERS = {}
+_CIRCUIT_BREAKERS_LOCK = threading.Lock()
+_AI_BUDGET_REPORTED = set() # pids that already printed the budget notice
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one AI provider; safe to share between threads."""
+
+    def __init__(self, name, failure_threshold=AI_BREAKER_FAILURES, p95_threshold=0.0, cooldown=AI_BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.p95_threshold = p95_threshold # Seconds; 0 disables the latency trip
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.pid = os.getpid()
+        self._failures = 0
+        self._latencies = collections.deque(maxlen=AI_BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go to the provider now."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state, self._probe_in_flight = "half_open", False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, ok, seconds):
+        """Records one call's outcome and latency."""
+        with self._lock:
+            if self.state == "half_open":
+                if ok:
+                    print(f"AI provider {self.name} recovered; circuit closed.")
+                    self.state, self._failures = "closed", 0
+                    self._latencies.clear()
+                else:
+                    self._open("probe call failed")
+                return
+            if self.state == "open":
+                return # A call issued before the breaker opened
+            self._failures = 0 if ok else self._failures + 1
+            if ok:
+                self._latencies.append(seconds)
+            if self._failures >= self.failure_threshold:
+                self._open(f"{self._failures} consecutive failures")
+            elif self.p95_threshold and len(self._latencies) >= AI_BREAKER_MIN_SAMPLES and self.p95() > self.p95_threshold:
+                self._open(f"p95 latency {self.p95():.1f}s over {self.p95_threshold:g}s")
+
+    def p95(self):
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else 0.0
+
+    def _open(self, reason):
+        print(f"AI provider {self.name} circuit open ({reason}); rows use mock data for the next {self.cooldown:g}s.")
+        self.state, self._opened_at, self._probe_in_flight = "open", time.monotonic(), False
+
+def get_circuit_breaker(ai_provider):
+    """The process's CircuitBreaker for ai_provider, configured from --ai_breaker_p95."""
+    with _CIRCUIT_BREAKERS_LOCK:
+        breaker = _CIRCUIT_BREAKERS.get(ai_provider)
+        if breaker is None or breaker.pid != os.getpid():
+            breaker = _CIRCUIT_BREAKERS[ai_provider] = CircuitBreaker(ai_provider, p95_threshold=ENVIRONMENT_DATA.get("config", {}).get("ai_breaker_p95", 0.0))
+        return breaker
+
+def ai_budget_exhausted():
+    """True once the run's --ai_time_budget (an absolute ai_deadline set by main) has passed."""
+    deadline = ENVIRONMENT_DATA.get("config", {}).get("ai_deadline")
+    if deadline is None or time.time() < deadline:
+        return False
+    if os.getpid() not in _AI_BUDGET_REPORTED:
+        _AI_BUDGET_REPORTED.add(os.getpid())
+        print("AI time budget used up; remaining rows use mock data.")
+    return True
+
+def ai_provider_available(ai_provider):
+    """True if a call to ai_provider may be made now: budget left and its circuit not open."""
+    return not ai_budget_exhausted() and get_circuit_breaker(ai_provider).allow()
+
+
+# --- Concurrent AI Execution (--ai_concurrency, --ai_rate_limit, --ai_batch_size) ---
+# Row builders that consult the AI are written as "AI steps": generators that yield the keyword arguments
+# of each _get_ai_data_for_entity call and are sent its result. run_ai_steps() answers one request at a
+# time. iter_ai_units() advances a window of units (one VM, host, cluster, ...) to their next request
+# together, sends the ones bound for a real provider through ainvoke on a shared event loop, under a
+# concurrency limit and a per-provider token bucket, and returns the units' results in their original order.
+_AI_EXECUTOR = None
+_AI_EXECUTOR_LOCK = threading.Lock()
+
+class TokenBucket:
+    """Async token bucket: rate tokens per second, holding at most burst. Used from one event loop only."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _template_fields(prompt_template):
+    return [name for _, name, _, _ in string.Formatter().parse(prompt_template) if name]
+
+def _batch_prompt_messages(requests):
+    """System and human messages asking for one JSON array answering each request, in order.
+
+    The row instructions and column block are sent once; each request only contributes its placeholder values.
+    """
+    first = requests[0]
+    _add_column_details(first["context"], first["relevant_headers_key"])
+    fields = [name for name in dict.fromkeys(_template_fields(first["prompt_template"])) if name != "column_details_block"]
+    instructions = first["prompt_template"].replace("{column_details_block}", first["context"].get("column_details_block", ""))
+    lines = [f"Generate {len(requests)} {first['relevant_headers_key']} rows. The instructions below describe ONE row; "
+             "the placeholders in braces are filled from each numbered request's values.", "---", instructions.strip(), "---"]
+    for number, request in enumerate(requests, 1):
+        values = {name: request["context"][name] for name in fields if name in request["context"]}
+        lines.append(f"Request {number}: {json.dumps(values, default=str)}")
+    lines.append(f"Provide ONLY a JSON array of exactly {len(requests)} objects, element i answering request i.")
+    return [("system", _AI_BATCH_SYSTEM_PROMPT), ("human", "\n".join(lines))]
+
+async def _aget_llm_data(requests):
+    """Async counterpart of the real-provider path of _get_ai_data_for_entity for one or more requests of the
+    same table, provider, model and template. Several requests share one call answered with a JSON array; each
+    element is validated on its own. Returns validated data per request, None where the call or element failed."""
+    first = requests[0]
+    relevant_headers_key, ai_provider = first["relevant_headers_key"], first["ai_provider"]
+    entity_names_for_log = ", ".join(request["entity_name_for_log"] for request in requests)
+    model_name = _ai_model_name(ai_provider, first.get("ollama_model_name_arg", "llama3"))
+    started = time.monotonic()
+    try:
+        if len(requests) == 1:
+            _add_column_details(first["context"], relevant_headers_key)
+            answers = [await get_llm_registry().chain(ai_provider, model_name, first["prompt_template"]).ainvoke(first["context"])]
+        else:
+            answers = await get_llm_registry().chain(ai_provider, model_name).ainvoke(_batch_prompt_messages(requests))
+            answers = answers if isinstance(answers, list) else [answers]
+    except Exception as e:
+        get_circuit_breaker(ai_provider).record(False, time.monotonic() - started)
+        print(f"Error during async LangChain {ai_provider} call for {entity_names_for_log}: {e}. Falling back to mock data.")
+        return [None] * len(requests)
+    get_circuit_breaker(ai_provider).record(True, time.monotonic() - started)
+    results = []
+    for request, ai_data in itertools.zip_longest(requests, answers[:len(requests)]):
+        try:
+            results.append(_validate_ai_response(relevant_headers_key, ai_data) if isinstance(ai_data, dict) else None)
+        except (ValueError, TypeError) as e:
+            print(f"Invalid AI response for {request['entity_name_for_log']} ({relevant_headers_key}): {e}. Falling back to mock data.")
+            results.append(None)
+    if len(requests) > 1 and None in results:
+        print(f"{results.count(None)} of {len(requests)} batched {relevant_headers_key} rows fell back to mock data.")
+    return results
+
+class AiExecutor:
+    """Runs LLM-bound AI requests concurrently on a background event loop shared by all table threads.
+
+    At most concurrency calls per provider are in flight, and with rate_limit > 0 a token bucket
+    holds each provider to that many calls per second. With batch_size > 1, up to that many requests
+    of the same table, provider, model and template share one call.
+    """
+
+    def __init__(self, concurrency=8, rate_limit=0.0, batch_size=1):
+        self.concurrency = max(1, concurrency)
+        self.rate_limit = rate_limit
+        self.batch_size = max(1, batch_size)
+        self.window = max(64, 4 * self.concurrency, self.batch_size * self.concurrency) # Units advanced together by iter_ai_units
+        self.pid = os.getpid() # The loop thread does not survive a fork; get_ai_executor() rebuilds in children
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._limits = {}
+
+    def _event_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="ai-event-loop", daemon=True).start()
+            return self._loop
+
+    async def _limited_call(self, requests):
+        provider = requests[0]["ai_provider"]
+        if provider not in self._limits: # Only touched from the loop thread
+            self._limits[provider] = (asyncio.Semaphore(self.concurrency), TokenBucket(self.rate_limit) if self.rate_limit > 0 else None)
+        semaphore, bucket = self._limits[provider]
+        async with semaphore:
+            if bucket is not None:
+                await bucket.acquire()
+            return await _aget_llm_data(requests)
+
+    def _batches(self, requests, indexes):
+        """Groups request indexes by table, provider, model and template, in chunks of batch_size."""
+        groups = {}
+        for index in indexes:
+            request = requests[index]
+            key = (request["relevant_headers_key"], request["ai_provider"], _ai_model_name(request["ai_provider"], request.get("ollama_model_name_arg", "llama3")), request["prompt_template"])
+            groups.setdefault(key, []).append(index)
+        return [group[start:start + self.batch_size] for group in groups.values() for start in range(0, len(group), self.batch_size)]
+
+    def fetch(self, requests):
+        """Validated AI data for each request, in order; None where the call failed."""
+        results = [None] * len(requests)
+        ai_cache = get_ai_cache()
+        cache_keys = [None] * len(requests)
+        misses = []
+        for index, request in enumerate(requests):
+            if ai_cache is not None:
+                cache_keys[index] = ai_cache_key(request["ai_provider"], _ai_model_name(request["ai_provider"], request.get("ollama_model_name_arg", "llama3")),
+                                                 request["prompt_template"], request["relevant_headers_key"], request["context"])
+                results[index] = ai_cache.get(cache_keys[index])
+            if results[index] is None:
+                misses.append(index)
+        if not misses:
+            return results
+        batches = self._batches(requests, misses)
+
+        async def gather():
+            return await asyncio.gather(*(self._limited_call([requests[index] for index in batch]) for batch in batches))
+        for batch, answers in zip(batches, asyncio.run_coroutine_threadsafe(gather(), self._event_loop()).result()):
+            for index, ai_data in zip(batch, answers):
+                results[index] = ai_data
+                if ai_cache is not None and ai_data is not None:
+                    ai_cache.put(cache_keys[index], ai_data) # Cached per row, so a later unbatched run hits too
+        return results
+
+    def run_units(self, units):
+        """Runs a window of (steps, rng) units to completion and returns their results in order."""
+        results = [None] * len(units)
+        pending = []
+
+        def advance(index, steps, rng, response):
+            with bind_rng(rng):
+                try:
+                    pending.append((index, steps, rng, steps.send(response))) # send(None) starts a fresh generator
+                except StopIteration as done:
+                    results[index] = done.value
+
+        for index, (steps, rng) in enumerate(units):
+            advance(index, steps, rng, None)
+        archetype_pool = get_archetype_pool()
+        while pending:
+            current, pending = pending, []
+            llm_bound = [entry for entry in current if llm_call_ready(entry[3])]
+            amplified = set()
+            if archetype_pool is not None: # Only requests holding an archetype slot reach the model
+                amplified = {entry[0] for entry in llm_bound if not archetype_pool.reserve(entry[3]["relevant_headers_key"])}
+                llm_bound = [entry for entry in llm_bound if entry[0] not in amplified]
+            calls = [entry for entry in llm_bound if ai_provider_available(entry[3]["ai_provider"])]
+            fetched = {entry[0]: None for entry in llm_bound} # Circuit open or --ai_time_budget spent: mock
+            fetched.update(zip((entry[0] for entry in calls), self.fetch([entry[3] for entry in calls])))
+            for index, steps, rng, request in llm_bound:
+                if archetype_pool is not None:
+                    archetype_pool.settle(request, fetched[index])
+            for index, steps, rng, request in current:
+                response = fetched.get(index)
+                if index in amplified:
+                    with bind_rng(rng):
+                        response = archetype_pool.sample(request)
+                    if response is None: # Every archetype call so far failed
+                        fetched[index] = None
+                if response is None:
+                    with bind_rng(rng): # Mock rows draw from the unit's own stream, in unit order
+                        response = _mock_ai_response(request["context"], request["entity_name_for_log"], request.get("entity_specific_mock_func")) \
+                            if index in fetched else _get_ai_data_for_entity(**request)
+                advance(index, steps, rng, response)
+        return results
+
+def get_ai_executor():
+    """The run's AiExecutor (from --ai_concurrency/--ai_rate_limit/--ai_batch_size), created once per process."""
+    global _AI_EXECUTOR
+    config = ENVIRONMENT_DATA.get("config", {})
+    with _AI_EXECUTOR_LOCK:
+        if _AI_EXECUTOR is None or _AI_EXECUTOR.pid != os.getpid():
+            _AI_EXECUTOR = AiExecutor(config.get("ai_concurrency", 8), config.get("ai_rate_limit", 0.0), config.get("ai_batch_size", 1))
+        return _AI_EXECUTOR
+
+def run_ai_steps(steps):
+    """Runs AI steps to completion, answering each request with a synchronous _get_ai_data_for_entity call."""
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(_get_ai_data_for_entity(**request))
+    except StopIteration as done:
+        return done.value
+
+def iter_ai_units(units, use_ai_cli_flag=False, ai_provider_cli_arg="mock"):
+    """Yields the result of each (steps, rng) unit in order; rng (or None for the current stream) is bound
+    while the unit runs. Units run window by window through the AiExecutor when a real provider is in use."""
+    if not (use_ai_cli_flag and ai_provider_cli_arg in AI_PROVIDERS and langchain_ready()):
+        for steps, rng in units:
+            with bind_rng(rng):
+                yield run_ai_steps(steps)
+        return
+    executor = get_ai_executor()
+    units = iter(units)
+    while True:
+        window = list(itertools.islice(units, executor.window))
+        if not window:
+            return
+        yield from executor.run_units(window)
 
 
 # --- CSV Writing Function ---
-def write_csv(data, filename_prefix, headers, output_dir_override=None, csv_subdir_override=None):
-    """Writes data to a CSV file."""
-    output_dir = output_dir_override or ENVIRONMENT_DATA["config"].get("output_dir", DEFAULT_OUTPUT_DIR)
+# Row count, size and SHA-256 of every table written in this run, keyed by archive name.
+EXPORT_MANIFEST = {}
+_ZIP_EXPORTER = None # Set by main() when --direct_zip streams tables straight into the output ZIP
+
+
+class _CsvDigestStream:
+    """Text sink for csv.writer that encodes, checksums and counts bytes on their way to a binary stream."""
+
+    def __init__(self, raw, buffer_size=1 << 16):
+        self.raw = raw
+        self.buffer_size = buffer_size
+        self.sha256 = hashlib.sha256()
+        self.bytes_written = 0
+        self._pending = []
+        self._pending_len = 0
+
+    def write(self, text):
+        self._pending.append(text)
+        self._pending_len += len(text)
+        if self._pending_len >= self.buffer_size:
+            self.flush()
+
+    def write_bytes(self, chunk):
+        """Passes already-encoded CSV bytes (e.g. a shard part file) through the digest."""
+        self.flush()
+        self.sha256.update(chunk)
+        self.bytes_written += len(chunk)
+        self.raw.write(chunk)
+
+    def flush(self):
+        if self._pending:
+            chunk = "".join(self._pending).encode("utf-8")
+            self._pending, self._pending_len = [], 0
+            self.sha256.update(chunk)
+            self.bytes_written += len(chunk)
+            self.raw.write(chunk)
+
+
+def _write_csv_stream(raw, data, headers, write_header=True):
+    """Writes header + rows to a binary stream; returns (row_count, bytes, sha256 hex)."""
+    stream = _CsvDigestStream(raw)
+    writer = csv.writer(stream)
+    if write_header:
+        writer.writerow(headers)
+    row_count = 0
+    for row in data:
+        if isinstance(row, dict):
+            row = [row.get(header, "") for header in headers]
+        writer.writerow(row)
+        row_count += 1
+    stream.flush()
+    return row_count, stream.bytes_written, stream.sha256.hexdigest()
+
+
+def _write_csv_parts_stream(raw, parts, headers):
+    """Writes the header, then concatenates headerless part files given as (path, row_count) in order."""
+    stream = _CsvDigestStream(raw)
+    csv.writer(stream).writerow(headers)
+    row_count = 0
+    for path, part_rows in parts:
+        with open(path, 'rb') as part:
+            for chunk in iter(lambda: part.read(1 << 20), b""):
+                stream.write_bytes(chunk)
+        row_count += part_rows
+    stream.flush()
+    return row_count, stream.bytes_written, stream.sha256.hexdigest()
+
+
+def _write_csv_tables_stream(raw, tables, headers):
+    """Like _write_csv_parts_stream for complete CSV files (path, row_count): each file's header line is skipped."""
+    stream = _CsvDigestStream(raw)
+    csv.writer(stream).writerow(headers)
+    row_count = 0
+    for path, table_rows in tables:
+        with open(path, 'rb') as table:
+            table.readline()
+            for chunk in iter(lambda: table.read(1 << 20), b""):
+                stream.write_bytes(chunk)
+        row_count += table_rows
+    stream.flush()
+    return row_count, stream.bytes_written, stream.sha256.hexdigest()
+
+
+def _write_csv_blocks_stream(raw, blocks, headers, write_header=True):
+    """Writes the header, then pre-formatted CSV text blocks given as (row_count, text) (--engine numpy)."""
+    stream = _CsvDigestStream(raw)
+    if write_header:
+        csv.writer(stream).writerow(headers)
+    row_count = 0
+    for block_rows, text in blocks:
+        for offset in range(0, len(text), 1 << 18): # Cache-sized slices encode and hash about twice as fast as one big pass
+            stream.write(text[offset:offset + (1 << 18)])
+        row_count += block_rows
+    stream.flush()
+    return row_count, stream.bytes_written, stream.sha256.hexdigest()
+
+
+class ZipCsvExporter:
+    """Streams each table straight into its own ZIP entry, skipping the RVT_CSV staging directory.
+
+    Entries are always written with ZIP64 extensions since table sizes are unknown up front.
+    zipfile allows one open write handle at a time, so concurrent tables take turns on a lock.
+    close() adds the manifest entry built from the row counts and checksums gathered while writing.
+    """
+
+    def __init__(self, zip_filepath, compression=zipfile.ZIP_DEFLATED, date_time=None, compresslevel=None):
+        self.zip_filepath = zip_filepath
+        self.zf = zipfile.ZipFile(zip_filepath, 'w', compression, allowZip64=True, compresslevel=compresslevel)
+        self.date_time = date_time # Fixed entry timestamp (seeded runs); None stamps entries with the current time
+        self._lock = threading.Lock()
+
+    def _open_entry(self, arcname):
+        zinfo = zipfile.ZipInfo(arcname, date_time=self.date_time or time.localtime(time.time())[:6])
+        zinfo.compress_type = self.zf.compression
+        zinfo._compresslevel = self.zf.compresslevel # Hand-built ZipInfos do not inherit the archive's level (compress_level on 3.13+, which keeps this alias)
+        return self.zf.open(zinfo, 'w', force_zip64=True)
+
+    def write_table(self, arcname, headers, data, stream_writer=_write_csv_stream):
+        with self._lock:
+            with self._open_entry(arcname) as entry:
+                return stream_writer(entry, data, headers)
+
+    def write_file(self, arcname, path):
+        """Copies a CSV already written elsewhere (e.g. by a worker process) into its own entry."""
+        with self._lock:
+            with open(path, 'rb') as src, self._open_entry(arcname) as entry:
+                shutil.copyfileobj(src, entry, 1 << 20)
+
+    def close(self):
+        with self._lock:
+            with self._open_entry(MANIFEST_FILENAME) as entry:
+                entry.write(build_export_manifest().encode("utf-8"))
+            self.zf.close()
+
+
+def build_export_manifest():
+    return json.dumps({"tables": {name: EXPORT_MANIFEST[name] for name in sorted(EXPORT_MANIFEST)}}, indent=2)
+
+
+def write_csv(data, filename_prefix, headers, output_dir_override=None, csv_subdir_override=None, stream_writer=_write_csv_stream):
+    """Streams rows from any iterable (row lists or dicts keyed by header) into a CSV table.
+
+    Rows are written as they are produced, so generators can hand over a lazy iterator
+    and memory stays flat regardless of table size. The table lands in the staging directory
+    (<output_dir>/RVT_CSV) or, with --direct_zip, directly in the output ZIP. Returns the number
+    of data rows written. stream_writer lets callers swap in another body writer, such as
+    _write_csv_parts_stream for tables assembled from shard part files.
+    """
     csv_subdir = csv_subdir_override or DEFAULT_CSV_SUBDIR
-
-    current_csv_output_path = os.path.join(output_dir, csv_subdir)
-    if not os.path.exists(current_csv_output_path):
-        os.makedirs(current_csv_output_path)
-
-    filepath = os.path.join(current_csv_output_path, f"{filename_prefix}.csv")
+    arcname = f"{csv_subdir}/{filename_prefix}.csv"
+    exporter = _ZIP_EXPORTER
+    row_count = 0
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
-            if isinstance(data, list) and data and isinstance(data[0], dict): # list of dicts
-                writer.writerows([ [row.get(header, "") for header in headers] for row in data])
-            elif isinstance(data, list) and data and isinstance(data[0], list): # list of lists
-                 writer.writerows(data)
-            else:
-                print(f"Warning: Data for {filepath} is not in expected list format or is empty.")
-        # print(f"Successfully generated {filepath}")
+        if exporter is not None and output_dir_override is None:
+            target = f"{exporter.zip_filepath}:{arcname}"
+            row_count, size_bytes, digest = exporter.write_table(arcname, headers, data, stream_writer)
+        else:
+            output_dir = output_dir_override or ENVIRONMENT_DATA["config"].get("output_dir", DEFAULT_OUTPUT_DIR)
+            current_csv_output_path = os.path.join(output_dir, csv_subdir)
+            os.makedirs(current_csv_output_path, exist_ok=True) # Parallel generators may race to create it
+            target = os.path.join(current_csv_output_path, f"{filename_prefix}.csv")
+            with open(target, 'wb') as f:
+                row_count, size_bytes, digest = stream_writer(f, data, headers)
+        EXPORT_MANIFEST[arcname] = {"rows": row_count, "bytes": size_bytes, "sha256": digest}
+        if row_count == 0:
+            print(f"Warning: No rows were produced for {target}.")
     except Exception as e:
-        print(f"Error writing CSV {filepath}: {e}")
-
+        print(f"Error writing CSV {arcname}: {e}")
+    return row_count
+
+
+# --- Parallel ZIP Compression (--zip_compression, --zip_level) ---
+# The staged ZIP step deflates each CSV in ZIP_BLOCK_SIZE blocks on a thread pool (zlib releases the GIL)
+# and writes the blocks in order. Blocks end on a byte boundary (Z_SYNC_FLUSH), only the last one finishes
+# the stream, and each block is primed with the previous 32 KiB, so the pieces join into one ordinary
+# deflate stream that compresses almost as well as a serial one. The block size is fixed, so the archive
+# bytes do not depend on the thread count.
+ZIP_COMPRESSION_METHODS = {"stored": zipfile.ZIP_STORED, "deflate": zipfile.ZIP_DEFLATED}
+ZIP_BLOCK_SIZE = 1 << 22
+_DEFLATE_WINDOW = 1 << 15
+
+def _deflate_block(block, dictionary, level, last):
+    """Raw deflate data for one block; joins onto the data of the block before it."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, **({"zdict": dictionary} if dictionary else {}))
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def _iter_deflated_blocks(src, pool, level, in_flight):
+    """Yields (block, deflated block) for src in order, keeping at most in_flight blocks queued on pool."""
+    pending = collections.deque()
+    dictionary = b""
+    block = src.read(ZIP_BLOCK_SIZE)
+    while True:
+        next_block = src.read(ZIP_BLOCK_SIZE)
+        pending.append((block, pool.submit(_deflate_block, block, dictionary, level, not next_block)))
+        dictionary = (dictionary + block)[-_DEFLATE_WINDOW:]
+        if len(pending) >= in_flight:
+            done, future = pending.popleft()
+            yield done, future.result()
+        if not next_block:
+            break
+        block = next_block
+    for done, future in pending:
+        yield done, future.result()
+
+# The ZipFile state write_zip_entry_deflated_in_parallel() updates directly, as ZipFile.open(zinfo, 'w') does on close
+_ZIPFILE_WRITE_STATE = ("fp", "filelist", "NameToInfo", "start_dir", "_didModify", "_seekable", "_writing")
+
+def _can_append_raw_entry(zf):
+    return all(hasattr(zf, attr) for attr in _ZIPFILE_WRITE_STATE) and zf._seekable and not zf._writing
+
+def write_zip_entry_deflated_in_parallel(zf, zinfo, src, pool, level, in_flight):
+    """Appends src to zf as a ZIP64 deflate entry built by _iter_deflated_blocks; the local header is patched afterwards.
+
+    This does what ZipFile.open(zinfo, 'w') does on close, through the private state in _ZIPFILE_WRITE_STATE;
+    checked on CPython 3.10, 3.11, 3.12 and 3.13. If that state is missing (or the archive is not seekable),
+    the entry is written serially through zf.open() instead.
+    """
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    if not _can_append_raw_entry(zf):
+        zinfo._compresslevel = level
+        with zf.open(zinfo, 'w', force_zip64=True) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        return
+    zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+    zinfo.header_offset = zf.fp.tell()
+    zf.fp.write(zinfo.FileHeader(zip64=True))
+    crc = size = compressed = 0
+    for block, deflated in _iter_deflated_blocks(src, pool, level, in_flight):
+        crc = zlib.crc32(block, crc)
+        size += len(block)
+        compressed += len(deflated)
+        zf.fp.write(deflated)
+    zinfo.CRC, zinfo.file_size, zinfo.compress_size = crc, size, compressed
+    end = zf.fp.tell()
+    zf.fp.seek(zinfo.header_offset)
+    zf.fp.write(zinfo.FileHeader(zip64=True))
+    zf.fp.seek(end)
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+    zf.start_dir = end # The central directory goes after the last entry
+    zf._didModify = True # ... and is written on close even if nothing else is (mode 'a' starts out unmodified)
+
+def zip_compression_options(args):
+    """compression/compresslevel keyword arguments for the archive writers from --zip_compression and --zip_level."""
+    return {"compression": ZIP_COMPRESSION_METHODS[args.zip_compression], "compresslevel": args.zip_level if args.zip_compression == "deflate" else None}
+
+def write_staged_zip(zip_filepath, output_dir, zip_date_time=None, compression=zipfile.ZIP_DEFLATED, compresslevel=None, threads=None):
+    """Packs the CSVs staged under <output_dir>/RVT_CSV, plus the manifest, into the output ZIP.
+
+    Deflated entries are compressed block-wise on threads (default: one per CPU); see _deflate_block.
+    """
+    print(f"\nAttempting to create zip file: {zip_filepath}")
+    level = zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel
+    threads = threads or os.cpu_count() or 1
+    try:
+        current_csv_output_path = os.path.join(output_dir, DEFAULT_CSV_SUBDIR)
+        if not os.path.isdir(current_csv_output_path) or not os.listdir(current_csv_output_path):
+             print(f"Warning: Source CSV directory {current_csv_output_path} is empty or does not exist. No ZIP created.")
+        else:
+            with zipfile.ZipFile(zip_filepath, 'w', compression, allowZip64=True, compresslevel=compresslevel) as zf, \
+                    ThreadPoolExecutor(max_workers=threads, thread_name_prefix="zip") as pool:
+                for root, _, files in os.walk(current_csv_output_path):
+                    for file in sorted(files):
+                        if file.endswith(".csv"):
+                            file_path = os.path.join(root, file)
+                            arcname = os.path.join(DEFAULT_CSV_SUBDIR, os.path.relpath(file_path, current_csv_output_path))
+                            zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                            zinfo.compress_type = compression
+                            if zip_date_time: zinfo.date_time = zip_date_time
+                            with open(file_path, 'rb') as src:
+                                if compression == zipfile.ZIP_DEFLATED:
+                                    write_zip_entry_deflated_in_parallel(zf, zinfo, src, pool, level, 2 * threads)
+                                else:
+                                    with zf.open(zinfo, 'w', force_zip64=True) as dst:
+                                        shutil.copyfileobj(src, dst, 1 << 20)
+                manifest_info = zipfile.ZipInfo(MANIFEST_FILENAME, date_time=zip_date_time or time.localtime(time.time())[:6])
+                manifest_info.compress_type = compression
+                zf.writestr(manifest_info, build_export_manifest())
+            print(f"Successfully created ZIP file: {zip_filepath}")
+    except Exception as e:
+        print(f"Error creating ZIP file: {e}")
+
+
+# --- XLSX Export (--format xlsx) ---
+# Real RVTools writes one workbook with a sheet per tab. write_staged_xlsx() builds that workbook from the
+# staged CSVs with nothing but zipfile: each CSV is read row by row and streamed into its sheet as XML, so
+# memory stays flat however long the sheet is. Cells are inline strings (no shared-string table to hold in
+# memory) or numbers; a table longer than Excel's row limit continues on "<table> (2)", and so on.
+XLSX_MAX_ROWS = 1048576 # Excel's sheet limit, header row included
+_XLSX_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_XLSX_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XLSX_NUMBER = re.compile(r"-?(?:0|[1-9]\d{0,14})(?:\.\d+)?") # Longer digit runs would lose precision as numbers
+_XLSX_ILLEGAL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_XLSX_SHEET_START = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{_XLSX_NS}"><sheetData>'
+_XLSX_SHEET_END = "</sheetData></worksheet>"
+
+def _xlsx_cell(value):
+    if not value:
+        return "<c/>" # Cells carry no reference, so blanks keep their place
+    if _XLSX_NUMBER.fullmatch(value):
+        return f"<c><v>{value}</v></c>"
+    text = xml.sax.saxutils.escape(_XLSX_ILLEGAL_CHARS.sub("", value))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+def _xlsx_row(row_number, values):
+    return f'<row r="{row_number}">{"".join(_xlsx_cell(value) for value in values)}</row>'
+
+class XlsxWorkbookWriter:
+    """Streams sheets into an .xlsx package one at a time; close() adds the workbook parts that list them."""
+
+    def __init__(self, xlsx_filepath, date_time=None, compression=zipfile.ZIP_DEFLATED, compresslevel=None):
+        self.zf = zipfile.ZipFile(xlsx_filepath, 'w', compression, allowZip64=True, compresslevel=compresslevel)
+        self.date_time = date_time or time.localtime(time.time())[:6]
+        self.sheet_names = []
+
+    def _entry(self, arcname):
+        zinfo = zipfile.ZipInfo(arcname, date_time=self.date_time)
+        zinfo.compress_type = self.zf.compression
+        zinfo._compresslevel = self.zf.compresslevel
+        return zinfo
+
+    def write_sheets(self, name, headers, rows):
+        """Writes headers + rows as sheet name, continuing on "name (2)", ... past XLSX_MAX_ROWS; returns the data row count."""
+        rows = iter(rows)
+        carried = [] # First row of a continuation sheet, read to find out whether one is needed
+        row_count = 0
+        for part in itertools.count(1):
+            self.sheet_names.append(name if part == 1 else f"{name} ({part})")
+            with self.zf.open(self._entry(f"xl/worksheets/sheet{len(self.sheet_names)}.xml"), 'w', force_zip64=True) as raw:
+                stream = _CsvDigestStream(raw) # Buffers and encodes the XML text
+                stream.write(_XLSX_SHEET_START)
+                stream.write(_xlsx_row(1, headers))
+                sheet_rows = 0
+                for sheet_rows, row in enumerate(itertools.chain(carried, itertools.islice(rows, XLSX_MAX_ROWS - 1 - len(carried))), 1):
+                    stream.write(_xlsx_row(sheet_rows + 1, row))
+                stream.write(_XLSX_SHEET_END)
+                stream.flush()
+            row_count += sheet_rows
+            carried = list(itertools.islice(rows, 1)) if sheet_rows == XLSX_MAX_ROWS - 1 else []
+            if not carried:
+                return row_count
+
+    def close(self):
+        sheets = "".join(f'<sheet name="{xml.sax.saxutils.escape(name)}" sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(self.sheet_names, 1))
+        sheet_rels = "".join(f'<Relationship Id="rId{i}" Type="{_XLSX_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(self.sheet_names) + 1))
+        sheet_types = "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                              for i in range(1, len(self.sheet_names) + 1))
+        parts = {
+            "xl/workbook.xml": f'<workbook xmlns="{_XLSX_NS}" xmlns:r="{_XLSX_REL_NS}"><sheets>{sheets}</sheets></workbook>',
+            "xl/_rels/workbook.xml.rels": f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{sheet_rels}'
+                                          f'<Relationship Id="rId{len(self.sheet_names) + 1}" Type="{_XLSX_REL_NS}/styles" Target="styles.xml"/></Relationships>',
+            "xl/styles.xml": f'<styleSheet xmlns="{_XLSX_NS}"><fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+                             '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+                             '<borders count="1"><border/></borders><cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+                             '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+                             '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>',
+            "_rels/.rels": f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                           f'<Relationship Id="rId1" Type="{_XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+            "[Content_Types].xml": '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                                   '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                                   '<Default Extension="xml" ContentType="application/xml"/>'
+                                   '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                                   '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                                   f'{sheet_types}</Types>',
+        }
+        for arcname, body in parts.items():
+            self.zf.writestr(self._entry(arcname), '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + body)
+        self.zf.close()
+
+
+def output_filename(filename, output_format):
+    """Swaps a .zip filename (the --zip_filename default) for .xlsx when --format xlsx is used."""
+    root, ext = os.path.splitext(filename)
+    return f"{root}.xlsx" if output_format == "xlsx" and ext.lower() in (".zip", "") else filename
+
+def write_staged_xlsx(xlsx_filepath, output_dir, date_time=None, compression=zipfile.ZIP_DEFLATED, compresslevel=None):
+    """Streams the CSVs staged under <output_dir>/RVT_CSV into one workbook, a sheet per table in CSV_HEADERS order."""
+    print(f"\nAttempting to create workbook: {xlsx_filepath}")
+    current_csv_output_path = os.path.join(output_dir, DEFAULT_CSV_SUBDIR)
+    staged = [table for table in CSV_HEADERS if os.path.isfile(os.path.join(current_csv_output_path, f"{table}.csv"))]
+    if not staged:
+        print(f"Warning: Source CSV directory {current_csv_output_path} is empty or does not exist. No workbook created.")
+        return
+    try:
+        workbook = XlsxWorkbookWriter(xlsx_filepath, date_time, compression, compresslevel)
+        try:
+            for table in staged:
+                with open(os.path.join(current_csv_output_path, f"{table}.csv"), newline="", encoding="utf-8") as f:
+                    reader = csv.reader(f)
+                    workbook.write_sheets(table, next(reader, CSV_HEADERS[table]), reader)
+        finally:
+            workbook.close()
+        print(f"Successfully created workbook: {xlsx_filepath}")
+    except Exception as e:
+        print(f"Error creating workbook: {e}")
 
 # --- Individual CSV Data Generation Functions ---
 
+# vInfo columns carried on each ENVIRONMENT_DATA["vms"] record. vInfo rows are emitted from the
+# records instead of a separate row list; columns missing here (e.g. "SRM Placeholder") are blank.
+_VINFO_RECORD_FIELDS = {
+    "VM Name": "name", "Powerstate": "power_state", "Template": "is_template",
+    "VI SDK Server": "sdk_server", "VI SDK UUID": "sdk_uuid", "VM UUID": "uuid", "VM Version": "vm_version",
+    "Host": "host", "Cluster": "cluster", "Datacenter": "datacenter", "Pool": "resource_pool", "Folder": "folder",
+    "Provisioned MB": "provisioned_mb", "In Use MB": "in_use_mb", "OS according to VMWare": "os",
+    "DNS Name": "dns_name", "IP Address": "ip_address", "vCPU": "num_cpu", "Memory MB": "memory_mb",
+    "NICs": "num_nics", "Disks": "num_disks", "Creation date": "creation_date", "Annotation": "annotation",
+    "VM Folder Path": "folder_path", "VM Guest ID": "guest_id",
+}
+_VINFO_ROW_FIELDS = [_VINFO_RECORD_FIELDS.get(header) for header in CSV_HEADERS["vInfo"]]
+
+def _vm_record_from_vinfo_row(row):
+    return {field: row.get(header, "") for header, field in _VINFO_RECORD_FIELDS.items()}
+
+def _vinfo_row_from_vm_record(vm_rec):
+    return [vm_rec.get(field, "") if field else "" for field in _VINFO_ROW_FIELDS]
+
+# Value pools shared by the per-row mocks and the columnar engine
+VM_VCPU_CHOICES = [1, 2, 4, 8]
+VM_MEMORY_MB_CHOICES = [2048, 4096, 8192, 16384]
+VM_VERSION_CHOICES = ["vSphere vCenter 8.0", "vSphere vCenter 7.0 U3"]
+
 # vInfo specific AI mock function
 def _create_vinfo_mock_data(context):
     vm_name = context.get("vm_name_hint", generate_vm_name())
-    power_state = random.choice(["PoweredOn", "PoweredOff"])
+    power_state = current_rng().choice(["PoweredOn", "PoweredOff"])
     provisioned_mb = generate_random_integer(20480, 204800)
     in_use_mb = int(provisioned_mb * generate_random_float(0.1, 0.6)) if power_state == "PoweredOn" else 0
     return {
@@ -579,16 +2097,21 @@ def _create_vinfo_mock_data(context):
         "OS according to VMWare": generate_os_name(context.get("profile_os_hints")),
         "DNS Name": generate_dns_name(base_name=f"{vm_name.lower()}.internal") if power_state == "PoweredOn" else "",
         "IP Address": generate_ip_address() if power_state == "PoweredOn" else "",
-        "vCPU": context.get("profile_vcpu",random.choice([1, 2, 4, 8])),
-        "Memory MB": context.get("profile_memory_mb",random.choice([2048, 4096, 8192, 16384])),
+        "vCPU": context.get("profile_vcpu") or current_rng().choice(VM_VCPU_CHOICES),
+        "Memory MB": context.get("profile_memory_mb") or current_rng().choice(VM_MEMORY_MB_CHOICES),
         "Provisioned MB": provisioned_mb,
         "In Use MB": in_use_mb,
         "Annotation": f"Mock AI generated VM: {vm_name}" if generate_random_boolean(0.7) else ""
     }
 
 
-def generate_vinfo_row_ai(vm_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg, profile_data=None):
-    """Generates a single vInfo row, potentially using AI."""
+def _placement_context_json(context_for_ai):
+    """The entity's placement (host, cluster, folder, ...) as JSON for prompts with a {context} placeholder."""
+    return json.dumps({k: v for k, v in context_for_ai.items() if k not in _AI_CACHE_IGNORED_CONTEXT_KEYS and k != "context"}, default=str)
+
+def _vinfo_ai_request(vm_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg, profile_data=None):
+    """The _get_ai_data_for_entity arguments for one vInfo row; AI steps yield these."""
+    context_for_ai["context"] = _placement_context_json(context_for_ai) # Fills the template's {context}
     context_for_ai["vm_name_hint"] = vm_name_hint # Add the desired VM name to the context for the AI
     context_for_ai["headers"] = CSV_HEADERS["vInfo"] # Provide headers for context
     context_for_ai["profile_os_hints"] = profile_data.get("os_options") if profile_data else None
@@ -596,44 +2119,43 @@ def generate_vinfo_row_ai(vm_name_hint, context_for_ai, use_ai_cli_flag, ai_prov
     context_for_ai["profile_memory_mb"] = profile_data.get("memory_mb") if profile_data else None
 
 
-    ai_generated_data = _get_ai_data_for_entity(
-        VINFO_AI_PROMPT_TEMPLATE,
-        context_for_ai,
-        "vInfo",
-        f"vInfo for {vm_name_hint}",
-        use_ai_enabled_globally=use_ai_cli_flag,
-        ai_provider=ai_provider_cli_arg,
-        ollama_model_name_arg=context_for_ai.get('ollama_model_name_cli_arg', 'llama3'), # New
-        entity_specific_mock_func=_create_vinfo_mock_data
-    )
-    return ai_generated_data
+    return dict(prompt_template=VINFO_AI_PROMPT_TEMPLATE, context=context_for_ai, relevant_headers_key="vInfo",
+                entity_name_for_log=f"vInfo for {vm_name_hint}",
+                use_ai_enabled_globally=use_ai_cli_flag, ai_provider=ai_provider_cli_arg,
+                ollama_model_name_arg=context_for_ai.get('ollama_model_name_cli_arg', 'llama3'), entity_specific_mock_func=_create_vinfo_mock_data)
 
+def generate_vinfo_row_ai(vm_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg, profile_data=None):
+    """Generates a single vInfo row, potentially using AI."""
+    return _get_ai_data_for_entity(**_vinfo_ai_request(vm_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg, profile_data))
 
-def generate_vinfo_csv(num_vms, sdk_server_name, base_sdk_uuid, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name="llama3", scenario_config=None):
-    """Generates data for vInfo CSV, populating ENVIRONMENT_DATA."""
-    data = []
-    vms_generated_for_env = [] # Temp list for ENVIRONMENT_DATA["vms"]
 
+def _build_vinfo_topology(num_vms, sdk_server_name, base_sdk_uuid, complexity_params, scenario_config=None):
+    """Creates the datacenters, clusters, resource pools, hosts and local datastores VMs are placed on.
+
+    Clusters, hosts and datastores get their UUIDs here, so vHost, vHBA, vCluster and vDatastore read
+    the same value whichever of them runs first, in whatever thread or process.
+
+    Returns the VM deployment plan: a list of (count, segment) pairs in VM index order, where each
+    segment carries what _build_vm_record needs to place and shape the VMs in that run.
+    """
+    plan = []
     # Scenario-driven generation
     if scenario_config and scenario_config.get('datacenters'):
         print("Generating vInfo based on scenario config...")
-        vm_scenario_index = 0
         for dc_conf in scenario_config.get('datacenters', []):
             dc_name = dc_conf.get('name', generate_datacenter_name())
             dc_rec = {"name": dc_name, "clusters": [], "hosts": [], "datastores": [], "networks": [], "vms": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid}
-            ENVIRONMENT_DATA["datacenters"].append(dc_rec)
+            TOPOLOGY.add("datacenters", dc_rec)
 
             for cl_prof_name, cl_details in dc_conf.get('cluster_profiles', {}).items():
                 cl_name = f"{dc_name}-{cl_prof_name}" # e.g., DC1-ComputeHeavy
-                cl_rec = {"name": cl_name, "datacenter": dc_name, "hosts": [], "vms": [], "resource_pools": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid}
-                dc_rec["clusters"].append(cl_name)
-                ENVIRONMENT_DATA["clusters"].append(cl_rec)
+                cl_rec = {"name": cl_name, "datacenter": dc_name, "hosts": [], "vms": [], "resource_pools": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid, "uuid": generate_uuid()}
+                TOPOLOGY.add("clusters", cl_rec) # Also links into dc_rec["clusters"]
 
                 # Create default resource pool for cluster
                 default_rp_name = generate_resource_pool_name(cl_name, "Resources")
                 rp_rec = {"name": default_rp_name, "cluster": cl_name, "datacenter": dc_name, "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid}
-                ENVIRONMENT_DATA["resource_pools"].append(rp_rec)
-                cl_rec["resource_pools"].append(default_rp_name)
+                TOPOLOGY.add("resource_pools", rp_rec)
 
 
                 num_hosts_in_cluster = cl_details.get('num_hosts', complexity_params.get('default_hosts_per_cluster', 2))
@@ -643,7 +2165,7 @@ def generate_vinfo_csv(num_vms, sdk_server_name, base_sdk_uuid, complexity_param
                 for h_idx in range(num_hosts_in_cluster):
                     host_name = generate_host_name(dc_prefix=dc_name, cl_prefix=cl_prof_name, host_idx=h_idx + 1)
                     host_rec = {
-                        "name": host_name, "cluster": cl_name, "datacenter": dc_name,
+                        "name": host_name, "cluster": cl_name, "datacenter": dc_name, "uuid": generate_uuid(prefix=f"host-{host_name}-"),
                         "vms_on_host": [], "datastores_local": [], "networks": [],
                         "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid,
                         "profile_num_physical_nics": host_hardware_profile.get('num_physical_nics', 4),
@@ -651,9 +2173,7 @@ def generate_vinfo_csv(num_vms, sdk_server_name, base_sdk_uuid, complexity_param
                         "profile_hba_type_preference": host_hardware_profile.get('hba_type_preference'), # Added
                         "profile_num_hbas": host_hardware_profile.get('num_hbas') # Added
                     }
-                    dc_rec["hosts"].append(host_name)
-                    cl_rec["hosts"].append(host_name)
-                    ENVIRONMENT_DATA["hosts"].append(host_rec)
+                    TOPOLOGY.add("hosts", host_rec)
 
                     # Create local datastore for this host from scenario or default
                     local_ds_name = generate_datastore_name(host_name=host_name, ds_type="local", ds_idx=1)
@@ -661,95 +2181,20 @@ def generate_vinfo_csv(num_vms, sdk_server_name, base_sdk_uuid, complexity_param
                     local_ds_ssd = host_hardware_profile.get('local_storage_ssd', True)
                     ds_rec = {"name": local_ds_name, "type": "VMFS", "capacity_mb": local_ds_capacity,
                               "free_mb_percent": generate_random_float(0.2,0.8), "is_local": True, "ssd": local_ds_ssd,
-                              "hosts_connected": [host_name], "datacenter": dc_name, "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid}
-                    ENVIRONMENT_DATA["datastores"].append(ds_rec)
+                              "hosts_connected": [host_name], "datacenter": dc_name, "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid, "uuid": generate_uuid()}
+                    TOPOLOGY.add("datastores", ds_rec)
                     host_rec["datastores_local"].append(local_ds_name)
-                    dc_rec["datastores"].append(local_ds_name)
 
 
             # VM Deployment Plan
             for vm_depl_plan in dc_conf.get('deployment_plan', []):
                 vm_prof_name = vm_depl_plan.get('profile_name')
-                vm_profile = scenario_config.get('vm_profiles', {}).get(vm_prof_name, {})
-                count = vm_depl_plan.get('count', 1)
                 target_cluster_prof_name = vm_depl_plan.get('target_cluster_profile', list(dc_conf['cluster_profiles'].keys())[0]) # Default to first cluster profile
-
-                for _ in range(count):
-                    vm_name = generate_vm_name(profile_vm_name_prefix=vm_profile.get('name_prefix', 'vm'), scenario_vm_index=vm_scenario_index)
-                    vm_scenario_index +=1
-
-                    assigned_host_rec = choose_randomly_from_list([h for h in ENVIRONMENT_DATA["hosts"] if h["cluster"].endswith(target_cluster_prof_name) and h["datacenter"] == dc_name])
-                    assigned_host_name = assigned_host_rec.get("name", "N/A_Host_Scenario")
-                    assigned_cluster_name = assigned_host_rec.get("cluster", f"{dc_name}-{target_cluster_prof_name}")
-
-                    # Folder (simple for now, could be part of profile)
-                    folder_name = generate_folder_name(base=vm_profile.get('folder_base', "VMs"))
-                    if not any(f.get("name") == folder_name and f.get("datacenter") == dc_name for f in ENVIRONMENT_DATA.get("folders",[])):
-                        ENVIRONMENT_DATA.setdefault("folders", []).append({"name": folder_name, "datacenter": dc_name})
-
-                    # Resource Pool (use cluster's default for now)
-                    rp_name = generate_resource_pool_name(assigned_cluster_name, "Resources")
-
-
-                    # AI or Mock data generation for this VM
-                    vm_context = {
-                        "sdk_server_name": sdk_server_name, "base_sdk_uuid": base_sdk_uuid,
-                        "assigned_host_name": assigned_host_name, "assigned_cluster_name": assigned_cluster_name,
-                        "assigned_datacenter_name": dc_name, "folder_name": folder_name, "rp_name": rp_name,
-                        "vm_profile_name": vm_prof_name,
-                        "use_ai_cli_flag": use_ai_cli_flag, # Pass through CLI flags
-                        "ai_provider_cli_arg": ai_provider_cli_arg,
-                        "ollama_model_name_cli_arg": ollama_model_name
-                    }
-                    ai_data = generate_vinfo_row_ai(vm_name, vm_context, use_ai_cli_flag, ai_provider_cli_arg, profile_data=vm_profile)
-
-                    row = {header: "" for header in CSV_HEADERS["vInfo"]}
-                    row.update({
-                        "VM Name": ai_data.get("VM Name", vm_name),
-                        "Powerstate": ai_data.get("Powerstate", "PoweredOff"),
-                        "Template": vm_profile.get('is_template', False),
-                        "OS according to VMWare": ai_data.get("OS according to VMWare", generate_os_name(vm_profile.get('os_options'))),
-                        "DNS Name": ai_data.get("DNS Name", ""),
-                        "IP Address": ai_data.get("IP Address", ""),
-                        "vCPU": int(ai_data.get("vCPU", vm_profile.get('vcpu', complexity_params['default_vcpu']))),
-                        "Memory MB": int(ai_data.get("Memory MB", vm_profile.get('memory_mb', complexity_params['default_memory_mb']))),
-                        "Provisioned MB": int(ai_data.get("Provisioned MB", generate_random_integer(20480, 204800))),
-                        "In Use MB": int(ai_data.get("In Use MB", 0)),
-                        "Annotation": ai_data.get("Annotation", ""),
-                        "Host": assigned_host_name,
-                        "Cluster": assigned_cluster_name,
-                        "Datacenter": dc_name,
-                        "Pool": rp_name,
-                        "Folder": folder_name,
-                        "VI SDK Server": sdk_server_name,
-                        "VI SDK UUID": base_sdk_uuid,
-                        "VM UUID": generate_uuid(prefix=vm_profile.get('uuid_prefix', '')),
-                        "VM Version": random.choice(["vSphere vCenter 8.0", "vSphere vCenter 7.0 U3"]),
-                        "NICs": len(vm_profile.get('nics', [{'adapter_type': 'VMXNET3'}])), # Count based on profile
-                        "Disks": len(vm_profile.get('disks', [{'size_gb': 50, 'thin_provisioned': True}])), # Count based on profile
-                        "Creation date": generate_random_date("2021-01-01", "2023-06-01"),
-                        "VM Folder Path": f"/{dc_name}/vm/{folder_name}/",
-                        "VM Guest ID": ai_data.get("OS according to VMWare", "").lower().replace(" ", "-")
-                    })
-                    data.append([row.get(header, "") for header in CSV_HEADERS["vInfo"]])
-
-                    # Store for ENVIRONMENT_DATA
-                    vm_rec_env = {
-                        "name": row["VM Name"], "uuid": row["VM UUID"], "power_state": row["Powerstate"],
-                        "is_template": row["Template"], "host": row["Host"], "cluster": row["Cluster"],
-                        "datacenter": row["Datacenter"], "folder": row["Folder"], "resource_pool": row["Pool"],
-                        "os": row["OS according to VMWare"], "ip_address": row["IP Address"], "dns_name": row["DNS Name"],
-                        "num_cpu": row["vCPU"], "memory_mb": row["Memory MB"], "num_nics": row["NICs"], "num_disks": row["Disks"],
-                        "provisioned_mb": row["Provisioned MB"], "in_use_mb": row["In Use MB"],
-                        "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid,
-                        "profile_nics": vm_profile.get('nics'), # Store NIC profile for vNetwork
-                        "profile_disks": vm_profile.get('disks'), # Store Disk profile for vDisk
-                        "profile_feature_likelihoods": vm_profile.get('feature_likelihoods', {}) # For snapshots, etc.
-                    }
-                    vms_generated_for_env.append(vm_rec_env)
-                    assigned_host_rec["vms_on_host"].append(vm_name)
-                    cl_rec["vms"].append(vm_name)
-                    dc_rec["vms"].append(vm_name)
+                plan.append((vm_depl_plan.get('count', 1), {
+                    "datacenter": dc_name, "vm_profile_name": vm_prof_name,
+                    "vm_profile": scenario_config.get('vm_profiles', {}).get(vm_prof_name, {}),
+                    "target_cluster": f"{dc_name}-{target_cluster_prof_name}",
+                }))
 
     else: # Random generation if no scenario
         print(f"Generating {num_vms} vInfo entries randomly...")
@@ -758,96 +2203,236 @@ def generate_vinfo_csv(num_vms, sdk_server_name, base_sdk_uuid, complexity_param
         # Create a default DC and Cluster if they don't exist from a scenario
         if not ENVIRONMENT_DATA.get("datacenters"):
             dc_name = generate_datacenter_name()
-            ENVIRONMENT_DATA["datacenters"].append({"name": dc_name, "clusters": [], "hosts": [], "datastores": [], "networks": [], "vms": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid})
+            TOPOLOGY.add("datacenters", {"name": dc_name, "clusters": [], "hosts": [], "datastores": [], "networks": [], "vms": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid})
         if not ENVIRONMENT_DATA.get("clusters"):
             cl_name = generate_cluster_name(dc_prefix=ENVIRONMENT_DATA["datacenters"][0]["name"])
-            ENVIRONMENT_DATA["clusters"].append({"name": cl_name, "datacenter": ENVIRONMENT_DATA["datacenters"][0]["name"], "hosts": [], "vms": [], "resource_pools": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid})
-            ENVIRONMENT_DATA["datacenters"][0]["clusters"].append(cl_name)
+            TOPOLOGY.add("clusters", {"name": cl_name, "datacenter": ENVIRONMENT_DATA["datacenters"][0]["name"], "hosts": [], "vms": [], "resource_pools": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid, "uuid": generate_uuid()})
             # Default RP for this cluster
             default_rp_name = generate_resource_pool_name(cl_name, "Resources")
-            ENVIRONMENT_DATA["resource_pools"].append({"name": default_rp_name, "cluster": cl_name, "datacenter": ENVIRONMENT_DATA["datacenters"][0]["name"], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid})
+            TOPOLOGY.add("resource_pools", {"name": default_rp_name, "cluster": cl_name, "datacenter": ENVIRONMENT_DATA["datacenters"][0]["name"], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid})
 
         if not ENVIRONMENT_DATA.get("hosts"):
             num_random_hosts = max(1, num_vms // complexity_params.get('vms_per_host_random', 20))
             for i in range(num_random_hosts):
                 host_name = generate_host_name(dc_prefix=ENVIRONMENT_DATA["clusters"][0]['datacenter'], cl_prefix=ENVIRONMENT_DATA["clusters"][0]['name'], host_idx=i + 1)
-                host_rec = {"name": host_name, "cluster": ENVIRONMENT_DATA["clusters"][0]['name'], "datacenter": ENVIRONMENT_DATA["clusters"][0]['datacenter'], "vms_on_host": [], "datastores_local": [], "networks": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid}
-                ENVIRONMENT_DATA["hosts"].append(host_rec)
-                ENVIRONMENT_DATA["clusters"][0]["hosts"].append(host_name)
-                ENVIRONMENT_DATA["datacenters"][0]["hosts"].append(host_name)
+                host_rec = {"name": host_name, "cluster": ENVIRONMENT_DATA["clusters"][0]['name'], "datacenter": ENVIRONMENT_DATA["clusters"][0]['datacenter'], "uuid": generate_uuid(prefix=f"host-{host_name}-"), "vms_on_host": [], "datastores_local": [], "networks": [], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid}
+                TOPOLOGY.add("hosts", host_rec)
                 # Add local datastore
                 ds_name = generate_datastore_name(host_name=host_name, ds_type="local")
-                ENVIRONMENT_DATA["datastores"].append({"name": ds_name, "type": "VMFS", "capacity_mb": generate_random_integer(200000,1000000), "free_mb_percent":0.3, "is_local":True, "hosts_connected":[host_name], "datacenter": host_rec["datacenter"], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid})
+                TOPOLOGY.add("datastores", {"name": ds_name, "type": "VMFS", "capacity_mb": generate_random_integer(200000,1000000), "free_mb_percent":0.3, "is_local":True, "hosts_connected":[host_name], "datacenter": host_rec["datacenter"], "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid, "uuid": generate_uuid()})
                 host_rec["datastores_local"].append(ds_name)
 
 
-        vm_iterator = tqdm(range(num_vms), desc="Generating vInfo (Random)") if TQDM_AVAILABLE else range(num_vms)
-        for i in vm_iterator:
-            vm_name = generate_vm_name()
-            # Simplified assignment for random VMs
-            assigned_host_rec = choose_randomly_from_list(ENVIRONMENT_DATA["hosts"])
-            assigned_host_name = assigned_host_rec.get("name", "RandomHost")
-            assigned_cluster_name = assigned_host_rec.get("cluster", "RandomCluster")
-            assigned_datacenter_name = assigned_host_rec.get("datacenter", "RandomDC")
-            folder_name = generate_folder_name()
-            if not any(f.get("name") == folder_name and f.get("datacenter") == assigned_datacenter_name for f in ENVIRONMENT_DATA.get("folders",[])):
-                ENVIRONMENT_DATA.setdefault("folders", []).append({"name": folder_name, "datacenter": assigned_datacenter_name})
-            rp_name = choose_randomly_from_list([rp['name'] for rp in ENVIRONMENT_DATA.get("resource_pools",[]) if rp['cluster']==assigned_cluster_name], default_value=generate_resource_pool_name(assigned_cluster_name,"Resources"))
-
-
-            vm_context = {
-                "sdk_server_name": sdk_server_name, "base_sdk_uuid": base_sdk_uuid,
-                "assigned_host_name": assigned_host_name, "assigned_cluster_name": assigned_cluster_name,
-                "assigned_datacenter_name": assigned_datacenter_name, "folder_name": folder_name, "rp_name": rp_name,
-                "use_ai_cli_flag": use_ai_cli_flag, # Pass through CLI flags
-                "ai_provider_cli_arg": ai_provider_cli_arg,
-                "ollama_model_name_cli_arg": ollama_model_name
-            }
-            ai_data = generate_vinfo_row_ai(vm_name, vm_context, use_ai_cli_flag, ai_provider_cli_arg) # profile_data is None here
-
-            row = {header: "" for header in CSV_HEADERS["vInfo"]}
-            row.update({
-                "VM Name": ai_data.get("VM Name", vm_name),
-                "Powerstate": ai_data.get("Powerstate", "PoweredOff"),
-                "Template": False,
-                "OS according to VMWare": ai_data.get("OS according to VMWare", generate_os_name()),
-                "DNS Name": ai_data.get("DNS Name", ""),
-                "IP Address": ai_data.get("IP Address", ""),
-                "vCPU": int(ai_data.get("vCPU", complexity_params['default_vcpu'])),
-                "Memory MB": int(ai_data.get("Memory MB", complexity_params['default_memory_mb'])),
-                "Provisioned MB": int(ai_data.get("Provisioned MB", generate_random_integer(20480, 204800))),
-                "In Use MB": int(ai_data.get("In Use MB", 0)),
-                "Annotation": ai_data.get("Annotation", ""),
-                "Host": assigned_host_name, "Cluster": assigned_cluster_name, "Datacenter": assigned_datacenter_name,
-                "Pool": rp_name, "Folder": folder_name,
-                "VI SDK Server": sdk_server_name, "VI SDK UUID": base_sdk_uuid,
-                "VM UUID": generate_uuid(),
-                "VM Version": random.choice(["vSphere vCenter 8.0", "vSphere vCenter 7.0 U3"]),
-                "NICs": generate_random_integer(complexity_params['min_nics_per_vm'], complexity_params['max_nics_per_vm']),
-                "Disks": generate_random_integer(complexity_params['min_disks_per_vm'], complexity_params['max_disks_per_vm']),
-                "Creation date": generate_random_date("2021-01-01", "2023-06-01"),
-                "VM Folder Path": f"/{assigned_datacenter_name}/vm/{folder_name}/",
-                "VM Guest ID": ai_data.get("OS according to VMWare", "").lower().replace(" ", "-")
-            })
-            data.append([row.get(header, "") for header in CSV_HEADERS["vInfo"]])
-            # Store for ENVIRONMENT_DATA
-            vm_rec_env = {key.lower().replace(" ", "_"): val for key, val in row.items()} # Basic conversion
-            vm_rec_env.update({ # ensure specific keys are present
-                "name": row["VM Name"], "uuid": row["VM UUID"], "power_state": row["Powerstate"],
-                "is_template": row["Template"], "host": row["Host"], "cluster": row["Cluster"],
-                "datacenter": row["Datacenter"], "folder": row["Folder"], "resource_pool": row["Pool"],
-                "os": row["OS according to VMWare"], "ip_address": row["IP Address"], "dns_name": row["DNS Name"],
-                "num_cpu": row["vCPU"], "memory_mb": row["Memory MB"], "num_nics": row["NICs"], "num_disks": row["Disks"],
-                "provisioned_mb": row["Provisioned MB"], "in_use_mb": row["In Use MB"],
-                "sdk_server": sdk_server_name, "sdk_uuid": base_sdk_uuid
-            })
-            vms_generated_for_env.append(vm_rec_env)
-            if assigned_host_rec: # Check if a host was actually found/assigned
-                assigned_host_rec.setdefault("vms_on_host", []).append(vm_name)
+        plan.append((num_vms, None))
+    return plan
+
+# --- Topology Planning ---
+# Everything a VM or a table row can be attached to is created here, once, right after the datacenters,
+# clusters, resource pools, hosts and datastores and before any VM is built: a standard vSwitch0 per
+# host, the distributed switches, each datacenter's port groups and its VM folders. VM records and row
+# generators only pick from these records, so the table tasks never add to ENVIRONMENT_DATA and can run
+# in any order, thread or process.
+def _plan_port_group(name, dc_rec, nic_profile, complexity_params):
+    """Adds port group name to dc_rec (and the distributed switch it lives on) unless it exists."""
+    if TOPOLOGY.find("networks", name) is not None:
+        return
+    sdk = {"sdk_server": dc_rec.get("sdk_server"), "sdk_uuid": dc_rec.get("sdk_uuid")}
+    dvs_profile = nic_profile.get("dvs_switch_name")
+    if dvs_profile or (dvs_profile is not False and generate_random_boolean(complexity_params.get('dvs_likelihood', 0.3))):
+        switch_name, network_type = dvs_profile or f"DVS_{dc_rec['name']}", "DVPortGroup"
+        if TOPOLOGY.find("dvSwitches", switch_name) is None:
+            TOPOLOGY.add("dvSwitches", {"name": switch_name, "datacenter": dc_rec["name"], "uuid": generate_uuid(), **sdk})
+    else:
+        switch_name, network_type = "vSwitch0", "PortGroup" # Standard port groups exist on every host's vSwitch0
+    TOPOLOGY.add("networks", {"name": name, "type": network_type, "switch_name": switch_name, "vlan_id": nic_profile.get("vlan_id", generate_random_integer(10, 100)),
+                              "datacenter": dc_rec["name"], **sdk})
+
+def plan_network_topology(plan, complexity_params):
+    """Creates the switches, port groups and folders of every datacenter for the VM deployment plan.
+
+    Scenario NIC profiles contribute their network_label_hint port groups; each datacenter is topped
+    up to networks_per_datacenter port groups and folders_per_datacenter folders per folder_base.
+    Runs on its own RNG stream and only adds what is missing, so calling it again is harmless.
+    """
+    with use_rng_stream("topology", "plan"):
+        for dc_rec in list(ENVIRONMENT_DATA["datacenters"]):
+            dc_name = dc_rec["name"]
+            profiles = [segment["vm_profile"] for _, segment in plan if segment is not None and segment["datacenter"] == dc_name]
+            for host_rec in TOPOLOGY.members("hosts", "datacenter", dc_name):
+                TOPOLOGY.add_if_absent("vswitches", {"name": f"vSwitch0_{host_rec['name']}", "host": host_rec["name"], "type": "Standard", "datacenter": dc_name})
+
+            for nic_profile in (nic for profile in profiles for nic in profile.get('nics') or []):
+                if nic_profile.get("network_label_hint"):
+                    _plan_port_group(nic_profile["network_label_hint"], dc_rec, nic_profile, complexity_params)
+            while TOPOLOGY.count("networks", "datacenter", dc_name) < complexity_params.get('networks_per_datacenter', 4):
+                _plan_port_group(generate_network_name(), dc_rec, {}, complexity_params)
+
+            for folder_base in dict.fromkeys([profile.get('folder_base', "VMs") for profile in profiles] or ["VMs"]):
+                while len(planned_folders(dc_name, folder_base)) < complexity_params.get('folders_per_datacenter', 3):
+                    TOPOLOGY.add_if_absent("folders", {"name": generate_folder_name(base=folder_base), "datacenter": dc_name, "base": folder_base})
+
+def planned_folders(dc_name, folder_base="VMs"):
+    """Names of the folders planned in dc_name for folder_base."""
+    return [folder["name"] for folder in TOPOLOGY.members("folders", "datacenter", dc_name) if folder.get("base") == folder_base]
+
+def planned_networks(dc_name):
+    """Names of the port groups planned in dc_name."""
+    return [net["name"] for net in TOPOLOGY.members("networks", "datacenter", dc_name)]
+
+def nic_switch_name(net_rec, host_name):
+    """The switch a NIC on host_name reaches port group net_rec through: its distributed switch, else the host's vSwitch0."""
+    if net_rec is not None and net_rec.get("type") == "DVPortGroup":
+        return net_rec.get("switch_name")
+    return f"vSwitch0_{host_name or 'DefaultHost'}"
+
+def _iter_vm_plan(plan, start=0, end=None):
+    """Yields (vm_index, segment) for the VM indexes in [start, end) of a deployment plan."""
+    offset = 0
+    for count, segment in plan:
+        lo, hi = max(start, offset), offset + count if end is None else min(end, offset + count)
+        for vm_index in range(lo, hi):
+            yield vm_index, segment
+        offset += count
+
+def _build_vm_record(vm_index, segment, sdk_server_name, base_sdk_uuid, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name="llama3"):
+    """Builds the ENVIRONMENT_DATA record (from which the vInfo row is emitted) for one planned VM."""
+    return run_ai_steps(_vm_record_steps(vm_index, segment, sdk_server_name, base_sdk_uuid, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name))
+
+def _vm_record_steps(vm_index, segment, sdk_server_name, base_sdk_uuid, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name="llama3"):
+    """AI steps (see iter_ai_units) building one planned VM's record; returns the record."""
+    if segment is not None: # Scenario VM; the plan index doubles as the scenario VM index
+        dc_name = segment["datacenter"]
+        vm_prof_name = segment["vm_profile_name"]
+        vm_profile = segment["vm_profile"]
+        vm_name = generate_vm_name(profile_vm_name_prefix=vm_profile.get('name_prefix', 'vm'), scenario_vm_index=vm_index)
+
+        assigned_host_rec = choose_randomly_from_list(TOPOLOGY.members("hosts", "cluster", segment["target_cluster"]), default_value={})
+        assigned_host_name = assigned_host_rec.get("name", "N/A_Host_Scenario")
+        assigned_cluster_name = assigned_host_rec.get("cluster", segment["target_cluster"])
+
+        # Folder from the ones planned for this profile's folder_base
+        folder_base = vm_profile.get('folder_base', "VMs")
+        folder_name = choose_randomly_from_list(planned_folders(dc_name, folder_base), default_value=None) or generate_folder_name(base=folder_base)
+
+        # Resource Pool (use cluster's default for now)
+        rp_name = generate_resource_pool_name(assigned_cluster_name, "Resources")
+
+        # AI or Mock data generation for this VM
+        vm_context = {
+            "sdk_server_name": sdk_server_name, "base_sdk_uuid": base_sdk_uuid,
+            "assigned_host_name": assigned_host_name, "assigned_cluster_name": assigned_cluster_name,
+            "assigned_datacenter_name": dc_name, "folder_name": folder_name, "rp_name": rp_name,
+            "vm_profile_name": vm_prof_name,
+            "use_ai_cli_flag": use_ai_cli_flag, # Pass through CLI flags
+            "ai_provider_cli_arg": ai_provider_cli_arg,
+            "ollama_model_name_cli_arg": ollama_model_name
+        }
+        ai_data = yield _vinfo_ai_request(vm_name, vm_context, use_ai_cli_flag, ai_provider_cli_arg, profile_data=vm_profile)
 
-    ENVIRONMENT_DATA["vms"].extend(vms_generated_for_env)
-    write_csv(data, "vInfo", CSV_HEADERS["vInfo"])
-    print(f"vInfo CSV generated with {len(data)} VMs. ENVIRONMENT_DATA updated.")
+        row = {header: "" for header in CSV_HEADERS["vInfo"]}
+        row.update({
+            "VM Name": ai_data.get("VM Name", vm_name),
+            "Powerstate": ai_data.get("Powerstate", "PoweredOff"),
+            "Template": vm_profile.get('is_template', False),
+            "OS according to VMWare": ai_data.get("OS according to VMWare", generate_os_name(vm_profile.get('os_options'))),
+            "DNS Name": ai_data.get("DNS Name", ""),
+            "IP Address": ai_data.get("IP Address", ""),
+            "vCPU": int(ai_data.get("vCPU", vm_profile.get('vcpu', complexity_params['default_vcpu']))),
+            "Memory MB": int(ai_data.get("Memory MB", vm_profile.get('memory_mb', complexity_params['default_memory_mb']))),
+            "Provisioned MB": int(ai_data.get("Provisioned MB", generate_random_integer(20480, 204800))),
+            "In Use MB": int(ai_data.get("In Use MB", 0)),
+            "Annotation": ai_data.get("Annotation", ""),
+            "Host": assigned_host_name,
+            "Cluster": assigned_cluster_name,
+            "Datacenter": dc_name,
+            "Pool": rp_name,
+            "Folder": folder_name,
+            "VI SDK Server": sdk_server_name,
+            "VI SDK UUID": base_sdk_uuid,
+            "VM UUID": generate_uuid(prefix=vm_profile.get('uuid_prefix', '')),
+            "VM Version": current_rng().choice(VM_VERSION_CHOICES),
+            "NICs": len(vm_profile.get('nics', [{'adapter_type': 'VMXNET3'}])), # Count based on profile
+            "Disks": len(vm_profile.get('disks', [{'size_gb': 50, 'thin_provisioned': True}])), # Count based on profile
+            "Creation date": generate_random_date("2021-01-01", "2023-06-01"),
+            "VM Folder Path": f"/{dc_name}/vm/{folder_name}/",
+            "VM Guest ID": ai_data.get("OS according to VMWare", "").lower().replace(" ", "-")
+        })
+
+        # Store for ENVIRONMENT_DATA; the vInfo row itself is re-emitted from this record
+        vm_rec_env = _vm_record_from_vinfo_row(row)
+        vm_rec_env.update({
+            "profile_nics": vm_profile.get('nics'), # Store NIC profile for vNetwork
+            "profile_disks": vm_profile.get('disks'), # Store Disk profile for vDisk
+            "profile_feature_likelihoods": vm_profile.get('feature_likelihoods', {}) # For snapshots, etc.
+        })
+        return vm_rec_env
+
+    vm_name = generate_vm_name()
+    # Simplified assignment for random VMs
+    assigned_host_rec = choose_randomly_from_list(ENVIRONMENT_DATA["hosts"])
+    assigned_host_name = assigned_host_rec.get("name", "RandomHost")
+    assigned_cluster_name = assigned_host_rec.get("cluster", "RandomCluster")
+    assigned_datacenter_name = assigned_host_rec.get("datacenter", "RandomDC")
+    folder_name = choose_randomly_from_list(planned_folders(assigned_datacenter_name), default_value=None) or generate_folder_name()
+    rp_name = choose_randomly_from_list([rp['name'] for rp in TOPOLOGY.members("resource_pools", "cluster", assigned_cluster_name)], default_value=generate_resource_pool_name(assigned_cluster_name,"Resources"))
+
+    vm_context = {
+        "sdk_server_name": sdk_server_name, "base_sdk_uuid": base_sdk_uuid,
+        "assigned_host_name": assigned_host_name, "assigned_cluster_name": assigned_cluster_name,
+        "assigned_datacenter_name": assigned_datacenter_name, "folder_name": folder_name, "rp_name": rp_name,
+        "use_ai_cli_flag": use_ai_cli_flag, # Pass through CLI flags
+        "ai_provider_cli_arg": ai_provider_cli_arg,
+        "ollama_model_name_cli_arg": ollama_model_name
+    }
+    ai_data = yield _vinfo_ai_request(vm_name, vm_context, use_ai_cli_flag, ai_provider_cli_arg) # profile_data is None here
+
+    row = {header: "" for header in CSV_HEADERS["vInfo"]}
+    row.update({
+        "VM Name": ai_data.get("VM Name", vm_name),
+        "Powerstate": ai_data.get("Powerstate", "PoweredOff"),
+        "Template": False,
+        "OS according to VMWare": ai_data.get("OS according to VMWare", generate_os_name()),
+        "DNS Name": ai_data.get("DNS Name", ""),
+        "IP Address": ai_data.get("IP Address", ""),
+        "vCPU": int(ai_data.get("vCPU", complexity_params['default_vcpu'])),
+        "Memory MB": int(ai_data.get("Memory MB", complexity_params['default_memory_mb'])),
+        "Provisioned MB": int(ai_data.get("Provisioned MB", generate_random_integer(20480, 204800))),
+        "In Use MB": int(ai_data.get("In Use MB", 0)),
+        "Annotation": ai_data.get("Annotation", ""),
+        "Host": assigned_host_name, "Cluster": assigned_cluster_name, "Datacenter": assigned_datacenter_name,
+        "Pool": rp_name, "Folder": folder_name,
+        "VI SDK Server": sdk_server_name, "VI SDK UUID": base_sdk_uuid,
+        "VM UUID": generate_uuid(),
+        "VM Version": current_rng().choice(VM_VERSION_CHOICES),
+        "NICs": generate_random_integer(complexity_params['min_nics_per_vm'], complexity_params['max_nics_per_vm']),
+        "Disks": generate_random_integer(complexity_params['min_disks_per_vm'], complexity_params['max_disks_per_vm']),
+        "Creation date": generate_random_date("2021-01-01", "2023-06-01"),
+        "VM Folder Path": f"/{assigned_datacenter_name}/vm/{folder_name}/",
+        "VM Guest ID": ai_data.get("OS according to VMWare", "").lower().replace(" ", "-")
+    })
+    # Store for ENVIRONMENT_DATA; the vInfo row itself is re-emitted from this record
+    vm_rec_env = _vm_record_from_vinfo_row(row)
+    return vm_rec_env
+
+
+def generate_vinfo_csv(num_vms, sdk_server_name, base_sdk_uuid, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name="llama3", scenario_config=None):
+    """Generates data for vInfo CSV, populating ENVIRONMENT_DATA."""
+    first_new_vm = len(ENVIRONMENT_DATA["vms"])
+    plan = _build_vinfo_topology(num_vms, sdk_server_name, base_sdk_uuid, complexity_params, scenario_config)
+    plan_network_topology(plan, complexity_params)
+    ENVIRONMENT_DATA["vm_plan"] = plan
+    total_planned = sum(count for count, _ in plan)
+
+    vm_iterator = tqdm(_iter_vm_plan(plan), total=total_planned, desc="Generating vInfo") if TQDM_AVAILABLE else _iter_vm_plan(plan)
+    # Each VM on its own stream: same VM for the same seed, however the plan is sharded
+    units = ((_vm_record_steps(vm_index, segment, sdk_server_name, base_sdk_uuid, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), rng_stream("vm", vm_index))
+             for vm_index, segment in vm_iterator)
+    for vm_rec_env in iter_ai_units(units, use_ai_cli_flag, ai_provider_cli_arg):
+        TOPOLOGY.add("vms", vm_rec_env) # Links the VM into its host, cluster and datacenter
+
+    new_vms = ENVIRONMENT_DATA["vms"][first_new_vm:]
+    write_csv((_vinfo_row_from_vm_record(vm_rec) for vm_rec in new_vms), "vInfo", CSV_HEADERS["vInfo"])
+    print(f"vInfo CSV generated with {len(new_vms)} VMs. ENVIRONMENT_DATA updated.")
 
 # --- vDisk AI Row and Mock ---
 def _create_vdisk_mock_data(context):
@@ -860,14 +2445,14 @@ def _create_vdisk_mock_data(context):
         "Capacity MB": capacity_mb,
         "Disk Mode": "persistent",
         "Thin": thin_provisioned,
-        "Controller": random.choice(["SCSI controller 0", "NVMe controller 0"]),
+        "Controller": current_rng().choice(["SCSI controller 0", "NVMe controller 0"]),
         "Path": f"[{context.get('datastore_name', 'ds_mock')}] {context.get('vm_name', 'vm_mock')}/{context.get('vm_name', 'vm_mock')}_{context.get('disk_index', 0)}.vmdk",
         # These fields are part of vDisk but not directly asked from AI in the example prompt, filled by caller:
         # "VM Name": context.get('vm_name'), "Powerstate": context.get('power_state'), "Datastore": context.get('datastore_name')
     }
 
-def generate_vdisk_row_ai(vm_r_context_for_ai, disk_index, disk_label, datastore_name, disk_profile_data):
-    """Generates a single vDisk row, potentially using AI."""
+def _vdisk_ai_request(vm_r_context_for_ai, disk_index, disk_label, datastore_name, disk_profile_data):
+    """The _get_ai_data_for_entity arguments for one vDisk row; AI steps yield these."""
     prompt_context = {
         "vm_name": vm_r_context_for_ai.get("name"),
         "power_state": vm_r_context_for_ai.get("power_state"),
@@ -883,74 +2468,81 @@ def generate_vdisk_row_ai(vm_r_context_for_ai, disk_index, disk_label, datastore
     }
     # column_details_block will be added by _get_ai_data_for_entity
 
-    ai_generated_data = _get_ai_data_for_entity(
-        VDISK_AI_PROMPT_TEMPLATE,
-        prompt_context,
-        "vDisk",
-        f"vDisk {disk_label} for {vm_r_context_for_ai.get('name', 'UnknownVM')}",
-        use_ai_enabled_globally=prompt_context['use_ai_cli_flag'],
-        ai_provider=prompt_context['ai_provider_cli_arg'],
-        ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'],
-        entity_specific_mock_func=_create_vdisk_mock_data
-    )
-    return ai_generated_data
+    return dict(prompt_template=VDISK_AI_PROMPT_TEMPLATE, context=prompt_context, relevant_headers_key="vDisk",
+                entity_name_for_log=f"vDisk {disk_label} for {vm_r_context_for_ai.get('name', 'UnknownVM')}",
+                use_ai_enabled_globally=prompt_context['use_ai_cli_flag'], ai_provider=prompt_context['ai_provider_cli_arg'],
+                ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'], entity_specific_mock_func=_create_vdisk_mock_data)
 
-def generate_vdisk_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    if not ENVIRONMENT_DATA.get("vms"): return
-    data = []
-    vm_iterator = tqdm(ENVIRONMENT_DATA["vms"], desc="Generating vDisk") if TQDM_AVAILABLE else ENVIRONMENT_DATA["vms"]
-
-    for vm_rec in vm_iterator:
-        num_disks_for_vm = vm_rec.get("num_disks", 1)
-        profile_disks_data = vm_rec.get("profile_disks")
-
-        vm_r_context_for_ai = {**vm_rec} # Make a copy to pass CLI args for AI
-        vm_r_context_for_ai['use_ai_cli_flag'] = use_ai_cli_flag
-        vm_r_context_for_ai['ai_provider_cli_arg'] = ai_provider_cli_arg
-        vm_r_context_for_ai['ollama_model_name_cli_arg'] = ollama_model_name
-
-
-        for disk_idx_loop in range(1, num_disks_for_vm + 1):
-            disk_label = f"Hard disk {disk_idx_loop}"
-            disk_profile = profile_disks_data[disk_idx_loop-1] if profile_disks_data and disk_idx_loop <= len(profile_disks_data) else {}
-
-            # Datastore selection logic (remains mostly the same)
-            datastore_name = disk_profile.get('datastore_name_hint', "Unknown_DS") # Prefer profile hint
-            if datastore_name == "Unknown_DS" and disk_profile.get('datastore_tag'):
-                ds_tag = disk_profile.get('datastore_tag')
-                tagged_ds = [ds['name'] for ds in ENVIRONMENT_DATA.get("datastores", []) if ds_tag.lower() in ds['name'].lower()]
-                if tagged_ds: datastore_name = choose_randomly_from_list(tagged_ds)
-
-            if datastore_name == "Unknown_DS": # Fallback logic
-                assigned_host_rec = next((h for h in ENVIRONMENT_DATA.get("hosts", []) if h["name"] == vm_rec.get("host")), None)
-                ds_options = [ds_loc for ds_loc in assigned_host_rec.get("datastores_local", [])] if assigned_host_rec else []
-                shared_ds = [ds["name"] for ds in ENVIRONMENT_DATA.get("datastores", []) if not ds.get("is_local") and ds.get("datacenter") == vm_rec.get("datacenter")]
-                ds_options.extend(shared_ds)
-                if not ds_options: ds_options.append(generate_datastore_name(ds_type="fallback", ds_idx=vm_rec.get("uuid","vm")[:4]))
-                datastore_name = choose_randomly_from_list(ds_options, "Critical_Fallback_DS")
+def generate_vdisk_row_ai(vm_r_context_for_ai, disk_index, disk_label, datastore_name, disk_profile_data):
+    """Generates a single vDisk row, potentially using AI."""
+    return _get_ai_data_for_entity(**_vdisk_ai_request(vm_r_context_for_ai, disk_index, disk_label, datastore_name, disk_profile_data))
+
+def _vdisk_rows_steps(vm_rec, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name):
+    """AI steps (see iter_ai_units) building the vDisk rows of one VM; returns the rows."""
+    rows = []
+    num_disks_for_vm = vm_rec.get("num_disks", 1)
+    profile_disks_data = vm_rec.get("profile_disks")
+
+    vm_r_context_for_ai = {**vm_rec} # Make a copy to pass CLI args for AI
+    vm_r_context_for_ai['use_ai_cli_flag'] = use_ai_cli_flag
+    vm_r_context_for_ai['ai_provider_cli_arg'] = ai_provider_cli_arg
+    vm_r_context_for_ai['ollama_model_name_cli_arg'] = ollama_model_name
+
+
+    for disk_idx_loop in range(1, num_disks_for_vm + 1):
+        disk_label = f"Hard disk {disk_idx_loop}"
+        disk_profile = profile_disks_data[disk_idx_loop-1] if profile_disks_data and disk_idx_loop <= len(profile_disks_data) else {}
+
+        # Datastore selection logic (remains mostly the same)
+        datastore_name = disk_profile.get('datastore_name_hint', "Unknown_DS") # Prefer profile hint
+        if datastore_name == "Unknown_DS" and disk_profile.get('datastore_tag'):
+            ds_tag = disk_profile.get('datastore_tag')
+            tagged_ds = TOPOLOGY.names_containing("datastores", ds_tag)
+            if tagged_ds: datastore_name = choose_randomly_from_list(tagged_ds)
+
+        if datastore_name == "Unknown_DS": # Fallback logic
+            assigned_host_rec = TOPOLOGY.find("hosts", vm_rec.get("host"))
+            ds_options = [ds_loc for ds_loc in assigned_host_rec.get("datastores_local", [])] if assigned_host_rec else []
+            shared_ds = [ds["name"] for ds in TOPOLOGY.members("datastores", "shared_datacenter", vm_rec.get("datacenter"))]
+            ds_options.extend(shared_ds)
+            if not ds_options: ds_options.append(generate_datastore_name(ds_type="fallback", ds_idx=vm_rec.get("uuid","vm")[:4]))
+            datastore_name = choose_randomly_from_list(ds_options, "Critical_Fallback_DS")
+
+
+        # AI call for disk details
+        ai_disk_data = yield _vdisk_ai_request(vm_r_context_for_ai, disk_idx_loop -1, disk_label, datastore_name, disk_profile)
+
+        current_row_dict = {header: "" for header in CSV_HEADERS["vDisk"]}
+        current_row_dict.update({
+            "VM Name": vm_rec.get("name"), "Powerstate": vm_rec.get("power_state"),
+            "Template": vm_rec.get("is_template", False), "Host": vm_rec.get("host"),
+            "Cluster": vm_rec.get("cluster"), "Datacenter": vm_rec.get("datacenter"),
+            "VM UUID": vm_rec.get("uuid"), "VI SDK Server": vm_rec.get("sdk_server"),
+            "VI SDK UUID": vm_rec.get("sdk_uuid"),
+            # Fields from AI or mock
+            "Disk": ai_disk_data.get("Disk", disk_label),
+            "Capacity MB": ai_disk_data.get("Capacity MB", disk_profile.get("size_gb", 60) * 1024),
+            "Disk Mode": ai_disk_data.get("Disk Mode", "persistent"),
+            "Thin": ai_disk_data.get("Thin", disk_profile.get("thin_provisioned", True)),
+            "Controller": ai_disk_data.get("Controller", "SCSI controller 0"),
+            "Path": ai_disk_data.get("Path", f"[{datastore_name}] {vm_rec.get('name')}/{vm_rec.get('name')}_{disk_idx_loop-1}.vmdk"),
+            "Datastore": datastore_name # Ensure datastore name is consistent
+        })
+        rows.append([current_row_dict.get(header, "") for header in CSV_HEADERS["vDisk"]])
+    return rows
 
+def _iter_vdisk_rows(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3", vms=None):
+    """Yields vDisk rows, one per virtual disk of every VM."""
+    vms = ENVIRONMENT_DATA["vms"] if vms is None else vms # Shards pass just their own VMs
+    vm_iterator = tqdm(vms, desc="Generating vDisk") if TQDM_AVAILABLE else vms
 
-            # AI call for disk details
-            ai_disk_data = generate_vdisk_row_ai(vm_r_context_for_ai, disk_idx_loop -1, disk_label, datastore_name, disk_profile)
+    units = ((_vdisk_rows_steps(vm_rec, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), None) for vm_rec in vm_iterator)
+    for rows in iter_ai_units(units, use_ai_cli_flag, ai_provider_cli_arg):
+        yield from rows
 
-            current_row_dict = {header: "" for header in CSV_HEADERS["vDisk"]}
-            current_row_dict.update({
-                "VM Name": vm_rec.get("name"), "Powerstate": vm_rec.get("power_state"),
-                "Template": vm_rec.get("is_template", False), "Host": vm_rec.get("host"),
-                "Cluster": vm_rec.get("cluster"), "Datacenter": vm_rec.get("datacenter"),
-                "VM UUID": vm_rec.get("uuid"), "VI SDK Server": vm_rec.get("sdk_server"),
-                "VI SDK UUID": vm_rec.get("sdk_uuid"),
-                # Fields from AI or mock
-                "Disk": ai_disk_data.get("Disk", disk_label),
-                "Capacity MB": ai_disk_data.get("Capacity MB", disk_profile.get("size_gb", 60) * 1024),
-                "Disk Mode": ai_disk_data.get("Disk Mode", "persistent"),
-                "Thin": ai_disk_data.get("Thin", disk_profile.get("thin_provisioned", True)),
-                "Controller": ai_disk_data.get("Controller", "SCSI controller 0"),
-                "Path": ai_disk_data.get("Path", f"[{datastore_name}] {vm_rec.get('name')}/{vm_rec.get('name')}_{disk_idx_loop-1}.vmdk"),
-                "Datastore": datastore_name # Ensure datastore name is consistent
-            })
-            data.append([current_row_dict.get(header, "") for header in CSV_HEADERS["vDisk"]])
-    write_csv(data, "vDisk", CSV_HEADERS["vDisk"])
+def generate_vdisk_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    if not ENVIRONMENT_DATA.get("vms"): return
+    write_csv(_iter_vdisk_rows(complexity_params, scenario_config, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), "vDisk", CSV_HEADERS["vDisk"])
 
 # --- vNetwork AI Row and Mock ---
 def _create_vnetwork_mock_data(context):
@@ -969,8 +2561,8 @@ def _create_vnetwork_mock_data(context):
         # "VM Name": context.get('vm_name'), "Powerstate": vm_power_state, "Switch": "SomeSwitch"
     }
 
-def generate_vnetwork_row_ai(vm_r_context_for_ai, nic_index, nic_label, nic_profile_data):
-    """Generates a single vNetwork row, potentially using AI."""
+def _vnetwork_ai_request(vm_r_context_for_ai, nic_index, nic_label, nic_profile_data):
+    """The _get_ai_data_for_entity arguments for one vNetwork row; AI steps yield these."""
     prompt_context = {
         "vm_name": vm_r_context_for_ai.get("name"),
         "power_state": vm_r_context_for_ai.get("power_state"),
@@ -982,93 +2574,75 @@ def generate_vnetwork_row_ai(vm_r_context_for_ai, nic_index, nic_label, nic_prof
         "ollama_model_name_cli_arg": vm_r_context_for_ai.get('ollama_model_name_cli_arg', 'llama3')
     }
 
-    ai_generated_data = _get_ai_data_for_entity(
-        VNETWORK_AI_PROMPT_TEMPLATE,
-        prompt_context,
-        "vNetwork",
-        f"vNetwork {nic_label} for {vm_r_context_for_ai.get('name', 'UnknownVM')}",
-        use_ai_enabled_globally=prompt_context['use_ai_cli_flag'],
-        ai_provider=prompt_context['ai_provider_cli_arg'],
-        ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'],
-        entity_specific_mock_func=_create_vnetwork_mock_data
-    )
-    return ai_generated_data
+    return dict(prompt_template=VNETWORK_AI_PROMPT_TEMPLATE, context=prompt_context, relevant_headers_key="vNetwork",
+                entity_name_for_log=f"vNetwork {nic_label} for {vm_r_context_for_ai.get('name', 'UnknownVM')}",
+                use_ai_enabled_globally=prompt_context['use_ai_cli_flag'], ai_provider=prompt_context['ai_provider_cli_arg'],
+                ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'], entity_specific_mock_func=_create_vnetwork_mock_data)
 
-def generate_vnetwork_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    if not ENVIRONMENT_DATA.get("vms"): return
-    data = []
-    vm_iterator = tqdm(ENVIRONMENT_DATA["vms"], desc="Generating vNetwork") if TQDM_AVAILABLE else ENVIRONMENT_DATA["vms"]
+def generate_vnetwork_row_ai(vm_r_context_for_ai, nic_index, nic_label, nic_profile_data):
+    """Generates a single vNetwork row, potentially using AI."""
+    return _get_ai_data_for_entity(**_vnetwork_ai_request(vm_r_context_for_ai, nic_index, nic_label, nic_profile_data))
+
+def _vnetwork_rows_steps(vm_rec, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name):
+    """AI steps (see iter_ai_units) building the vNetwork rows of one VM; returns the rows."""
+    rows = []
+    num_nics_for_vm = vm_rec.get("num_nics", 1)
+    profile_nics_data = vm_rec.get("profile_nics")
+
+    vm_r_context_for_ai = {**vm_rec} # Pass AI CLI args
+    vm_r_context_for_ai['use_ai_cli_flag'] = use_ai_cli_flag
+    vm_r_context_for_ai['ai_provider_cli_arg'] = ai_provider_cli_arg
+    vm_r_context_for_ai['ollama_model_name_cli_arg'] = ollama_model_name
+
+    for nic_idx_loop in range(1, num_nics_for_vm + 1):
+        nic_label = f"Network adapter {nic_idx_loop}"
+        nic_profile = profile_nics_data[nic_idx_loop-1] if profile_nics_data and nic_idx_loop <= len(profile_nics_data) else {}
+
+        # Port group and switch come from the planned topology (see plan_network_topology)
+        network_label = nic_profile.get("network_label_hint") or choose_randomly_from_list(planned_networks(vm_rec.get("datacenter")), default_value=None) or generate_network_name()
+        adapter_type_hint = nic_profile.get("adapter_type", "VMXNET3")
+        switch_name = nic_switch_name(TOPOLOGY.find("networks", network_label), vm_rec.get("host"))
+
+        ai_nic_data = yield _vnetwork_ai_request(vm_r_context_for_ai, nic_idx_loop, nic_label, dict(nic_profile, network_label_hint=network_label))
+
+        current_row_dict = {header: "" for header in CSV_HEADERS["vNetwork"]}
+        current_row_dict.update({
+            "VM Name": vm_rec.get("name"), "Powerstate": vm_rec.get("power_state"),
+            "Template": vm_rec.get("is_template", False), "Host": vm_rec.get("host"),
+            "Cluster": vm_rec.get("cluster"), "Datacenter": vm_rec.get("datacenter"),
+            "VM UUID": vm_rec.get("uuid"), "VI SDK Server": vm_rec.get("sdk_server"),
+            "VI SDK UUID": vm_rec.get("sdk_uuid"),
+            # Fields from AI or mock
+            "Network adapter": ai_nic_data.get("Network adapter", nic_label),
+            "Connected": ai_nic_data.get("Connected", False),
+            "Status": ai_nic_data.get("Status", "Disconnected"),
+            "MAC Address": ai_nic_data.get("MAC Address", generate_mac_address()),
+            "IP Address": ai_nic_data.get("IP Address", ""),
+            "Network Label": network_label, # Must name a planned port group, whatever the model suggests
+            "Switch": switch_name,
+            "Adapter Type": ai_nic_data.get("Adapter Type", adapter_type_hint),
+        })
+        rows.append([current_row_dict.get(header, "") for header in CSV_HEADERS["vNetwork"]])
+    return rows
 
-    for vm_rec in vm_iterator:
-        num_nics_for_vm = vm_rec.get("num_nics", 1)
-        profile_nics_data = vm_rec.get("profile_nics")
-
-        vm_r_context_for_ai = {**vm_rec} # Pass AI CLI args
-        vm_r_context_for_ai['use_ai_cli_flag'] = use_ai_cli_flag
-        vm_r_context_for_ai['ai_provider_cli_arg'] = ai_provider_cli_arg
-        vm_r_context_for_ai['ollama_model_name_cli_arg'] = ollama_model_name
-
-        for nic_idx_loop in range(1, num_nics_for_vm + 1):
-            nic_label = f"Network adapter {nic_idx_loop}"
-            nic_profile = profile_nics_data[nic_idx_loop-1] if profile_nics_data and nic_idx_loop <= len(profile_nics_data) else {}
-
-            # Network and Switch determination (remains mostly the same)
-            network_label_hint = nic_profile.get("network_label_hint", generate_network_name())
-            adapter_type_hint = nic_profile.get("adapter_type", "VMXNET3")
-
-            # Logic to find/create network and switch (simplified for brevity, assume it sets determined_network_label and determined_switch_name)
-            # This existing logic that ensures network and switch are in ENVIRONMENT_DATA is crucial
-            # For example:
-            determined_network_label = network_label_hint
-            determined_switch_name = "SomeSwitch" # Placeholder - this needs to be properly determined as per existing logic
-            # (The full logic for creating/finding network and switch from the original function should be here)
-            # Start of existing logic to ensure network and switch
-            if not any(n["name"] == determined_network_label for n in ENVIRONMENT_DATA.get("networks", [])):
-                is_dvs_profile = nic_profile.get("dvs_switch_name")
-                is_dvs_random = generate_random_boolean(complexity_params.get('dvs_likelihood',0.3))
-                network_type_final = "PortGroup"
-                if is_dvs_profile or (not is_dvs_profile is False and is_dvs_random):
-                    determined_switch_name = is_dvs_profile if is_dvs_profile else f"DVS_{vm_rec.get('datacenter', 'DC1')}"
-                    network_type_final = "DVPortGroup"
-                    if not any(dvs.get("name") == determined_switch_name for dvs in ENVIRONMENT_DATA.get("dvSwitches",[])):
-                        ENVIRONMENT_DATA.setdefault("dvSwitches", []).append({"name": determined_switch_name, "datacenter": vm_rec.get('datacenter'), "uuid": generate_uuid(), "sdk_server": vm_rec.get("sdk_server"), "sdk_uuid": vm_rec.get("sdk_uuid")})
-                else:
-                    determined_switch_name = f"vSwitch0_{vm_rec.get('host','DefaultHost')}"
-                    if not any(s.get("name") == determined_switch_name and s.get("host") == vm_rec.get('host') for s in ENVIRONMENT_DATA.get("vswitches",[])):
-                        ENVIRONMENT_DATA.setdefault("vswitches",[]).append({"name":determined_switch_name, "host":vm_rec.get('host'), "type":"Standard", "datacenter": vm_rec.get('datacenter')})
-                ENVIRONMENT_DATA.setdefault("networks", []).append({"name": determined_network_label, "type": network_type_final, "switch_name": determined_switch_name, "vlan_id": nic_profile.get("vlan_id", generate_random_integer(10,100)), "datacenter": vm_rec.get("datacenter"), "sdk_server": vm_rec.get("sdk_server"), "sdk_uuid": vm_rec.get("sdk_uuid")})
-            else:
-                existing_net_rec = next((n for n in ENVIRONMENT_DATA["networks"] if n["name"] == determined_network_label), None)
-                determined_switch_name = existing_net_rec.get("switch_name", "UnknownSwitch") if existing_net_rec else "UnknownSwitch"
-            # End of existing logic to ensure network and switch
+def _iter_vnetwork_rows(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3", vms=None):
+    """Yields vNetwork rows, one per VM network adapter."""
+    vms = ENVIRONMENT_DATA["vms"] if vms is None else vms # Shards pass just their own VMs
+    vm_iterator = tqdm(vms, desc="Generating vNetwork") if TQDM_AVAILABLE else vms
 
-            ai_nic_data = generate_vnetwork_row_ai(vm_r_context_for_ai, nic_idx_loop, nic_label, nic_profile)
+    units = ((_vnetwork_rows_steps(vm_rec, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), None) for vm_rec in vm_iterator)
+    for rows in iter_ai_units(units, use_ai_cli_flag, ai_provider_cli_arg):
+        yield from rows
 
-            current_row_dict = {header: "" for header in CSV_HEADERS["vNetwork"]}
-            current_row_dict.update({
-                "VM Name": vm_rec.get("name"), "Powerstate": vm_rec.get("power_state"),
-                "Template": vm_rec.get("is_template", False), "Host": vm_rec.get("host"),
-                "Cluster": vm_rec.get("cluster"), "Datacenter": vm_rec.get("datacenter"),
-                "VM UUID": vm_rec.get("uuid"), "VI SDK Server": vm_rec.get("sdk_server"),
-                "VI SDK UUID": vm_rec.get("sdk_uuid"),
-                # Fields from AI or mock
-                "Network adapter": ai_nic_data.get("Network adapter", nic_label),
-                "Connected": ai_nic_data.get("Connected", False),
-                "Status": ai_nic_data.get("Status", "Disconnected"),
-                "MAC Address": ai_nic_data.get("MAC Address", generate_mac_address()),
-                "IP Address": ai_nic_data.get("IP Address", ""),
-                "Network Label": ai_nic_data.get("Network Label", determined_network_label),
-                "Switch": determined_switch_name, # Use the determined switch name
-                "Adapter Type": ai_nic_data.get("Adapter Type", adapter_type_hint),
-            })
-            data.append([current_row_dict.get(header, "") for header in CSV_HEADERS["vNetwork"]])
-    write_csv(data, "vNetwork", CSV_HEADERS["vNetwork"])
+def generate_vnetwork_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    if not ENVIRONMENT_DATA.get("vms"): return
+    write_csv(_iter_vnetwork_rows(complexity_params, scenario_config, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), "vNetwork", CSV_HEADERS["vNetwork"])
 
 # --- vSnapshot (no AI path for now, just complexity/scenario) ---
-def generate_vsnapshot_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args for consistency
-    if not ENVIRONMENT_DATA.get("vms"): return
-    data = []
-    vm_iterator = tqdm(ENVIRONMENT_DATA["vms"], desc="Generating vSnapshot") if TQDM_AVAILABLE else ENVIRONMENT_DATA["vms"]
+def _iter_vsnapshot_rows(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3", vms=None):
+    """Yields vSnapshot rows, one per snapshot in each VM's chain."""
+    vms = ENVIRONMENT_DATA["vms"] if vms is None else vms # Shards pass just their own VMs
+    vm_iterator = tqdm(vms, desc="Generating vSnapshot") if TQDM_AVAILABLE else vms
 
     for vm_rec in vm_iterator:
         # Use profile likelihood if available, else complexity default
@@ -1078,6 +2652,7 @@ def generate_vsnapshot_csv(complexity_params, scenario_config=None, use_ai_cli_f
         if generate_random_boolean(snap_likelihood):
             max_snaps = profile_likelihoods.get('max_snapshots', complexity_params.get('max_snapshots_per_vm', 3))
             num_snapshots = generate_random_integer(1, max_snaps)
+            creation_dates = current_sampler().dates(num_snapshots, "2022-01-01", "2023-12-01")
             parent_id = None
             for k in range(1, num_snapshots + 1):
                 row = {header: "" for header in CSV_HEADERS["vSnapshot"]}
@@ -1089,7 +2664,7 @@ def generate_vsnapshot_csv(complexity_params, scenario_config=None, use_ai_cli_f
                     "VI SDK UUID": vm_rec.get("sdk_uuid"),
                     "Snapshot Name": f"Snapshot {k} for {vm_rec.get('name')}",
                     "Description": f"Test snapshot {k}",
-                    "Creation Date": generate_random_date("2022-01-01", "2023-12-01"),
+                    "Creation Date": creation_dates[k - 1],
                     "Quiesced": generate_random_boolean(0.6),
                     "State": vm_rec.get("power_state"), # State of VM when snapshot was taken
                     "Size MB": generate_random_integer(100, vm_rec.get("in_use_mb", 10000) // 2 if vm_rec.get("in_use_mb", 0) > 0 else 500)
@@ -1100,8 +2675,11 @@ def generate_vsnapshot_csv(complexity_params, scenario_config=None, use_ai_cli_f
                 # parent_id = row["Snapshot Id"]
                 # if k == num_snapshots: row["Snapshot Is Current"] = True
 
-                data.append([row.get(header, "") for header in CSV_HEADERS["vSnapshot"]])
-    write_csv(data, "vSnapshot", CSV_HEADERS["vSnapshot"])
+                yield [row.get(header, "") for header in CSV_HEADERS["vSnapshot"]]
+
+def generate_vsnapshot_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args for consistency
+    if not ENVIRONMENT_DATA.get("vms"): return
+    write_csv(_iter_vsnapshot_rows(complexity_params, scenario_config, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), "vSnapshot", CSV_HEADERS["vSnapshot"])
 
 # --- vCluster AI Row and Mock ---
 def _create_vcluster_mock_data(context):
@@ -1120,11 +2698,11 @@ def _create_vcluster_mock_data(context):
         # VI SDK Server, Cluster MoRef, Cluster UUID are usually added by the main function
     }
 
-def generate_vcluster_row_ai(cluster_r_context_for_ai):
-    """Generates a single vCluster row, potentially using AI."""
+def _vcluster_ai_request(cluster_r_context_for_ai):
+    """The _get_ai_data_for_entity arguments for one vCluster row; AI steps yield these."""
     # Calculate derived context values
-    hosts_in_cluster = [h for h in ENVIRONMENT_DATA.get("hosts", []) if h.get("cluster") == cluster_r_context_for_ai.get("name")]
-    vms_in_cluster = [vm for vm in ENVIRONMENT_DATA.get("vms", []) if vm.get("cluster") == cluster_r_context_for_ai.get("name")]
+    hosts_in_cluster = TOPOLOGY.members("hosts", "cluster", cluster_r_context_for_ai.get("name"))
+    num_vms_in_cluster = TOPOLOGY.count("vms", "cluster", cluster_r_context_for_ai.get("name"))
 
     # Sum CPU cores from host records (assuming CPU Cores is populated in host_rec by vHost)
     total_cpu_cores_in_cluster = sum(int(h.get("CPU Cores", 0)) for h in hosts_in_cluster if isinstance(h.get("CPU Cores"), (int, str)) and str(h.get("CPU Cores")).isdigit())
@@ -1136,7 +2714,7 @@ def generate_vcluster_row_ai(cluster_r_context_for_ai):
         "cluster_name": cluster_r_context_for_ai.get("name"),
         "datacenter_name": cluster_r_context_for_ai.get("datacenter"),
         "num_hosts": len(hosts_in_cluster),
-        "num_vms": len(vms_in_cluster),
+        "num_vms": num_vms_in_cluster,
         "total_cpu_cores": total_cpu_cores_in_cluster,
         "total_memory_gb": total_mem_mb_cluster // 1024,
         "use_ai_cli_flag": cluster_r_context_for_ai.get('use_ai_cli_flag', False),
@@ -1144,61 +2722,62 @@ def generate_vcluster_row_ai(cluster_r_context_for_ai):
         "ollama_model_name_cli_arg": cluster_r_context_for_ai.get('ollama_model_name_cli_arg', 'llama3')
     }
 
-    ai_generated_data = _get_ai_data_for_entity(
-        VCLUSTER_AI_PROMPT_TEMPLATE,
-        prompt_context,
-        "vCluster",
-        f"vCluster for {cluster_r_context_for_ai.get('name', 'UnknownCluster')}",
-        use_ai_enabled_globally=prompt_context['use_ai_cli_flag'],
-        ai_provider=prompt_context['ai_provider_cli_arg'],
-        ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'],
-        entity_specific_mock_func=_create_vcluster_mock_data
-    )
-    return ai_generated_data
+    return dict(prompt_template=VCLUSTER_AI_PROMPT_TEMPLATE, context=prompt_context, relevant_headers_key="vCluster",
+                entity_name_for_log=f"vCluster for {cluster_r_context_for_ai.get('name', 'UnknownCluster')}",
+                use_ai_enabled_globally=prompt_context['use_ai_cli_flag'], ai_provider=prompt_context['ai_provider_cli_arg'],
+                ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'], entity_specific_mock_func=_create_vcluster_mock_data)
 
-def generate_vcluster_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    if not ENVIRONMENT_DATA.get("clusters"): return
-    data = []
-    cluster_iterator = tqdm(ENVIRONMENT_DATA["clusters"], desc="Generating vCluster") if TQDM_AVAILABLE else ENVIRONMENT_DATA["clusters"]
+def generate_vcluster_row_ai(cluster_r_context_for_ai):
+    """Generates a single vCluster row, potentially using AI."""
+    return _get_ai_data_for_entity(**_vcluster_ai_request(cluster_r_context_for_ai))
+
+def _vcluster_row_steps(cl_rec, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name):
+    """AI steps (see iter_ai_units) building one cluster's vCluster row; returns the row."""
+    # Augment cluster record with AI flags for _vcluster_ai_request
+    cl_r_context = {**cl_rec}
+    cl_r_context['use_ai_cli_flag'] = use_ai_cli_flag
+    cl_r_context['ai_provider_cli_arg'] = ai_provider_cli_arg
+    cl_r_context['ollama_model_name_cli_arg'] = ollama_model_name
+
+    ai_cluster_data = yield _vcluster_ai_request(cl_r_context)
+
+    # Merge AI data with existing record, AI data takes precedence for shared fields
+    final_row_data = {
+        **cl_rec, # Start with existing record data
+        **ai_cluster_data # Overwrite with AI generated data
+    }
 
-    for cl_rec in cluster_iterator:
-        # Augment cluster record with AI flags for generate_vcluster_row_ai
-        cl_r_context = {**cl_rec}
-        cl_r_context['use_ai_cli_flag'] = use_ai_cli_flag
-        cl_r_context['ai_provider_cli_arg'] = ai_provider_cli_arg
-        cl_r_context['ollama_model_name_cli_arg'] = ollama_model_name
+    # Ensure required fields not typically from AI are present
+    final_row_data["VI SDK Server"] = cl_rec.get("sdk_server", "default_vcenter")
+    final_row_data["Cluster MoRef"] = cl_rec.get("Cluster MoRef", f"group-c{generate_random_integer(10,999)}")
+    final_row_data["Cluster UUID"] = cl_rec["uuid"] # Assigned with the topology (_build_vinfo_topology)
 
-        ai_cluster_data = generate_vcluster_row_ai(cl_r_context)
+    # Calculate some values based on what AI might have returned or what's in ENVIRONMENT_DATA
+    hosts_in_cluster = TOPOLOGY.members("hosts", "cluster", final_row_data.get("Name"))
+    final_row_data["Number of Hosts"] = ai_cluster_data.get("Number of Hosts", len(hosts_in_cluster))
+    final_row_data["Number of VMs"] = ai_cluster_data.get("Number of VMs", TOPOLOGY.count("vms", "cluster", final_row_data.get("Name")))
 
-        # Merge AI data with existing record, AI data takes precedence for shared fields
-        final_row_data = {
-            **cl_rec, # Start with existing record data
-            **ai_cluster_data # Overwrite with AI generated data
-        }
+    # If AI didn't provide these, calculate/generate fallbacks
+    if "Total CPU Mhz" not in ai_cluster_data:
+         total_cpu_cores_in_cluster = sum(int(h.get("CPU Cores",0)) for h in hosts_in_cluster if isinstance(h.get("CPU Cores"), (int,str)) and str(h.get("CPU Cores")).isdigit())
+         final_row_data["Total CPU Mhz"] = total_cpu_cores_in_cluster * generate_random_integer(2000,3000)
+    if "Total Memory GB" not in ai_cluster_data:
+        total_mem_mb_cluster = sum(int(h.get("MEM Size",0)) for h in hosts_in_cluster if isinstance(h.get("MEM Size"), (int,str)) and str(h.get("MEM Size")).isdigit())
+        final_row_data["Total Memory GB"] = total_mem_mb_cluster // 1024
 
-        # Ensure required fields not typically from AI are present
-        final_row_data["VI SDK Server"] = cl_rec.get("sdk_server", "default_vcenter")
-        final_row_data["Cluster MoRef"] = cl_rec.get("Cluster MoRef", f"group-c{generate_random_integer(10,999)}")
-        final_row_data["Cluster UUID"] = cl_rec.get("uuid", generate_uuid())
-        if "uuid" not in cl_rec: cl_rec["uuid"] = final_row_data["Cluster UUID"] # Store back if new
 
-        # Calculate some values based on what AI might have returned or what's in ENVIRONMENT_DATA
-        hosts_in_cluster = [h for h in ENVIRONMENT_DATA.get("hosts", []) if h.get("cluster") == final_row_data.get("Name")]
-        vms_in_cluster = [vm for vm in ENVIRONMENT_DATA.get("vms", []) if vm.get("cluster") == final_row_data.get("Name")]
-        final_row_data["Number of Hosts"] = ai_cluster_data.get("Number of Hosts", len(hosts_in_cluster))
-        final_row_data["Number of VMs"] = ai_cluster_data.get("Number of VMs", len(vms_in_cluster))
+    return [final_row_data.get(header, "") for header in CSV_HEADERS["vCluster"]]
 
-        # If AI didn't provide these, calculate/generate fallbacks
-        if "Total CPU Mhz" not in ai_cluster_data:
-             total_cpu_cores_in_cluster = sum(int(h.get("CPU Cores",0)) for h in hosts_in_cluster if isinstance(h.get("CPU Cores"), (int,str)) and str(h.get("CPU Cores")).isdigit())
-             final_row_data["Total CPU Mhz"] = total_cpu_cores_in_cluster * generate_random_integer(2000,3000)
-        if "Total Memory GB" not in ai_cluster_data:
-            total_mem_mb_cluster = sum(int(h.get("MEM Size",0)) for h in hosts_in_cluster if isinstance(h.get("MEM Size"), (int,str)) and str(h.get("MEM Size")).isdigit())
-            final_row_data["Total Memory GB"] = total_mem_mb_cluster // 1024
+def _iter_vcluster_rows(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"):
+    """Yields vCluster rows, one per cluster."""
+    cluster_iterator = tqdm(ENVIRONMENT_DATA["clusters"], desc="Generating vCluster") if TQDM_AVAILABLE else ENVIRONMENT_DATA["clusters"]
 
+    units = ((_vcluster_row_steps(cl_rec, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), None) for cl_rec in cluster_iterator)
+    yield from iter_ai_units(units, use_ai_cli_flag, ai_provider_cli_arg)
 
-        data.append([final_row_data.get(header, "") for header in CSV_HEADERS["vCluster"]])
-    write_csv(data, "vCluster", CSV_HEADERS["vCluster"])
+def generate_vcluster_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    if not ENVIRONMENT_DATA.get("clusters"): return
+    write_csv(_iter_vcluster_rows(complexity_params, scenario_config, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), "vCluster", CSV_HEADERS["vCluster"])
 
 
 # --- vDatastore AI Row and Mock ---
@@ -1217,8 +2796,8 @@ def _create_vdatastore_mock_data(context):
         # "Local/Shared": "Local" if context.get("is_local_ds") else "Shared"
     }
 
-def generate_vdatastore_row_ai(ds_r_context_for_ai):
-    """Generates a single vDatastore row, potentially using AI."""
+def _vdatastore_ai_request(ds_r_context_for_ai):
+    """The _get_ai_data_for_entity arguments for one vDatastore row; AI steps yield these."""
 
     # Calculate some derived context for the prompt
     num_vms_on_ds_approx = 0
@@ -1226,9 +2805,9 @@ def generate_vdatastore_row_ai(ds_r_context_for_ai):
         # Count VMs on the specific host this local DS is connected to
         connected_host_names = ds_r_context_for_ai.get("hosts_connected", [])
         if connected_host_names:
-            num_vms_on_ds_approx = sum(1 for vm in ENVIRONMENT_DATA.get("vms", []) if vm.get("host") == connected_host_names[0])
+            num_vms_on_ds_approx = TOPOLOGY.count("vms", "host", connected_host_names[0])
     else: # Shared datastore, count VMs in the same DC
-        num_vms_on_ds_approx = sum(1 for vm in ENVIRONMENT_DATA.get("vms", []) if vm.get("datacenter") == ds_r_context_for_ai.get("datacenter"))
+        num_vms_on_ds_approx = TOPOLOGY.count("vms", "datacenter", ds_r_context_for_ai.get("datacenter"))
 
 
     prompt_context = {
@@ -1242,68 +2821,70 @@ def generate_vdatastore_row_ai(ds_r_context_for_ai):
         "ollama_model_name_cli_arg": ds_r_context_for_ai.get('ollama_model_name_cli_arg', 'llama3')
     }
 
-    ai_generated_data = _get_ai_data_for_entity(
-        VDATASTORE_AI_PROMPT_TEMPLATE,
-        prompt_context,
-        "vDatastore",
-        f"vDatastore for {ds_r_context_for_ai.get('name', 'UnknownDS')}",
-        use_ai_enabled_globally=prompt_context['use_ai_cli_flag'],
-        ai_provider=prompt_context['ai_provider_cli_arg'],
-        ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'],
-        entity_specific_mock_func=_create_vdatastore_mock_data
-    )
-    return ai_generated_data
+    return dict(prompt_template=VDATASTORE_AI_PROMPT_TEMPLATE, context=prompt_context, relevant_headers_key="vDatastore",
+                entity_name_for_log=f"vDatastore for {ds_r_context_for_ai.get('name', 'UnknownDS')}",
+                use_ai_enabled_globally=prompt_context['use_ai_cli_flag'], ai_provider=prompt_context['ai_provider_cli_arg'],
+                ollama_model_name_arg=prompt_context['ollama_model_name_cli_arg'], entity_specific_mock_func=_create_vdatastore_mock_data)
 
-def generate_vdatastore_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    if not ENVIRONMENT_DATA.get("datastores"): return
-    data = []
+def generate_vdatastore_row_ai(ds_r_context_for_ai):
+    """Generates a single vDatastore row, potentially using AI."""
+    return _get_ai_data_for_entity(**_vdatastore_ai_request(ds_r_context_for_ai))
+
+def _vdatastore_row_steps(ds_rec, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name):
+    """AI steps (see iter_ai_units) building one datastore's vDatastore row; returns the row."""
+    ds_r_context = {**ds_rec}
+    ds_r_context['use_ai_cli_flag'] = use_ai_cli_flag
+    ds_r_context['ai_provider_cli_arg'] = ai_provider_cli_arg
+    ds_r_context['ollama_model_name_cli_arg'] = ollama_model_name
+
+    ai_ds_data = yield _vdatastore_ai_request(ds_r_context)
+
+    # Merge AI data with existing record
+    final_row_data = {**ds_rec, **ai_ds_data}
+
+    # Ensure required fields not typically from AI are present or calculated
+    final_row_data["VI SDK Server"] = ds_rec.get("sdk_server", "default_vcenter")
+    final_row_data["Datastore UUID"] = ds_rec["uuid"] # Assigned with the topology (_build_vinfo_topology)
+
+    final_row_data["Host Count"] = len(ds_rec.get("hosts_connected", []))
+    final_row_data["Datastore path"] = final_row_data.get("Datastore path", f"/vmfs/volumes/{final_row_data['Datastore UUID']}")
+    final_row_data["Local/Shared"] = "Local" if ds_rec.get("is_local") else "Shared"
+
+    # Approx VM count if not provided by AI (re-using logic from original vDatastore for consistency if AI doesn't give it)
+    if "VM Count" not in ai_ds_data:
+        vm_count_on_ds_approx = 0
+        if ds_rec.get("is_local"):
+            connected_host_names = ds_rec.get("hosts_connected", [])
+            if connected_host_names: vm_count_on_ds_approx = TOPOLOGY.count("vms", "host", connected_host_names[0])
+        else:
+            vm_count_on_ds_approx = TOPOLOGY.count("vms", "datacenter", ds_rec.get("datacenter"))
+        final_row_data["VM Count"] = vm_count_on_ds_approx
+
+    # Calculate Free % and Provisioned MB/%, if not provided by AI and Total MB is available
+    total_mb = final_row_data.get("Total MB", 0)
+    free_mb = final_row_data.get("Free MB", 0)
+    if total_mb > 0:
+        final_row_data["Free %"] = round((free_mb / total_mb) * 100, 1) if "Free %" not in ai_ds_data else ai_ds_data.get("Free %")
+        # Simplified provisioned calculation here for brevity if not from AI
+        # The original function had more complex logic for provisioned_mb based on VM usage.
+        # For AI path, we'd expect AI to provide it or we calculate it based on AI disk data (future step).
+        if "Provisioned MB" not in ai_ds_data:
+             final_row_data["Provisioned MB"] = int(total_mb * generate_random_float(0.5, 1.2)) # Example
+        if "Provisioned %" not in ai_ds_data:
+             final_row_data["Provisioned %"] = round((final_row_data["Provisioned MB"] / total_mb) * 100, 1) if total_mb > 0 else 0
+
+    return [final_row_data.get(header, "") for header in CSV_HEADERS["vDatastore"]]
+
+def _iter_vdatastore_rows(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"):
+    """Yields vDatastore rows, one per datastore."""
     ds_iterator = tqdm(ENVIRONMENT_DATA["datastores"], desc="Generating vDatastore") if TQDM_AVAILABLE else ENVIRONMENT_DATA["datastores"]
 
-    for ds_rec in ds_iterator:
-        ds_r_context = {**ds_rec}
-        ds_r_context['use_ai_cli_flag'] = use_ai_cli_flag
-        ds_r_context['ai_provider_cli_arg'] = ai_provider_cli_arg
-        ds_r_context['ollama_model_name_cli_arg'] = ollama_model_name
-
-        ai_ds_data = generate_vdatastore_row_ai(ds_r_context)
-
-        # Merge AI data with existing record
-        final_row_data = {**ds_rec, **ai_ds_data}
+    units = ((_vdatastore_row_steps(ds_rec, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), None) for ds_rec in ds_iterator)
+    yield from iter_ai_units(units, use_ai_cli_flag, ai_provider_cli_arg)
 
-        # Ensure required fields not typically from AI are present or calculated
-        final_row_data["VI SDK Server"] = ds_rec.get("sdk_server", "default_vcenter")
-        final_row_data["Datastore UUID"] = ds_rec.get("uuid", generate_uuid())
-        if "uuid" not in ds_rec: ds_rec["uuid"] = final_row_data["Datastore UUID"]
-
-        final_row_data["Host Count"] = len(ds_rec.get("hosts_connected", []))
-        final_row_data["Datastore path"] = final_row_data.get("Datastore path", f"/vmfs/volumes/{final_row_data['Datastore UUID']}")
-        final_row_data["Local/Shared"] = "Local" if ds_rec.get("is_local") else "Shared"
-
-        # Approx VM count if not provided by AI (re-using logic from original vDatastore for consistency if AI doesn't give it)
-        if "VM Count" not in ai_ds_data:
-            vm_count_on_ds_approx = 0
-            if ds_rec.get("is_local"):
-                connected_host_names = ds_rec.get("hosts_connected", [])
-                if connected_host_names: vm_count_on_ds_approx = sum(1 for vm in ENVIRONMENT_DATA.get("vms", []) if vm.get("host") == connected_host_names[0])
-            else:
-                vm_count_on_ds_approx = sum(1 for vm in ENVIRONMENT_DATA.get("vms", []) if vm.get("datacenter") == ds_rec.get("datacenter"))
-            final_row_data["VM Count"] = vm_count_on_ds_approx
-
-        # Calculate Free % and Provisioned MB/%, if not provided by AI and Total MB is available
-        total_mb = final_row_data.get("Total MB", 0)
-        free_mb = final_row_data.get("Free MB", 0)
-        if total_mb > 0:
-            final_row_data["Free %"] = round((free_mb / total_mb) * 100, 1) if "Free %" not in ai_ds_data else ai_ds_data.get("Free %")
-            # Simplified provisioned calculation here for brevity if not from AI
-            # The original function had more complex logic for provisioned_mb based on VM usage.
-            # For AI path, we'd expect AI to provide it or we calculate it based on AI disk data (future step).
-            if "Provisioned MB" not in ai_ds_data:
-                 final_row_data["Provisioned MB"] = int(total_mb * generate_random_float(0.5, 1.2)) # Example
-            if "Provisioned %" not in ai_ds_data:
-                 final_row_data["Provisioned %"] = round((final_row_data["Provisioned MB"] / total_mb) * 100, 1) if total_mb > 0 else 0
-
-        data.append([final_row_data.get(header, "") for header in CSV_HEADERS["vDatastore"]])
-    write_csv(data, "vDatastore", CSV_HEADERS["vDatastore"])
+def generate_vdatastore_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    if not ENVIRONMENT_DATA.get("datastores"): return
+    write_csv(_iter_vdatastore_rows(complexity_params, scenario_config, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), "vDatastore", CSV_HEADERS["vDatastore"])
 
 
 # --- vHost specific AI mock function ---
@@ -1313,87 +2894,89 @@ def _create_vhost_mock_data(context):
     dc_name = context.get("datacenter_name", "DefaultDC")
     cpu_sockets = generate_random_integer(1,2)
     cpu_cores_per_socket = generate_random_integer(4,16)
-    mem_gb = random.choice([64,128,256,512])
+    mem_gb = current_rng().choice([64,128,256,512])
 
     return {
         "Name": host_name,
         "Cluster": cluster_name,
         "Datacenter": dc_name,
         "CPUMhz": cpu_sockets * cpu_cores_per_socket * generate_random_integer(2000,3000), # Total Mhz
-        "CPU Model": random.choice(["Intel Xeon Gold", "AMD EPYC"]),
+        "CPU Model": current_rng().choice(["Intel Xeon Gold", "AMD EPYC"]),
         "CPU Sockets": cpu_sockets,
         "CPU Cores": cpu_sockets * cpu_cores_per_socket,
         "MEM Size": mem_gb * 1024, # In MB
         "VMs": context.get("num_vms_on_host", generate_random_integer(0,30)),
-        "Vendor": random.choice(["Dell Inc.", "HPE", "Cisco"]),
+        "Vendor": current_rng().choice(["Dell Inc.", "HPE", "Cisco"]),
         "Model": generate_random_string(prefix="SRV",length=3),
-        "ESXi Version": f"VMware ESXi {random.choice(['7.0.3', '8.0.1'])} build-{generate_random_integer(10000000,22000000)}"
+        "ESXi Version": f"VMware ESXi {current_rng().choice(['7.0.3', '8.0.1'])} build-{generate_random_integer(10000000,22000000)}"
     }
 
-def generate_vhost_row_ai(host_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg):
+def _vhost_ai_request(host_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg):
+    """The _get_ai_data_for_entity arguments for one vHost row; AI steps yield these."""
+    context_for_ai["context"] = _placement_context_json(context_for_ai) # Fills the template's {context}
     context_for_ai["host_name_hint"] = host_name_hint
     context_for_ai["headers"] = CSV_HEADERS["vHost"]
 
-    ai_generated_data = _get_ai_data_for_entity(
-        VHOST_AI_PROMPT_TEMPLATE,
-        context_for_ai,
-        "vHost",
-        f"vHost for {host_name_hint}",
-        use_ai_enabled_globally=use_ai_cli_flag,
-        ai_provider=ai_provider_cli_arg,
-        ollama_model_name_arg=context_for_ai.get('ollama_model_name_cli_arg', 'llama3'), # New
-        entity_specific_mock_func=_create_vhost_mock_data
-    )
-    return ai_generated_data
+    return dict(prompt_template=VHOST_AI_PROMPT_TEMPLATE, context=context_for_ai, relevant_headers_key="vHost",
+                entity_name_for_log=f"vHost for {host_name_hint}",
+                use_ai_enabled_globally=use_ai_cli_flag, ai_provider=ai_provider_cli_arg,
+                ollama_model_name_arg=context_for_ai.get('ollama_model_name_cli_arg', 'llama3'), entity_specific_mock_func=_create_vhost_mock_data)
 
-def generate_vhost_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"):
-    if not ENVIRONMENT_DATA.get("hosts"): return
-    data = []
+def generate_vhost_row_ai(host_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg):
+    """Generates a single vHost row, potentially using AI."""
+    return _get_ai_data_for_entity(**_vhost_ai_request(host_name_hint, context_for_ai, use_ai_cli_flag, ai_provider_cli_arg))
+
+def _vhost_row_steps(host_rec, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name):
+    """AI steps (see iter_ai_units) building one host's vHost row; returns the row."""
+    num_vms_on_host = TOPOLOGY.count("vms", "host", host_rec.get("name"))
+
+    host_context_for_ai = {
+        "cluster_name": host_rec.get("cluster"),
+        "datacenter_name": host_rec.get("datacenter"),
+        "num_vms_on_host": num_vms_on_host,
+        "sdk_server_name": host_rec.get("sdk_server"),
+        "base_sdk_uuid": host_rec.get("sdk_uuid"),
+        "use_ai_cli_flag": use_ai_cli_flag, # Pass through CLI flags
+        "ai_provider_cli_arg": ai_provider_cli_arg,
+        "ollama_model_name_cli_arg": ollama_model_name
+    }
+    ai_data = yield _vhost_ai_request(host_rec.get("name"), host_context_for_ai, use_ai_cli_flag, ai_provider_cli_arg)
+
+    row = {header: "" for header in CSV_HEADERS["vHost"]}
+    row.update({
+        "Name": ai_data.get("Name", host_rec.get("name")),
+        "Port": "443",
+        "User": "root",
+        "VI SDK Server": host_rec.get("sdk_server"),
+        "Cluster": ai_data.get("Cluster", host_rec.get("cluster")),
+        "Datacenter": ai_data.get("Datacenter", host_rec.get("datacenter")),
+        "CPUMhz": int(ai_data.get("CPUMhz", generate_random_integer(20000, 100000))),
+        "CPU Model": ai_data.get("CPU Model", "Generic CPU Model"),
+        "CPU Sockets": int(ai_data.get("CPU Sockets", complexity_params.get('default_host_sockets', 2))),
+        "CPU Cores": int(ai_data.get("CPU Cores", complexity_params.get('default_host_cores_per_socket', 8) * row["CPU Sockets"])),
+        "MEM Size": int(ai_data.get("MEM Size", complexity_params.get('default_host_memory_gb', 128) * 1024)),
+        "VMs": int(ai_data.get("VMs", num_vms_on_host)),
+        "Vendor": ai_data.get("Vendor", "Generic Vendor"),
+        "Model": ai_data.get("Model", "Generic Model"),
+        "ESXi Version": ai_data.get("ESXi Version", "VMware ESXi 7.0.0 build-12345678"),
+        "Host UUID": host_rec["uuid"] # Assigned with the topology, so vHBA and vHost agree whichever runs first
+    })
+    return [row.get(header, "") for header in CSV_HEADERS["vHost"]]
+
+def _iter_vhost_rows(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"):
+    """Yields vHost rows, one per ESXi host."""
     host_iterator = tqdm(ENVIRONMENT_DATA["hosts"], desc="Generating vHost") if TQDM_AVAILABLE else ENVIRONMENT_DATA["hosts"]
 
-    for host_rec in host_iterator:
-        num_vms_on_host = len(host_rec.get("vms_on_host", []))
-
-        host_context_for_ai = {
-            "cluster_name": host_rec.get("cluster"),
-            "datacenter_name": host_rec.get("datacenter"),
-            "num_vms_on_host": num_vms_on_host,
-            "sdk_server_name": host_rec.get("sdk_server"),
-            "base_sdk_uuid": host_rec.get("sdk_uuid"),
-            "use_ai_cli_flag": use_ai_cli_flag, # Pass through CLI flags
-            "ai_provider_cli_arg": ai_provider_cli_arg,
-            "ollama_model_name_cli_arg": ollama_model_name
-        }
-        ai_data = generate_vhost_row_ai(host_rec.get("name"), host_context_for_ai, use_ai_cli_flag, ai_provider_cli_arg)
+    units = ((_vhost_row_steps(host_rec, complexity_params, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), None) for host_rec in host_iterator)
+    yield from iter_ai_units(units, use_ai_cli_flag, ai_provider_cli_arg)
 
-        row = {header: "" for header in CSV_HEADERS["vHost"]}
-        row.update({
-            "Name": ai_data.get("Name", host_rec.get("name")),
-            "Port": "443",
-            "User": "root",
-            "VI SDK Server": host_rec.get("sdk_server"),
-            "Cluster": ai_data.get("Cluster", host_rec.get("cluster")),
-            "Datacenter": ai_data.get("Datacenter", host_rec.get("datacenter")),
-            "CPUMhz": int(ai_data.get("CPUMhz", generate_random_integer(20000, 100000))),
-            "CPU Model": ai_data.get("CPU Model", "Generic CPU Model"),
-            "CPU Sockets": int(ai_data.get("CPU Sockets", complexity_params.get('default_host_sockets', 2))),
-            "CPU Cores": int(ai_data.get("CPU Cores", complexity_params.get('default_host_cores_per_socket', 8) * row["CPU Sockets"])),
-            "MEM Size": int(ai_data.get("MEM Size", complexity_params.get('default_host_memory_gb', 128) * 1024)),
-            "VMs": int(ai_data.get("VMs", num_vms_on_host)),
-            "Vendor": ai_data.get("Vendor", "Generic Vendor"),
-            "Model": ai_data.get("Model", "Generic Model"),
-            "ESXi Version": ai_data.get("ESXi Version", "VMware ESXi 7.0.0 build-12345678"),
-            "Host UUID": host_rec.get("uuid", generate_uuid(prefix=f"host-{host_rec.get('name')}-"))
-        })
-        host_rec["uuid"] = row["Host UUID"] # Ensure it's stored back
-        data.append([row.get(header, "") for header in CSV_HEADERS["vHost"]])
-    write_csv(data, "vHost", CSV_HEADERS["vHost"])
+def generate_vhost_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"):
+    if not ENVIRONMENT_DATA.get("hosts"): return
+    write_csv(_iter_vhost_rows(complexity_params, scenario_config, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), "vHost", CSV_HEADERS["vHost"])
 
 
-def generate_vcluster_csv(*args, **kwargs): pass # Placeholder
-def generate_vhba_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    if not ENVIRONMENT_DATA.get("hosts"): return
-    data = []
+def _iter_vhba_rows(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"):
+    """Yields vHBA rows, one per host bus adapter."""
     host_iterator = tqdm(ENVIRONMENT_DATA["hosts"], desc="Generating vHBA") if TQDM_AVAILABLE else ENVIRONMENT_DATA["hosts"]
 
     for host_rec in host_iterator:
@@ -1433,7 +3016,7 @@ def generate_vhba_csv(complexity_params, scenario_config=None, use_ai_cli_flag=F
 
             if hba_type_pref_from_profile and hba_type_pref_from_profile in ['Fibre Channel', 'iSCSI Software Adapter', 'SAS Controller', 'RAID Controller']:
                 hba_type = hba_type_pref_from_profile
-                if random.random() < 0.1: # 10% chance to still pick randomly for variety
+                if current_rng().random() < 0.1: # 10% chance to still pick randomly for variety
                      hba_type = choose_randomly_from_list(['Fibre Channel', 'iSCSI Software Adapter', 'SAS Controller', 'RAID Controller'])
             else:
                 # Fallback to complexity-driven or general random choice
@@ -1441,7 +3024,7 @@ def generate_vhba_csv(complexity_params, scenario_config=None, use_ai_cli_flag=F
                 if complexity_params and 'feature_likelihood' in complexity_params:
                     adv_hba_likelihood = complexity_params['feature_likelihood'].get('advanced_hba_types', 0.3)
 
-                if random.random() < adv_hba_likelihood:
+                if current_rng().random() < adv_hba_likelihood:
                     hba_type = choose_randomly_from_list(['Fibre Channel', 'iSCSI Software Adapter'])
                 else:
                     hba_type = choose_randomly_from_list(['SAS Controller', 'RAID Controller', 'iSCSI Software Adapter'])
@@ -1450,11 +3033,11 @@ def generate_vhba_csv(complexity_params, scenario_config=None, use_ai_cli_flag=F
 
             # Populate details based on HBA type
             if hba_type == "Fibre Channel":
-                current_row_dict["Driver"] = random.choice(["qlnativefc", "lpfc"])
-                current_row_dict["Model"] = random.choice(["QLogic QLE2692", "Emulex LPe32002"])
-                current_row_dict["WWNN"] = "20:00:" + ":".join([f"{random.randint(0,255):02x}" for _ in range(6)])
-                current_row_dict["WWPN"] = "21:00:" + ":".join([f"{random.randint(0,255):02x}" for _ in range(6)])
-                current_row_dict["Speed"] = random.choice(["16 Gbit", "32 Gbit"])
+                current_row_dict["Driver"] = current_rng().choice(["qlnativefc", "lpfc"])
+                current_row_dict["Model"] = current_rng().choice(["QLogic QLE2692", "Emulex LPe32002"])
+                current_row_dict["WWNN"] = "20:00:" + ":".join([f"{current_rng().randint(0,255):02x}" for _ in range(6)])
+                current_row_dict["WWPN"] = "21:00:" + ":".join([f"{current_rng().randint(0,255):02x}" for _ in range(6)])
+                current_row_dict["Speed"] = current_rng().choice(["16 Gbit", "32 Gbit"])
             elif hba_type == "iSCSI Software Adapter":
                 current_row_dict["Driver"] = "iscsi_vmk"
                 current_row_dict["Model"] = "iSCSI Software Adapter"
@@ -1462,13 +3045,36 @@ def generate_vhba_csv(complexity_params, scenario_config=None, use_ai_cli_flag=F
                 current_row_dict["WWPN"] = current_row_dict["WWNN"] # Often same for initiator
                 current_row_dict["Speed"] = "10 Gbit" # Assumes underlying NIC speed
             elif hba_type == "SAS Controller" or hba_type == "RAID Controller":
-                current_row_dict["Driver"] = random.choice(["lsi_mr3", "smartpqi"])
-                current_row_dict["Model"] = random.choice(["LSI MegaRAID SAS 9361-8i", "HPE Smart Array P408i-a"])
+                current_row_dict["Driver"] = current_rng().choice(["lsi_mr3", "smartpqi"])
+                current_row_dict["Model"] = current_rng().choice(["LSI MegaRAID SAS 9361-8i", "HPE Smart Array P408i-a"])
                 current_row_dict["Speed"] = "12 Gbps"
 
-            data.append([current_row_dict.get(header, "") for header in CSV_HEADERS["vHBA"]])
-    write_csv(data, "vHBA", CSV_HEADERS["vHBA"])
+            yield [current_row_dict.get(header, "") for header in CSV_HEADERS["vHBA"]]
 
+def generate_vhba_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    if not ENVIRONMENT_DATA.get("hosts"): return
+    write_csv(_iter_vhba_rows(complexity_params, scenario_config, use_ai_cli_flag, ai_provider_cli_arg, ollama_model_name), "vHBA", CSV_HEADERS["vHBA"])
+
+
+def generate_vtools_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    print(f"Placeholder: vTools generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
+    pass
+
+def generate_vpartition_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    print(f"Placeholder: vPartition generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
+    pass
+
+def generate_vcd_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    print(f"Placeholder: vCD generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
+    pass
+
+def generate_vfloppy_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    print(f"Placeholder: vFloppy generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
+    pass
+
+def generate_vusb_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
+    print(f"Placeholder: vUSB generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
+    pass
 
 def generate_vnic_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
     print(f"Placeholder: vNIC generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
@@ -1501,6 +3107,1053 @@ def generate_vtag_csv(complexity_params, scenario_config=None, use_ai_cli_flag=F
     pass
 
 
+# --- Columnar Engine (--engine numpy) ---
+# Builds the per-VM tables a column at a time for a whole shard: values are drawn as NumPy arrays and
+# formatted into CSV text in bulk. Only used when AI is off; the per-row generators above stay the
+# reference implementation and the fallback when NumPy is missing.
+_CSV_SPECIAL_CHARS = (',', '"', '\r', '\n')
+_ALNUM = string.ascii_letters + string.digits
+
+def use_columnar_engine(vinfo_args):
+    """True when the shard should be built column-wise: --engine numpy, NumPy importable and AI off."""
+    return vinfo_args.get("engine") == "numpy" and NUMPY_AVAILABLE and not vinfo_args.get("use_ai_cli_flag")
+
+def _np_stream(*key):
+    return np.random.default_rng(derive_seed("numpy", *key))
+
+def _csv_safe(values):
+    """True if no value needs CSV quoting, checked with one scan of the whole column."""
+    joined = "\x1f".join(values)
+    return not any(ch in joined for ch in _CSV_SPECIAL_CHARS)
+
+def _quote_csv_column(values):
+    """Quotes only the values csv.writer would quote (QUOTE_MINIMAL)."""
+    if _csv_safe(values):
+        return values
+    return ['"' + v.replace('"', '""') + '"' if any(ch in v for ch in _CSV_SPECIAL_CHARS) else v for v in values]
+
+def _csv_block(columns, headers, generated=()):
+    """Joins {header: list of str} columns into CSV text with csv.writer's \r\n line endings; returns (rows, text).
+
+    Headers in generated hold engine-formatted values (numbers, dates, UUIDs) and skip the quoting scan.
+    A tuple key holds already-quoted, comma-joined values for that run of consecutive headers.
+    """
+    n = len(next(iter(columns.values()), []))
+    if n == 0:
+        return 0, ""
+    runs = {key[0]: key for key in columns if isinstance(key, tuple)}
+    ordered, i = [], 0
+    while i < len(headers):
+        header = headers[i]
+        if header in runs:
+            ordered.append(columns[runs[header]])
+            i += len(runs[header])
+            continue
+        if header not in columns:
+            ordered.append([""] * n)
+        else:
+            ordered.append(columns[header] if header in generated else _quote_csv_column(columns[header]))
+        i += 1
+    # Interleave the columns with separators in one flat list so the text is joined (copied) only once
+    width = 2 * len(ordered)
+    flat = [","] * (width * n)
+    for position, values in enumerate(ordered):
+        flat[2 * position::width] = values
+    flat[width - 1::width] = ["\r\n"] * n
+    return n, "".join(flat)
+
+def _str_column(values):
+    """Column values as CSV strings; None becomes "" as with csv.writer."""
+    if hasattr(values, "tolist"):
+        return list(map(str, values.tolist()))
+    strs = list(map(str, values))
+    return strs if "None" not in strs else ["" if v is None else text for v, text in zip(values, strs)]
+
+def _np_pick(rng, options, n):
+    """n independent uniform choices from options, as a list."""
+    return np.asarray(options, dtype=object)[rng.integers(0, len(options), n)].tolist()
+
+def _np_strings(rng, n, length, alphabet=_ALNUM):
+    table = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)
+    flat = table[rng.integers(0, len(table), n * length)].tobytes().decode("ascii")
+    return [flat[i:i + length] for i in range(0, n * length, length)]
+
+def _np_uuids(rng, n, prefix=""):
+    raw = rng.integers(0, 256, (n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40 # Version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80 # RFC 4122 variant
+    return format_uuids(raw.tobytes().hex(), prefix)
+
+def _np_macs(rng, n):
+    return format_macs(rng.integers(0, 256, (n, 3), dtype=np.uint8).tobytes().hex())
+
+def _np_ips(rng, n, subnet_str="192.168.1.0/24"):
+    parsed = parse_subnet(subnet_str)
+    if parsed is None or parsed[2] != 4:
+        return current_sampler().ips(n, subnet_str)
+    base, num_addresses, _ = parsed
+    if num_addresses <= 2:
+        return [format_ip(base)] * n
+    addrs = base + rng.integers(1, num_addresses - 1, n, dtype=np.int64)
+    octets = [_str_column((addrs >> shift) & 0xFF) for shift in (24, 16, 8, 0)]
+    return [".".join(parts) for parts in zip(*octets)]
+
+def _np_dates(rng, n, start_date_str, end_date_str):
+    """Same range and format as generate_random_date: a random second within [start day, end day]."""
+    start = np.datetime64(start_date_str, 's')
+    num_days = int((np.datetime64(end_date_str, 'D') - np.datetime64(start_date_str, 'D')).astype(int)) + 1
+    seconds = rng.integers(0, num_days, n, dtype=np.int64) * 86400 + rng.integers(0, 86400, n, dtype=np.int64)
+    return np.char.replace(np.datetime_as_string(start + seconds.astype('timedelta64[s]'), unit='s'), "T", " ").tolist()
+
+def _np_network_names(rng, n):
+    return [f"Net-General-{suffix.upper()}" for suffix in _np_strings(rng, n, 3)]
+
+def _np_where(mask, if_true, if_false):
+    return [a if m else b for m, a, b in zip(mask.tolist(), if_true, if_false)]
+
+def _columnar_vm_segment(lo, hi, segment, rng, sdk_server_name, base_sdk_uuid, complexity_params):
+    """Columns for VMs [lo, hi) of one deployment plan segment, mirroring _build_vm_record with mock data."""
+    n = hi - lo
+    profile = segment["vm_profile"] if segment is not None else {}
+    if segment is not None:
+        names = [generate_vm_name(profile.get('name_prefix', 'vm'), vm_index) for vm_index in range(lo, hi)]
+        hosts = TOPOLOGY.members("hosts", "cluster", segment["target_cluster"])
+    else:
+        names = [f"vm-{num:03d}" for num in rng.integers(1, 1000, n).tolist()]
+        hosts = ENVIRONMENT_DATA["hosts"]
+
+    if hosts:
+        picked_hosts = _np_pick(rng, hosts, n)
+        host_names = [host.get("name") for host in picked_hosts]
+        clusters = [host.get("cluster") for host in picked_hosts]
+        datacenters = [segment["datacenter"] for _ in picked_hosts] if segment is not None else [host.get("datacenter") for host in picked_hosts]
+    else:
+        host_names = ["N/A_Host_Scenario" if segment is not None else "RandomHost"] * n
+        clusters = [segment["target_cluster"] if segment is not None else "RandomCluster"] * n
+        datacenters = [segment["datacenter"] if segment is not None else "RandomDC"] * n
+
+    folder_base = profile.get('folder_base', "VMs")
+    folder_options = {dc_name: planned_folders(dc_name, folder_base) or [generate_folder_name(base=folder_base)] for dc_name in dict.fromkeys(datacenters)}
+    folders = [folder_options[dc_name][int(u * len(folder_options[dc_name]))] for dc_name, u in zip(datacenters, rng.random(n).tolist())]
+
+    if segment is not None:
+        pools = [generate_resource_pool_name(cluster, "Resources") for cluster in clusters]
+    else:
+        pool_options = {cluster: [rp['name'] for rp in TOPOLOGY.members("resource_pools", "cluster", cluster)] or [generate_resource_pool_name(cluster, "Resources")] for cluster in set(clusters)}
+        pools = [pool_options[cluster][int(u * len(pool_options[cluster]))] for cluster, u in zip(clusters, rng.random(n).tolist())]
+
+    powered_on = rng.random(n) < 0.5
+    provisioned = rng.integers(20480, 204801, n)
+    in_use = np.where(powered_on, (provisioned * np.round(rng.uniform(0.1, 0.6, n), 2)).astype(np.int64), 0)
+    os_names = _np_pick(rng, os_name_options(profile.get('os_options')), n)
+    dns_prefixes = _np_strings(rng, n, 5, string.ascii_lowercase + string.digits)
+    ips = _np_ips(rng, n)
+    annotate = rng.random(n) < 0.7
+    vcpus = [int(profile['vcpu'])] * n if profile.get('vcpu') else _np_pick(rng, VM_VCPU_CHOICES, n)
+    memory = [int(profile['memory_mb'])] * n if profile.get('memory_mb') else _np_pick(rng, VM_MEMORY_MB_CHOICES, n)
+    if segment is not None:
+        nics = [len(profile.get('nics', [{'adapter_type': 'VMXNET3'}]))] * n
+        disks = [len(profile.get('disks', [{'size_gb': 50, 'thin_provisioned': True}]))] * n
+    else:
+        nics = rng.integers(complexity_params['min_nics_per_vm'], complexity_params['max_nics_per_vm'] + 1, n).tolist()
+        disks = rng.integers(complexity_params['min_disks_per_vm'], complexity_params['max_disks_per_vm'] + 1, n).tolist()
+    guest_ids = {os_name: os_name.lower().replace(" ", "-") for os_name in set(os_names)}
+
+    columns = {
+        "name": names, "power_state": _np_where(powered_on, ["PoweredOn"] * n, ["PoweredOff"] * n),
+        "is_template": [profile.get('is_template', False)] * n,
+        "sdk_server": [sdk_server_name] * n, "sdk_uuid": [base_sdk_uuid] * n,
+        "uuid": _np_uuids(rng, n, profile.get('uuid_prefix', '')),
+        "vm_version": _np_pick(rng, VM_VERSION_CHOICES, n),
+        "host": host_names, "cluster": clusters, "datacenter": datacenters, "resource_pool": pools, "folder": folders,
+        "provisioned_mb": provisioned.tolist(), "in_use_mb": in_use.tolist(), "os": os_names,
+        "dns_name": _np_where(powered_on, [f"{prefix}-{name.lower()}.internal" for prefix, name in zip(dns_prefixes, names)], [""] * n),
+        "ip_address": _np_where(powered_on, ips, [""] * n),
+        "num_cpu": vcpus, "memory_mb": memory, "num_nics": nics, "num_disks": disks,
+        "creation_date": _np_dates(rng, n, "2021-01-01", "2023-06-01"),
+        "annotation": _np_where(annotate, [f"Mock AI generated VM: {name}" for name in names], [""] * n),
+        "folder_path": [f"/{dc_name}/vm/{folder_name}/" for dc_name, folder_name in zip(datacenters, folders)],
+        "guest_id": [guest_ids[os_name] for os_name in os_names],
+    }
+    if segment is not None:
+        columns["profile_nics"] = [profile.get('nics')] * n
+        columns["profile_disks"] = [profile.get('disks')] * n
+        columns["profile_feature_likelihoods"] = [profile.get('feature_likelihoods', {})] * n
+    return columns
+
+# VM record fields held as numbers/booleans (the rest are already text), and vInfo headers the engine formats itself
+_COLUMNAR_NON_TEXT_FIELDS = frozenset({"is_template", "provisioned_mb", "in_use_mb", "num_cpu", "memory_mb", "num_nics", "num_disks"})
+_COLUMNAR_VINFO_GENERATED = frozenset({"Powerstate", "VM Version", "Provisioned MB", "In Use MB", "IP Address", "vCPU", "Memory MB", "NICs", "Disks", "Creation date"})
+
+def columnar_vm_records(plan, start, end, rng, sdk_server_name, base_sdk_uuid, complexity_params):
+    """Builds the VM records for plan indexes [start, end) column-wise; returns (records, vInfo block)."""
+    records = []
+    vinfo_columns = {header: [] for header in _VINFO_RECORD_FIELDS}
+    offset = 0
+    for count, segment in plan:
+        lo, hi = max(start, offset), min(end, offset + count)
+        offset += count
+        if lo >= hi:
+            continue
+        columns = _columnar_vm_segment(lo, hi, segment, rng, sdk_server_name, base_sdk_uuid, complexity_params)
+        records.extend(map(dict, map(functools.partial(zip, list(columns)), zip(*columns.values()))))
+        for header, field in _VINFO_RECORD_FIELDS.items():
+            vinfo_columns[header].extend(_str_column(columns[field]) if field in _COLUMNAR_NON_TEXT_FIELDS else columns[field])
+    return records, _csv_block(vinfo_columns, CSV_HEADERS["vInfo"], generated=_COLUMNAR_VINFO_GENERATED)
+
+_VM_CHILD_FIELDS = {"VM Name": "name", "Powerstate": "power_state", "Template": "is_template", "Host": "host", "Cluster": "cluster",
+                    "Datacenter": "datacenter", "VM UUID": "uuid", "VI SDK Server": "sdk_server", "VI SDK UUID": "sdk_uuid"}
+
+def _child_rows(counts):
+    """VM position and 1-based number of each child row (disk, NIC, snapshot), e.g. counts [2, 1] -> [0, 0, 1], [1, 2, 1]."""
+    counts = np.asarray(counts, dtype=np.int64)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    child_numbers = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    return owner.tolist(), child_numbers.tolist()
+
+def _vm_child_columns(vms, owner, headers):
+    """The VM columns every child table repeats, joined once per VM for each run of adjacent VM headers and
+    expanded to one entry per child row; keyed by the run's header tuple (see _csv_block)."""
+    per_header = dict(zip(_VM_CHILD_FIELDS, map(list, zip(*map(operator.itemgetter(*_VM_CHILD_FIELDS.values()), vms)))))
+    for header, field in _VM_CHILD_FIELDS.items():
+        per_header[header] = _str_column(per_header[header]) if field in _COLUMNAR_NON_TEXT_FIELDS else _quote_csv_column(per_header[header])
+    columns, run = {}, []
+    for header in list(headers) + [None]:
+        if header in _VM_CHILD_FIELDS:
+            run.append(header)
+        elif run:
+            per_vm = list(map(",".join, zip(*(per_header[h] for h in run))))
+            columns[tuple(run)] = [per_vm[i] for i in owner]
+            run = []
+    return columns
+
+def _child_profiles(vms, owner, child_numbers, profile_field):
+    """The scenario profile entry (disk or NIC) behind each child row; {} past the profile's list or without one."""
+    if not any(vm_rec.get(profile_field) for vm_rec in vms):
+        return [{}] * len(owner)
+    per_vm = [vm_rec.get(profile_field) or [] for vm_rec in vms]
+    return [per_vm[i][k - 1] if k <= len(per_vm[i]) else {} for i, k in zip(owner, child_numbers)]
+
+def columnar_vdisk_block(vms, rng, complexity_params, **_):
+    """vDisk rows for vms, one per virtual disk, as a (rows, text) block."""
+    owner, disk_numbers = _child_rows([vm_rec.get("num_disks", 1) for vm_rec in vms])
+    n = len(owner)
+    profiles = _child_profiles(vms, owner, disk_numbers, "profile_disks")
+
+    # Host-local plus the datacenter's shared datastores, looked up once per host rather than per disk
+    vm_keys = list(map(operator.itemgetter("host", "datacenter"), vms))
+    fallback_options = {}
+    for host_name, dc_name in set(vm_keys):
+        host_rec = TOPOLOGY.find("hosts", host_name)
+        fallback_options[(host_name, dc_name)] = list(host_rec.get("datastores_local", []) if host_rec else []) + [ds["name"] for ds in TOPOLOGY.members("datastores", "shared_datacenter", dc_name)]
+    vm_options = [fallback_options[key] or [generate_datastore_name(ds_type="fallback", ds_idx=vm_rec.get("uuid", "vm")[:4])] for key, vm_rec in zip(vm_keys, vms)]
+
+    # Disk label, capacity, mode and thin flag are emitted as one pre-joined run; without disk profiles they
+    # depend only on the disk number (the per-row mock reports 0 MB / blank thin then)
+    picks = rng.random(n)
+    disk_labels = [f"Hard disk {k}" for k in range(max(disk_numbers, default=0) + 1)]
+    if any(profiles):
+        datastores = []
+        for vm_pos, disk_profile, u in zip(owner, profiles, picks.tolist()):
+            options = vm_options[vm_pos]
+            if disk_profile:
+                if disk_profile.get('datastore_name_hint'):
+                    datastores.append(disk_profile['datastore_name_hint'])
+                    continue
+                if disk_profile.get('datastore_tag'):
+                    options = TOPOLOGY.names_containing("datastores", disk_profile['datastore_tag']) or options
+            datastores.append(options[int(u * len(options))])
+        disk_runs = [f"{disk_labels[k]},{p.get('size_gb', 0) * 1024},persistent,{'' if p.get('thin_provisioned') is None else p['thin_provisioned']}"
+                     for k, p in zip(disk_numbers, profiles)]
+    else:
+        option_counts = np.asarray([len(options) for options in vm_options], dtype=np.int64)[np.asarray(owner, dtype=np.int64)]
+        datastores = [vm_options[vm_pos][k] for vm_pos, k in zip(owner, (picks * option_counts).astype(np.int64).tolist())]
+        unprofiled_runs = [f"{label},0,persistent," for label in disk_labels]
+        disk_runs = [unprofiled_runs[k] for k in disk_numbers]
+
+    vmdk_names = [f"{k - 1}.vmdk" for k in range(len(disk_labels))]
+    path_middles = [f"] {vm_rec['name']}/{vm_rec['name']}_" for vm_rec in vms]
+    columns = _vm_child_columns(vms, owner, CSV_HEADERS["vDisk"])
+    columns[("Disk", "Capacity MB", "Disk Mode", "Thin")] = disk_runs
+    if _csv_safe(datastores) and _csv_safe(path_middles):
+        columns[("Path", "Datastore")] = [f"[{ds}{path_middles[vm_pos]}{vmdk_names[k]},{ds}" for ds, vm_pos, k in zip(datastores, owner, disk_numbers)]
+    else:
+        columns["Path"] = [f"[{ds}{path_middles[vm_pos]}{vmdk_names[k]}" for ds, vm_pos, k in zip(datastores, owner, disk_numbers)]
+        columns["Datastore"] = datastores
+    return _csv_block(columns, CSV_HEADERS["vDisk"])
+
+def columnar_vnetwork_block(vms, rng, complexity_params, **_):
+    """vNetwork rows for vms, one per network adapter, on the planned port groups like the per-row path."""
+    owner, nic_numbers = _child_rows([vm_rec.get("num_nics", 1) for vm_rec in vms])
+    n = len(owner)
+    profiles = _child_profiles(vms, owner, nic_numbers, "profile_nics")
+    # Unhinted NICs pick one of their datacenter's planned port groups (see plan_network_topology)
+    network_options = {dc_name: planned_networks(dc_name) or _np_network_names(rng, 1) for dc_name in dict.fromkeys(vm_rec.get("datacenter") for vm_rec in vms)}
+    labels = []
+    for i, u in enumerate(rng.random(n).tolist()):
+        options = network_options[vms[owner[i]].get("datacenter")]
+        labels.append(profiles[i].get("network_label_hint") or options[int(u * len(options))])
+    switches = [nic_switch_name(TOPOLOGY.find("networks", label), vms[owner[i]].get("host")) for i, label in enumerate(labels)]
+
+    powered_on = np.asarray([vm_rec.get("power_state") == "PoweredOn" for vm_rec in vms], dtype=bool)[np.asarray(owner, dtype=np.int64)]
+    connected = powered_on & (rng.random(n) < 0.95)
+    columns = _vm_child_columns(vms, owner, CSV_HEADERS["vNetwork"])
+    columns.update({
+        "Network adapter": [f"Network adapter {k}" for k in nic_numbers],
+        "Connected": _str_column(connected),
+        "Status": _np_where(connected, ["OK"] * n, ["Disconnected"] * n),
+        "MAC Address": _np_macs(rng, n),
+        "IP Address": _np_where(connected, _np_ips(rng, n), [""] * n),
+        "Network Label": labels,
+        "Switch": switches,
+        "Adapter Type": [p.get("adapter_type", "VMXNET3") for p in profiles],
+    })
+    return _csv_block(columns, CSV_HEADERS["vNetwork"], generated=("Network adapter", "Connected", "Status", "MAC Address", "IP Address"))
+
+def columnar_vsnapshot_block(vms, rng, complexity_params, **_):
+    """vSnapshot rows for vms: a Bernoulli draw per VM for having snapshots, then a uniform chain length."""
+    likelihoods = [vm_rec.get('profile_feature_likelihoods') or {} for vm_rec in vms]
+    snap_p = np.asarray([lk.get('snapshots', complexity_params.get('snapshot_likelihood', 0.3)) for lk in likelihoods], dtype=float)
+    max_snaps = np.asarray([lk.get('max_snapshots', complexity_params.get('max_snapshots_per_vm', 3)) for lk in likelihoods], dtype=np.int64)
+    counts = np.where(rng.random(len(vms)) < snap_p, rng.integers(1, max_snaps + 1), 0)
+    owner, snap_numbers = _child_rows(counts)
+    n = len(owner)
+    in_use = np.asarray([vm_rec.get("in_use_mb") or 0 for vm_rec in vms], dtype=np.int64)
+    size_high = np.maximum(np.where(in_use > 0, in_use // 2, 500), 100)[np.asarray(owner, dtype=np.int64)]
+
+    names = [vms[i].get("name") for i in owner]
+    columns = _vm_child_columns(vms, owner, CSV_HEADERS["vSnapshot"])
+    columns.update({
+        "Snapshot Name": [f"Snapshot {k} for {vm_name}" for k, vm_name in zip(snap_numbers, names)],
+        "Description": [f"Test snapshot {k}" for k in snap_numbers],
+        "Creation Date": _np_dates(rng, n, "2022-01-01", "2023-12-01"),
+        "Quiesced": _str_column(rng.random(n) < 0.6),
+        "State": _str_column([vms[i].get("power_state") for i in owner]),
+        "Size MB": _str_column(rng.integers(100, size_high + 1)),
+    })
+    return _csv_block(columns, CSV_HEADERS["vSnapshot"], generated=("Description", "Creation Date", "Quiesced", "Size MB"))
+
+_COLUMNAR_BLOCK_BUILDERS = {"vDisk": columnar_vdisk_block, "vNetwork": columnar_vnetwork_block, "vSnapshot": columnar_vsnapshot_block}
+
+# --- Run Profiling (--profile, --profile_dir) ---
+# With --profile, main() times every stage: each table task (sequential, threaded or in the process pool),
+# the sharded VM stage and the ZIP step. Wall time, CPU time (including pool workers) and tracemalloc
+# peak memory are recorded per stage, printed as a table and written to <output_dir>/run_profile.json.
+# --profile_dir also writes one cProfile file per stage (<stage>.prof, for pstats or snakeviz).
+PROFILE_REPORT_FILENAME = "run_profile.json"
+_PROFILER = None # Set by main() for --profile
+
+class StageProfiler:
+    """Collects wall/CPU time and peak traced memory per named stage; stages may run in threads."""
+
+    def __init__(self, cprofile_dir=None):
+        self.cprofile_dir = cprofile_dir
+        self.stages = []
+        self.started = time.perf_counter()
+        self._active = 0
+        self._lock = threading.Lock()
+        if cprofile_dir:
+            os.makedirs(cprofile_dir, exist_ok=True)
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        with self._lock:
+            self._active += 1
+            if self._active == 1:
+                tracemalloc.reset_peak() # Peaks of overlapping (threaded) stages are shared
+            overlapped = self._active > 1
+        profiler = cProfile.Profile() if self.cprofile_dir else None
+        children = _children_cpu_seconds()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.cprofile_dir, re.sub(r"[^\w.-]+", "_", name) + ".prof"))
+            worker_cpu = _children_cpu_seconds() - children # Pool workers that exited during the stage
+            with self._lock:
+                self._active -= 1
+                self.stages.append({"stage": name, "wall_seconds": time.perf_counter() - wall, "cpu_seconds": time.thread_time() - cpu + worker_cpu,
+                                    "peak_traced_mb": tracemalloc.get_traced_memory()[1] / (1 << 20), "overlapped": overlapped or self._active > 0})
+
+    def report(self):
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None
+        return {"total_wall_seconds": time.perf_counter() - self.started, "peak_rss_mb": peak_rss_mb, "stages": list(self.stages)}
+
+    def print_summary(self):
+        report = self.report()
+        peak_rss = f", peak RSS {report['peak_rss_mb']:.0f} MB" if report["peak_rss_mb"] is not None else ""
+        print(f"\n--- Run profile ({report['total_wall_seconds']:.2f}s wall{peak_rss}) ---")
+        print(f"{'stage':<36} {'wall s':>9} {'cpu s':>9} {'peak MB':>9}")
+        for stage in sorted(report["stages"], key=lambda s: -s["wall_seconds"]):
+            note = " (overlapped)" if stage["overlapped"] else ""
+            print(f"{stage['stage']:<36} {stage['wall_seconds']:>9.2f} {stage['cpu_seconds']:>9.2f} {stage['peak_traced_mb']:>9.1f}{note}")
+
+    def close(self, report_path):
+        tracemalloc.stop()
+        with open(report_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+def _children_cpu_seconds():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def profile_stage(name):
+    """Times the enclosed block as a --profile stage; a no-op when profiling is off."""
+    return _PROFILER.stage(name) if _PROFILER is not None else contextlib.nullcontext()
+
+# --- Process Pool Execution (--workers) ---
+def run_generation_task(name, task_config):
+    """Runs one table generator on its own RNG stream; read-only on the topology if it declares no outputs."""
+    read_only = TOPOLOGY.read_only(name) if "outputs" in task_config and not task_config["outputs"] else contextlib.nullcontext()
+    with use_rng_stream("table", name), profile_stage(name), read_only:
+        task_config["func"](**task_config["args"])
+
+def _init_table_worker(env_snapshot, output_dir, run_seed):
+    """Pool initializer: installs the parent's finished topology and points write_csv at output_dir."""
+    global _ZIP_EXPORTER
+    _ZIP_EXPORTER = None # Never share the parent's open archive with a forked child
+    set_run_seed(run_seed)
+    ENVIRONMENT_DATA.clear()
+    ENVIRONMENT_DATA.update(env_snapshot)
+    ENVIRONMENT_DATA["config"] = {**env_snapshot.get("config", {}), "output_dir": output_dir}
+
+def _run_table_task(name, task_config, archetypes=None):
+    """Runs one table generator inside a pool worker; returns its manifest entries and its archetype handoff."""
+    EXPORT_MANIFEST.clear()
+    archetype_pool = install_archetype_pool(archetypes)
+    run_generation_task(name, task_config)
+    return dict(EXPORT_MANIFEST), archetype_pool.handoff() if archetype_pool is not None else None
+
+def run_tasks_in_process_pool(tasks_configs, num_workers, output_dir):
+    """Runs table generators in a ProcessPoolExecutor against a snapshot of the finished topology.
+
+    Workers write their tables to the staging directory, or to a scratch directory that is then
+    copied into the archive when --direct_zip is active. Manifest entries are merged back in
+    submission order so the parent ends up as if the tasks had run in-process. Table generators
+    only read the planned topology (see plan_network_topology), so there is nothing else to merge.
+    """
+    if not tasks_configs: return
+    exporter = _ZIP_EXPORTER
+    worker_output_dir = tempfile.mkdtemp(prefix=".rvt_workers_", dir=output_dir) if exporter is not None else output_dir
+    env_snapshot = {key: value for key, value in ENVIRONMENT_DATA.items()}
+    archetype_pool, archetypes = get_archetype_pool(), archetype_handoff()
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_table_worker, initargs=(env_snapshot, worker_output_dir, _RUN_SEED)) as pool:
+            futures = []
+            for name, task_config in tasks_configs.items():
+                print(f"Submitting {name} to worker pool...")
+                futures.append((name, pool.submit(_run_table_task, name, task_config, archetypes)))
+
+            for name, future in tqdm(futures, desc="Collecting Workers") if TQDM_AVAILABLE else futures:
+                try:
+                    manifest_entries, authored = future.result()
+                except Exception as e:
+                    print(f"Error in worker task {name}: {e}")
+                    continue
+                if authored is not None:
+                    archetype_pool.absorb(authored)
+                for arcname, entry in manifest_entries.items():
+                    if exporter is not None:
+                        exporter.write_file(arcname, os.path.join(worker_output_dir, arcname))
+                    EXPORT_MANIFEST[arcname] = entry
+    finally:
+        if exporter is not None:
+            shutil.rmtree(worker_output_dir, ignore_errors=True)
+
+# --- Sharded VM Generation (--workers with vInfo selected) ---
+# vInfo plus the tables emitted once per VM are built shard by shard; the rest run on the merged topology.
+_SHARD_ROW_ITERS = {"vDisk": _iter_vdisk_rows, "vNetwork": _iter_vnetwork_rows, "vSnapshot": _iter_vsnapshot_rows}
+SHARDED_TABLES = ("vInfo",) + tuple(_SHARD_ROW_ITERS)
+_SHARD_TOPOLOGY_BLOB = None # Pickled post-topology ENVIRONMENT_DATA, set in each shard worker
+
+def _init_shard_worker(topology_blob, run_seed):
+    global _ZIP_EXPORTER, _SHARD_TOPOLOGY_BLOB
+    _ZIP_EXPORTER = None # Never share the parent's open archive with a forked child
+    _SHARD_TOPOLOGY_BLOB = topology_blob
+    set_run_seed(run_seed)
+
+def _run_vm_shard(shard_index, start, end, plan, tables, part_dir, vinfo_args, archetypes=None):
+    """Builds VMs [start, end) of the plan and writes their rows for each table to headerless part files.
+
+    Every shard starts from a fresh copy of the same topology snapshot, each VM is built on its own
+    RNG stream and each table on a per-shard stream, so what a shard produces depends only on its
+    index range, not on which worker ran it or what ran there before. With --engine numpy the
+    shard's VMs and tables are built column-wise instead (see columnar_vm_records). Worker shards
+    get the parent's archetypes and return the archetype handoff; in-process shards use the parent's pool.
+    """
+    archetype_pool = None
+    with TOPOLOGY.scratch_copy(pickle.loads(_SHARD_TOPOLOGY_BLOB)), TOPOLOGY.read_only(f"VM shard {shard_index}"):
+        if archetypes is not None:
+            archetype_pool = install_archetype_pool(archetypes)
+        columnar = use_columnar_engine(vinfo_args)
+        if columnar:
+            with use_rng_stream("shard", shard_index, "vms"):
+                vms, vinfo_block = columnar_vm_records(plan, start, end, _np_stream("shard", shard_index, "vms"),
+                                                       vinfo_args["sdk_server_name"], vinfo_args["base_sdk_uuid"], vinfo_args["complexity_params"])
+        else:
+            units = ((_vm_record_steps(vm_index, segment, vinfo_args["sdk_server_name"], vinfo_args["base_sdk_uuid"], vinfo_args["complexity_params"],
+                                       vinfo_args["use_ai_cli_flag"], vinfo_args["ai_provider_cli_arg"], vinfo_args.get("ollama_model_name", "llama3")), rng_stream("vm", vm_index))
+                     for vm_index, segment in _iter_vm_plan(plan, start, end))
+            vms = list(iter_ai_units(units, vinfo_args["use_ai_cli_flag"], vinfo_args["ai_provider_cli_arg"]))
+
+        row_args = {key: vinfo_args.get(key) for key in ("complexity_params", "scenario_config", "use_ai_cli_flag", "ai_provider_cli_arg", "ollama_model_name")}
+        parts = {}
+        for table in tables:
+            part_path = os.path.join(part_dir, f"{table}.{shard_index:06d}.part")
+            if columnar:
+                with use_rng_stream("shard", shard_index, table): # For the few fallbacks that still draw from current_rng()
+                    block = vinfo_block if table == "vInfo" else _COLUMNAR_BLOCK_BUILDERS[table](vms, _np_stream("shard", shard_index, table), **row_args)
+                with open(part_path, 'wb') as f:
+                    row_count, _, _ = _write_csv_blocks_stream(f, [block], CSV_HEADERS[table], write_header=False)
+            else:
+                if table == "vInfo":
+                    rows = (_vinfo_row_from_vm_record(vm_rec) for vm_rec in vms)
+                else:
+                    rows = _SHARD_ROW_ITERS[table](vms=vms, **row_args)
+                with use_rng_stream("shard", shard_index, table), open(part_path, 'wb') as f:
+                    row_count, _, _ = _write_csv_stream(f, rows, CSV_HEADERS[table], write_header=False)
+            parts[table] = (part_path, row_count)
+
+    return vms, parts, archetype_pool.handoff() if archetype_pool is not None else None
+
+def _run_vm_shard_in_process(topology_blob, *shard_args):
+    """Runs a shard in this process (--workers 0); scratch_copy keeps the parent's topology intact."""
+    global _SHARD_TOPOLOGY_BLOB
+    _SHARD_TOPOLOGY_BLOB = topology_blob
+    try:
+        return _run_vm_shard(*shard_args)
+    finally:
+        _SHARD_TOPOLOGY_BLOB = None
+
+def run_sharded_vm_generation(vinfo_args, tables, num_workers, shard_size, output_dir):
+    """Generates vInfo and the per-VM tables (vDisk, vNetwork, vSnapshot) in fixed-size VM shards.
+
+    The topology is built once here; shards of shard_size VM indexes then run in a process pool,
+    or one after another in this process when num_workers is 0. With --ai_archetypes, shards run
+    here until every AI table among them has its K archetypes, and the pool gets only the rest.
+    Part files and VM records are merged back in shard order, so for a given seed the result is
+    the same for any worker count.
+    """
+    plan = _build_vinfo_topology(vinfo_args["num_vms"], vinfo_args["sdk_server_name"], vinfo_args["base_sdk_uuid"], vinfo_args["complexity_params"], vinfo_args.get("scenario_config"))
+    plan_network_topology(plan, vinfo_args["complexity_params"])
+    ENVIRONMENT_DATA["vm_plan"] = plan
+    total_planned = sum(count for count, _ in plan)
+    topology_blob = pickle.dumps(dict(ENVIRONMENT_DATA), protocol=pickle.HIGHEST_PROTOCOL)
+    shard_size = max(1, shard_size)
+
+    os.makedirs(output_dir, exist_ok=True)
+    part_dir = tempfile.mkdtemp(prefix=".rvt_shards_", dir=output_dir)
+    shard_args = [(shard_index, start, min(start + shard_size, total_planned), plan, tables, part_dir, vinfo_args)
+                  for shard_index, start in enumerate(range(0, total_planned, shard_size))]
+    parts_by_table = {table: [] for table in tables}
+    archetype_pool = get_archetype_pool() if num_workers > 0 else None
+    authoring = [table for table in tables if table in AI_TABLES] if archetype_pool is not None else []
+
+    def shard_results(pool):
+        pending = iter(shard_args)
+        if pool is None:
+            yield from (_run_vm_shard_in_process(topology_blob, *args) for args in pending)
+            return
+        # The first shards author the archetypes here, exactly as with --workers 0; workers only amplify them
+        for args in pending:
+            if not authoring or archetype_pool.full(authoring):
+                archetypes = archetype_handoff()
+                futures = [pool.submit(_run_vm_shard, *rest, archetypes) for rest in itertools.chain([args], pending)]
+                yield from (future.result() for future in futures)
+                return
+            yield _run_vm_shard_in_process(topology_blob, *args)
+
+    try:
+        pool_context = ProcessPoolExecutor(max_workers=num_workers, initializer=_init_shard_worker, initargs=(topology_blob, _RUN_SEED)) if num_workers > 0 else contextlib.nullcontext()
+        with pool_context as pool:
+            results = shard_results(pool)
+            for vms, parts, authored in tqdm(results, total=len(shard_args), desc="Merging VM Shards") if TQDM_AVAILABLE else results:
+                if authored is not None:
+                    archetype_pool.absorb(authored)
+                for vm_rec in vms:
+                    TOPOLOGY.add("vms", vm_rec) # Links the VM into its host, cluster and datacenter
+                for table, part in parts.items():
+                    parts_by_table[table].append(part)
+
+        for table in tables:
+            write_csv(parts_by_table[table], table, CSV_HEADERS[table], stream_writer=_write_csv_parts_stream)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    print(f"vInfo CSV generated with {total_planned} VMs in {len(shard_args)} shards. ENVIRONMENT_DATA updated.")
+
+# --- Environment Snapshots (--save_env, --load_env) ---
+# --save_env writes the finished topology (every ENVIRONMENT_DATA list plus the SDK server map) as a
+# zlib-compressed pickle. --load_env installs it instead of building a new one, so a later run can
+# regenerate some --csv_types against the same VMs and hosts without re-running vInfo. The snapshot
+# records a hash of the scenario file it was built from; loading it with a different --config_file
+# is refused as stale. Snapshots are pickles: only load files you created.
+ENV_SNAPSHOT_MAGIC = b"RVTENV1\n"
+
+def scenario_fingerprint(config_file_path):
+    """SHA-256 of the scenario file's bytes, or None for randomly generated environments."""
+    if not config_file_path:
+        return None
+    with open(config_file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def save_environment_snapshot(path, scenario_hash, generation):
+    """Writes ENVIRONMENT_DATA (minus the run config) to path; returns the file size in bytes."""
+    payload = {"scenario_hash": scenario_hash, "generation": generation,
+               "environment": {kind: value for kind, value in ENVIRONMENT_DATA.items() if kind != "config"}}
+    blob = ENV_SNAPSHOT_MAGIC + zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), 6)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(blob)
+    os.replace(temp_path, path) # Never leave a half-written snapshot behind
+    return len(blob)
+
+def load_environment_snapshot(path, scenario_hash):
+    """Installs the snapshot at path into ENVIRONMENT_DATA and returns its metadata.
+
+    Raises ValueError if the file is not a snapshot, or if scenario_hash (the current --config_file)
+    is set and differs from the scenario the snapshot was built from.
+    """
+    with open(path, "rb") as f:
+        blob = f.read()
+    if not blob.startswith(ENV_SNAPSHOT_MAGIC):
+        raise ValueError(f"{path} is not an environment snapshot written by --save_env")
+    payload = pickle.loads(zlib.decompress(blob[len(ENV_SNAPSHOT_MAGIC):]))
+    if scenario_hash is not None and payload["scenario_hash"] != scenario_hash:
+        raise ValueError(f"{path} is stale: it was built from {'another scenario file' if payload['scenario_hash'] else 'a random environment'}. "
+                         "Re-create it with --save_env.")
+    for kind, value in payload["environment"].items():
+        ENVIRONMENT_DATA[kind] = value # New list objects; TOPOLOGY re-indexes them on the next lookup
+    return {"scenario_hash": payload["scenario_hash"], "generation": payload["generation"], "kinds": tuple(payload["environment"])}
+
+def generate_vinfo_csv_from_records(**_):
+    """vInfo for a loaded snapshot: rows are re-emitted from the VM records instead of building new VMs."""
+    write_csv((_vinfo_row_from_vm_record(vm_rec) for vm_rec in ENVIRONMENT_DATA["vms"]), "vInfo", CSV_HEADERS["vInfo"])
+
+# --- Time Series Export (--series, --interval) ---
+# --series N writes N exports of one estate, --interval apart. Step 0 is the normal run; every later step
+# applies small deltas to the in-memory model instead of regenerating it: a share of the VMs is deleted
+# and replaced (churn) and the estate grows, in-use storage creeps up, some disks are expanded, and
+# snapshots grow, get consolidated or are taken. The per-VM tables of step 0 are read back from its ZIP
+# and only the rows of changed VMs are rebuilt; vHost, vCluster and the other host-level tables are
+# regenerated from the drifted VM list each step. Each step draws from its own ("series", step) stream.
+SERIES_VM_TABLES = ("vDisk", "vNetwork", "vSnapshot") # vInfo is re-emitted from the VM records
+SERIES_SNAPSHOT_CONSOLIDATE = 0.25 # Chance per step that an existing snapshot is removed
+SERIES_NEW_SNAPSHOT = 0.05 # Chance per step that a powered-on VM takes a new snapshot
+_INTERVAL_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+def parse_interval(text):
+    """argparse type for --interval: a number and a unit (s, m, h, d, w), e.g. 7d or 12h."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw])\s*", text or "")
+    if not match or float(match.group(1)) <= 0:
+        raise argparse.ArgumentTypeError(f"invalid interval {text!r}; use a number and a unit (s, m, h, d, w), e.g. 7d")
+    return datetime.timedelta(**{_INTERVAL_UNITS[match.group(2)]: float(match.group(1))})
+
+def series_zip_filename(template, when, step):
+    """The ZIP name for a series step: {timestamp} is the step's date, else the step number is appended."""
+    if "{timestamp}" in template:
+        return template.replace("{timestamp}", when.strftime("%Y%m%d_%H%M%S"))
+    root, ext = os.path.splitext(template)
+    return f"{root}_step{step:03d}{ext or '.zip'}"
+
+class SeriesModel:
+    """The estate of a --series run: VM records in ENVIRONMENT_DATA plus the per-VM rows read back from step 0.
+
+    source is step 0's ZIP, or its staging directory when the export itself is not a CSV archive (--format xlsx).
+    """
+
+    def __init__(self, source, tables, table_kwargs):
+        self.write_vinfo = "vInfo" in tables
+        self.tables = [table for table in SERIES_VM_TABLES if table in tables]
+        self.table_kwargs = table_kwargs
+        self.rows = {table: {} for table in self.tables} # table -> VM UUID -> rows (lists of strings)
+        with contextlib.ExitStack() as stack:
+            zf = stack.enter_context(zipfile.ZipFile(source)) if zipfile.is_zipfile(source) else None
+            for table in self.tables:
+                if zf is not None:
+                    f = stack.enter_context(io.TextIOWrapper(zf.open(f"{DEFAULT_CSV_SUBDIR}/{table}.csv"), encoding="utf-8", newline=""))
+                else:
+                    f = stack.enter_context(open(os.path.join(source, f"{table}.csv"), encoding="utf-8", newline=""))
+                reader = csv.reader(f)
+                uuid_column = next(reader).index("VM UUID")
+                for row in reader:
+                    self.rows[table].setdefault(row[uuid_column], []).append(row)
+        self.next_vm_index = max(sum(count for count, _ in ENVIRONMENT_DATA["vm_plan"]), len(ENVIRONMENT_DATA["vms"]))
+
+    def _new_vms(self, count, when, rng):
+        """Builds count VMs from the deployment plan (weighted by segment size), created at when."""
+        plan = [(count, segment) for count, segment in ENVIRONMENT_DATA["vm_plan"] if count > 0] or [(1, None)]
+        segments = rng.choices([segment for _, segment in plan], weights=[count for count, _ in plan], k=count)
+        cfg = self.table_kwargs
+        sdk_server_name, base_sdk_uuid = get_sdk_server_info()
+        units = []
+        for segment in segments:
+            units.append((_vm_record_steps(self.next_vm_index, segment, sdk_server_name, base_sdk_uuid, cfg["complexity_params"],
+                                           cfg["use_ai_cli_flag"], cfg["ai_provider_cli_arg"], cfg["ollama_model_name"]), rng_stream("vm", self.next_vm_index)))
+            self.next_vm_index += 1
+        vms = list(iter_ai_units(units, cfg["use_ai_cli_flag"], cfg["ai_provider_cli_arg"]))
+        for vm_rec in vms:
+            vm_rec["creation_date"] = when.strftime(DEFAULT_DATE_FORMAT)
+            host_rec = TOPOLOGY.find("hosts", vm_rec.get("host")) or {} # With several vCenters, the host's is the VM's
+            vm_rec["sdk_server"], vm_rec["sdk_uuid"] = host_rec.get("sdk_server", sdk_server_name), host_rec.get("sdk_uuid", base_sdk_uuid)
+        return vms
+
+    def advance(self, step, when, churn, growth, disk_growth):
+        """Applies one interval of drift; returns (deleted, created) VM counts."""
+        with use_rng_stream("series", step) as rng:
+            vms = ENVIRONMENT_DATA["vms"]
+            deleted = [vm_rec for vm_rec in vms if rng.random() < churn]
+            TOPOLOGY.discard("vms", deleted)
+            for vm_rec in deleted:
+                for table_rows in self.rows.values():
+                    table_rows.pop(vm_rec.get("uuid"), None)
+
+            for vm_rec in ENVIRONMENT_DATA["vms"]:
+                if vm_rec.get("power_state") != "PoweredOn":
+                    continue
+                provisioned = int(vm_rec.get("provisioned_mb") or 0)
+                if rng.random() < disk_growth and self.rows.get("vDisk", {}).get(vm_rec.get("uuid")):
+                    disk_row = rng.choice(self.rows["vDisk"][vm_rec["uuid"]])
+                    column = CSV_HEADERS["vDisk"].index("Capacity MB")
+                    added_mb = rng.choice([10, 20, 50, 100]) * 1024
+                    disk_row[column] = str(int(float(disk_row[column] or 0)) + added_mb)
+                    provisioned += added_mb
+                    vm_rec["provisioned_mb"] = provisioned
+                vm_rec["in_use_mb"] = min(provisioned, int(int(vm_rec.get("in_use_mb") or 0) * rng.uniform(1.0, 1.03)))
+
+            self._age_snapshots(when, rng)
+
+            added = len(vms) * growth # Replacements for the deleted VMs come on top
+            created = self._new_vms(len(deleted) + int(added) + (rng.random() < added % 1), when, rng)
+        for vm_rec in created:
+            TOPOLOGY.add("vms", vm_rec)
+        cfg = self.table_kwargs
+        iterators = {"vDisk": _iter_vdisk_rows, "vNetwork": _iter_vnetwork_rows} # New VMs start without snapshots
+        for table in self.tables:
+            if table in iterators:
+                with use_rng_stream("series", step, table):
+                    for row in iterators[table](vms=created, **cfg):
+                        self.rows[table].setdefault(row[CSV_HEADERS[table].index("VM UUID")], []).append([str(value) for value in row])
+        return len(deleted), len(created)
+
+    def _age_snapshots(self, when, rng):
+        snapshots = self.rows.get("vSnapshot")
+        if snapshots is None:
+            return
+        size_column = CSV_HEADERS["vSnapshot"].index("Size MB")
+        for uuid in list(snapshots):
+            kept = [row for row in snapshots[uuid] if rng.random() >= SERIES_SNAPSHOT_CONSOLIDATE]
+            for row in kept:
+                row[size_column] = str(int(int(float(row[size_column] or 0)) * rng.uniform(1.02, 1.15)))
+            if kept:
+                snapshots[uuid] = kept
+            else:
+                del snapshots[uuid]
+        for vm_rec in ENVIRONMENT_DATA["vms"]:
+            if vm_rec.get("power_state") == "PoweredOn" and rng.random() < SERIES_NEW_SNAPSHOT:
+                chain = snapshots.setdefault(vm_rec.get("uuid"), [])
+                row = {"VM Name": vm_rec.get("name"), "Powerstate": vm_rec.get("power_state"), "Template": vm_rec.get("is_template", False),
+                       "Host": vm_rec.get("host"), "Cluster": vm_rec.get("cluster"), "Datacenter": vm_rec.get("datacenter"),
+                       "VM UUID": vm_rec.get("uuid"), "VI SDK Server": vm_rec.get("sdk_server"), "VI SDK UUID": vm_rec.get("sdk_uuid"),
+                       "Snapshot Name": f"Snapshot {len(chain) + 1} for {vm_rec.get('name')}", "Description": f"Scheduled snapshot {when:%Y-%m-%d}",
+                       "Creation Date": when.strftime(DEFAULT_DATE_FORMAT), "Quiesced": rng.random() < 0.6, "State": vm_rec.get("power_state"),
+                       "Size MB": rng.randint(100, 2048)}
+                chain.append([str(row.get(header, "")) for header in CSV_HEADERS["vSnapshot"]])
+
+    def write_tables(self):
+        """Writes vInfo and the cached per-VM tables, rows grouped by VM in vInfo order."""
+        if self.write_vinfo:
+            write_csv((_vinfo_row_from_vm_record(vm_rec) for vm_rec in ENVIRONMENT_DATA["vms"]), "vInfo", CSV_HEADERS["vInfo"])
+        for table in self.tables:
+            table_rows = self.rows[table]
+            write_csv((row for vm_rec in ENVIRONMENT_DATA["vms"] for row in table_rows.get(vm_rec.get("uuid"), ())), table, CSV_HEADERS[table])
+
+def run_series(first_zip_filepath, tasks, run_task, args, series_start, table_kwargs, zip_date_time=None):
+    """Writes steps 1 .. --series - 1 after step 0 (the normal run) was packed into first_zip_filepath.
+    With --format xlsx each step is staged as CSVs and converted, like step 0.
+
+    table_kwargs are the keyword arguments shared by the table generators (complexity, scenario, AI flags).
+    """
+    global _ZIP_EXPORTER
+    tables = set(tasks).union(*(task.get("sharded", ()) for task in tasks.values()))
+    staging_dir = os.path.join(args.output_dir, DEFAULT_CSV_SUBDIR)
+    model = SeriesModel(staging_dir if args.format == "xlsx" else first_zip_filepath, tables, table_kwargs)
+    zip_options = zip_compression_options(args)
+    host_level_tasks = [name for wave in plan_task_waves(tasks) for name in wave if name != "vInfo" and name not in SERIES_VM_TABLES]
+    for step in range(1, args.series):
+        when = series_start + step * args.interval
+        zip_filepath = os.path.join(args.output_dir, output_filename(series_zip_filename(args.zip_filename, when, step), args.format))
+        if os.path.exists(zip_filepath) and not args.force_overwrite:
+            print(f"ZIP file {zip_filepath} already exists. Use --force_overwrite to replace. Stopping the series at step {step}.")
+            return
+        EXPORT_MANIFEST.clear()
+        if args.format == "zip":
+            _ZIP_EXPORTER = ZipCsvExporter(zip_filepath, date_time=zip_date_time or when.timetuple()[:6], **zip_options)
+        try:
+            with profile_stage(f"series step {step}"):
+                deleted, created = model.advance(step, when, args.series_churn, args.series_growth, args.series_disk_growth)
+                model.write_tables()
+            for name in host_level_tasks:
+                run_task(name)
+        finally:
+            if _ZIP_EXPORTER is not None:
+                _ZIP_EXPORTER.close()
+                _ZIP_EXPORTER = None
+        if args.format == "xlsx":
+            write_staged_xlsx(zip_filepath, args.output_dir, zip_date_time or when.timetuple()[:6], **zip_options)
+        print(f"Series step {step} ({when:%Y-%m-%d %H:%M}): {deleted} VMs deleted, {created} created, {len(ENVIRONMENT_DATA['vms'])} total -> {zip_filepath}")
+
+# --- Task Scheduling (DAG) ---
+# Every table generator declares the ENVIRONMENT_DATA kinds it reads (inputs) and adds records to
+# (outputs); a task is ready once every task producing one of its inputs has finished. "pool" marks
+# the tasks that --workers may run in a worker process; the others always run in the main process.
+# The placeholder generators read nothing yet, so they are ready immediately.
+_VINFO_OUTPUTS = ("datacenters", "clusters", "resource_pools", "hosts", "datastores", "networks", "dvSwitches", "vswitches", "folders", "vms")
+GENERATION_TASKS = {
+    "vInfo": {"func": generate_vinfo_csv, "inputs": (), "outputs": _VINFO_OUTPUTS, "pool": False},
+    "vHost": {"func": generate_vhost_csv, "inputs": ("hosts", "vms"), "outputs": (), "pool": False},
+    "vCluster": {"func": generate_vcluster_csv, "inputs": ("clusters", "hosts", "vms"), "outputs": (), "pool": False},
+    "vDatastore": {"func": generate_vdatastore_csv, "inputs": ("datastores", "hosts", "vms"), "outputs": (), "pool": False},
+    "vRP": {"func": generate_vrp_csv, "inputs": (), "outputs": (), "pool": False},
+    "vDisk": {"func": generate_vdisk_csv, "inputs": ("vms", "hosts", "datastores"), "outputs": (), "pool": True},
+    "vNetwork": {"func": generate_vnetwork_csv, "inputs": ("vms", "networks", "dvSwitches", "vswitches"), "outputs": (), "pool": True},
+    "vSnapshot": {"func": generate_vsnapshot_csv, "inputs": ("vms",), "outputs": (), "pool": True},
+    "vTools": {"func": generate_vtools_csv, "inputs": (), "outputs": (), "pool": True},
+    "vPartition": {"func": generate_vpartition_csv, "inputs": (), "outputs": (), "pool": True},
+    "vCD": {"func": generate_vcd_csv, "inputs": (), "outputs": (), "pool": True},
+    "vFloppy": {"func": generate_vfloppy_csv, "inputs": (), "outputs": (), "pool": True},
+    "vUSB": {"func": generate_vusb_csv, "inputs": (), "outputs": (), "pool": True},
+    "vHBA": {"func": generate_vhba_csv, "inputs": ("hosts",), "outputs": (), "pool": True},
+    "vNIC": {"func": generate_vnic_csv, "inputs": (), "outputs": (), "pool": True},
+    "vSwitch": {"func": generate_vswitch_csv, "inputs": (), "outputs": (), "pool": True},
+    "vPort": {"func": generate_vport_csv, "inputs": (), "outputs": (), "pool": True},
+    "dvSwitch": {"func": generate_dvswitch_csv, "inputs": (), "outputs": (), "pool": True},
+    "dvPort": {"func": generate_dvport_csv, "inputs": (), "outputs": (), "pool": True},
+    "vTag": {"func": generate_vtag_csv, "inputs": (), "outputs": (), "pool": True},
+}
+
+def _producers(tasks):
+    """Maps each ENVIRONMENT_DATA kind to the tasks (in declaration order) that add records to it."""
+    producers = {}
+    for name, task in tasks.items():
+        for kind in task["outputs"]:
+            producers.setdefault(kind, []).append(name)
+    return producers
+
+def select_generation_tasks(requested, tasks=None, available=()):
+    """Adds the upstream tasks the requested tables need; returns (names in declaration order, {pulled-in name: requesters}).
+
+    Kinds listed in available (e.g. loaded with --load_env) need no producer.
+    """
+    tasks = GENERATION_TASKS if tasks is None else tasks
+    producers = {kind: names for kind, names in _producers(tasks).items() if kind not in available}
+    selected, pulled_in = set(), {}
+    pending = [name for name in requested if name in tasks]
+    selected.update(pending)
+    while pending:
+        name = pending.pop()
+        for kind in tasks[name]["inputs"]:
+            for producer in producers.get(kind, []):
+                if producer == name:
+                    continue
+                if producer not in selected:
+                    selected.add(producer)
+                    pending.append(producer)
+                if producer not in requested:
+                    pulled_in.setdefault(producer, []).append(name)
+    return [name for name in tasks if name in selected], {name: sorted(set(requesters)) for name, requesters in pulled_in.items()}
+
+def task_dependencies(tasks):
+    """{task: set of tasks it waits for}: the other tasks in this plan producing one of its inputs."""
+    producers = _producers(tasks)
+    return {name: {producer for kind in task["inputs"] for producer in producers.get(kind, []) if producer != name} for name, task in tasks.items()}
+
+def plan_task_waves(tasks):
+    """Groups tasks into waves whose dependencies all lie in earlier waves.
+
+    Within a wave, main-process tasks come first and then pool tasks, each in declaration order;
+    sequential runs follow this order too, so archive entries line up for any --workers count.
+    """
+    dependencies = task_dependencies(tasks)
+    done, waves = set(), []
+    while len(done) < len(tasks):
+        ready = [name for name in tasks if name not in done and dependencies[name] <= done]
+        if not ready:
+            raise ValueError(f"Generation tasks have a dependency cycle: {', '.join(name for name in tasks if name not in done)}")
+        waves.append(sorted(ready, key=lambda name: tasks[name]["pool"])) # sorted() is stable
+        done.update(ready)
+    return waves
+
+def run_task_graph_threaded(tasks, run_task):
+    """Runs each task in its own thread as soon as the tasks it depends on have finished."""
+    dependencies = task_dependencies(tasks)
+    plan_order = [name for wave in plan_task_waves(tasks) for name in wave]
+    done, running = set(), {}
+    progress = tqdm(total=len(tasks), desc="Generation Tasks") if TQDM_AVAILABLE else None
+    with ThreadPoolExecutor(max_workers=max(1, len(tasks)), thread_name_prefix="Task") as executor:
+        while len(done) < len(tasks):
+            for name in plan_order:
+                if name not in done and name not in running.values() and dependencies[name] <= done:
+                    print(f"Starting thread for {name}...")
+                    running[executor.submit(run_task, name)] = name
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error in task {name}: {e}")
+                done.add(name) # Dependents still run; generators skip tables whose inputs are empty
+                if progress is not None:
+                    progress.update(1)
+    if progress is not None:
+        progress.close()
+
+def build_generation_tasks(task_names, vinfo_args, table_kwargs, from_records=False):
+    """Task configs for task_names. VM-level tables are folded into the vInfo task, which builds them in shards;
+    with from_records (--load_env) vInfo is re-emitted from the loaded VM records instead."""
+    tasks = {name: dict(GENERATION_TASKS[name], args=table_kwargs) for name in task_names}
+    if "vInfo" in tasks:
+        tasks["vInfo"]["args"] = vinfo_args
+        if from_records:
+            tasks["vInfo"].update(func=generate_vinfo_csv_from_records, inputs=("vms",), outputs=())
+    sharded_tables = [name for name in SHARDED_TABLES if name in tasks] if "vInfo" in tasks and not from_records else []
+    if sharded_tables:
+        absorbed = [tasks.pop(name) for name in sharded_tables if name != "vInfo"]
+        outputs = tuple(dict.fromkeys(kind for task in [tasks["vInfo"]] + absorbed for kind in task["outputs"]))
+        inputs = tuple(dict.fromkeys(kind for task in absorbed for kind in task["inputs"] if kind not in outputs))
+        tasks["vInfo"].update(inputs=inputs, outputs=outputs, sharded=sharded_tables,
+                              label=" + ".join(["vInfo"] + [", ".join(table for table in sharded_tables if table != "vInfo")] * bool(absorbed)))
+    return tasks
+
+def run_planned_task(name, task_config, engine, workers, shard_size, output_dir):
+    """Runs one task from build_generation_tasks(); the vInfo task generates its sharded tables in --workers processes."""
+    if task_config.get("sharded"):
+        print(f"Generating {', '.join(task_config['sharded'])} in shards of {shard_size} VMs...")
+        with profile_stage(task_config["label"]):
+            run_sharded_vm_generation(dict(task_config["args"], engine=engine), task_config["sharded"], workers, shard_size, output_dir)
+    else:
+        print(f"Generating {name}...")
+        run_generation_task(name, task_config)
+
+def explain_task_plan(tasks, pulled_in, args):
+    """Prints the --explain plan: waves, inputs with their producers, outputs and placement."""
+    dependencies = task_dependencies(tasks)
+    waves = plan_task_waves(tasks)
+    if args.workers > 0:
+        mode = f"waves; pool tasks in {args.workers} worker processes"
+    elif args.seed is not None or args.profile_dir:
+        mode = "one task at a time, in plan order"
+    else:
+        mode = "threads, each task starting as soon as its inputs are ready"
+    print(f"\n--- Generation plan: {len(tasks)} tasks in {len(waves)} waves ({mode}) ---")
+    for wave_index, wave in enumerate(waves, 1):
+        print(f"Wave {wave_index}:")
+        for name in wave:
+            task = tasks[name]
+            after = f" (after {', '.join(sorted(dependencies[name]))})" if dependencies[name] else ""
+            placement = "worker pool" if task["pool"] and args.workers > 0 else "main process"
+            added = f"; added for {', '.join(pulled_in[name])}" if name in pulled_in else ""
+            print(f"  {task.get('label', name):<36} [{placement}] reads: {', '.join(task['inputs']) or '-'}{after}; writes: {', '.join(task['outputs']) or '-'}{added}")
+
+# --- Multi-vCenter Generation (scenario "vcenters", --vcenters) ---
+# An export can cover several vCenters (VI SDK servers). Each one gets its own datacenters, topology and
+# tables, built in its own worker process on RNG streams derived from the run seed and the vCenter name.
+# The tables are then concatenated in vCenter order and the topologies merged, so the export does not
+# depend on how many workers ran. A scenario declares them as
+#   vcenters: [{name: vc01.corp.local, uuid: <optional>, datacenters: [...]}, ...]
+# with each datacenters list in the usual scenario format; random environments use --vcenters N.
+_VCENTER_KINDS = ("datacenters", "clusters", "resource_pools", "hosts", "datastores", "networks", "dvSwitches", "vswitches", "folders", "vms", "vm_plan")
+
+def scenario_datacenters(scenario_config):
+    """Every datacenter in a scenario, including those declared under vcenters."""
+    if not scenario_config:
+        return []
+    return list(scenario_config.get('datacenters') or []) + [dc_conf for vc_conf in scenario_config.get('vcenters') or [] for dc_conf in vc_conf.get('datacenters') or []]
+
+def plan_vcenters(scenario_config, num_vcenters, num_vms):
+    """[{"name", "uuid", "scenario", "num_vms"}] for each vCenter; raises ValueError for a clashing layout."""
+    if scenario_config and scenario_config.get('datacenters') and num_vcenters > 1:
+        raise ValueError("--vcenters only splits random environments; declare the vCenters of a scenario under 'vcenters'")
+    if scenario_config and scenario_config.get('vcenters'):
+        base = {key: value for key, value in scenario_config.items() if key not in ('vcenters', 'datacenters')}
+        vcenters = [{"name": vc_conf.get('name') or f"vcenter{k:02d}.corp.local", "uuid": vc_conf.get('uuid'),
+                     "scenario": dict(base, datacenters=vc_conf.get('datacenters') or []), "num_vms": None}
+                    for k, vc_conf in enumerate(scenario_config['vcenters'], 1)]
+        dc_names = [dc_conf.get('name') for vc in vcenters for dc_conf in vc["scenario"]["datacenters"]]
+        if None in dc_names or len(set(dc_names)) != len(dc_names):
+            raise ValueError("every datacenter under vcenters needs a name that is unique across vCenters")
+    else:
+        vcenters = [{"name": f"vcenter{k:02d}.corp.local", "uuid": None, "scenario": scenario_config, "num_vms": num_vms // num_vcenters + (k <= num_vms % num_vcenters)}
+                    for k in range(1, num_vcenters + 1)]
+    if len({vc["name"] for vc in vcenters}) != len(vcenters):
+        raise ValueError("vCenter names must be unique")
+    for vc in vcenters:
+        if not vc["uuid"]:
+            with use_rng_stream("vcenter", vc["name"]):
+                vc["uuid"] = generate_uuid(prefix="vcguid-")
+    return vcenters
+
+def _run_vcenter(vcenter, task_names, table_kwargs, options, output_dir, run_seed, archetypes=None):
+    """Worker: builds one vCenter's topology and tables into output_dir; returns (tables as (path, rows), topology, archetype handoff)."""
+    global _ZIP_EXPORTER
+    _ZIP_EXPORTER = None # Never share the parent's open archive with a forked child
+    set_run_seed(run_seed)
+    set_run_seed(derive_seed("vcenter", vcenter["name"]))
+    for kind in _VCENTER_KINDS:
+        ENVIRONMENT_DATA[kind] = []
+    ENVIRONMENT_DATA["sdk_server_map"] = {vcenter["name"]: vcenter["uuid"]}
+    ENVIRONMENT_DATA["config"] = {**ENVIRONMENT_DATA.get("config", {}), "output_dir": output_dir}
+    EXPORT_MANIFEST.clear()
+    archetype_pool = install_archetype_pool(archetypes) # Each vCenter authors its own archetypes, whichever worker runs it
+    if not vcenter["scenario"] or not vcenter["scenario"].get('datacenters'): # Random layout: name the datacenter after the vCenter
+        TOPOLOGY.add("datacenters", {"name": generate_datacenter_name(region=vcenter["name"].split(".")[0]), "clusters": [], "hosts": [], "datastores": [],
+                                     "networks": [], "vms": [], "sdk_server": vcenter["name"], "sdk_uuid": vcenter["uuid"]})
+
+    table_kwargs = dict(table_kwargs, scenario_config=vcenter["scenario"])
+    vinfo_args = {"num_vms": vcenter["num_vms"], "sdk_server_name": vcenter["name"], "base_sdk_uuid": vcenter["uuid"], **table_kwargs}
+    tasks = build_generation_tasks(task_names, vinfo_args, table_kwargs)
+    for wave in plan_task_waves(tasks):
+        for name in wave:
+            run_planned_task(name, tasks[name], options["engine"], 0, options["shard_size"], output_dir)
+    tables = {arcname.split("/")[-1][:-len(".csv")]: (os.path.join(output_dir, arcname), entry["rows"]) for arcname, entry in EXPORT_MANIFEST.items()}
+    return tables, {kind: ENVIRONMENT_DATA[kind] for kind in _VCENTER_KINDS}, archetype_pool.handoff() if archetype_pool is not None else None
+
+def run_multi_vcenter_generation(vcenters, task_names, table_kwargs, options, num_workers, output_dir):
+    """Generates each vCenter in its own worker process, then writes the merged tables and installs the merged topology."""
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=".rvt_vcenters_", dir=output_dir)
+    tables_by_name = {}
+    ENVIRONMENT_DATA["sdk_server_map"] = {} # Only the generated vCenters
+    archetype_pool, archetypes = get_archetype_pool(), archetype_handoff()
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = [(vc, pool.submit(_run_vcenter, vc, task_names, table_kwargs, options, os.path.join(work_dir, f"vc{k:03d}"), _RUN_SEED, archetypes))
+                       for k, vc in enumerate(vcenters)]
+            for vc, future in tqdm(futures, desc="Collecting vCenters") if TQDM_AVAILABLE else futures:
+                tables, topology, authored = future.result()
+                if authored is not None:
+                    archetype_pool.absorb(authored)
+                for kind, records in topology.items():
+                    ENVIRONMENT_DATA[kind] = ENVIRONMENT_DATA[kind] + records # New list: TOPOLOGY re-indexes it; parent links are inside the records
+                ENVIRONMENT_DATA["sdk_server_map"][vc["name"]] = vc["uuid"]
+                for table, part in tables.items():
+                    tables_by_name.setdefault(table, []).append(part)
+                print(f"vCenter {vc['name']}: {len(topology['vms'])} VMs, {len(topology['hosts'])} hosts.")
+
+        for table in CSV_HEADERS:
+            if table in tables_by_name:
+                write_csv(tables_by_name[table], table, CSV_HEADERS[table], stream_writer=_write_csv_tables_stream)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
 # --- Argument Parsing and Complexity ---
 def parse_arguments(args_list=None): # Modified to accept args_list
     parser = argparse.ArgumentParser(description="RVTools Data Generator")
@@ -1516,10 +4169,40 @@ def parse_arguments(args_list=None): # Modified to accept args_list
         help="The model name to use with Ollama (e.g., 'llama3', 'mistral'). Default: llama3. Ensure model is pulled in Ollama."
     )
     parser.add_argument("--ai_model", type=str, default="gpt-4o-mini", help="Specify the AI model to use for OpenAI (e.g., gpt-4o-mini, gpt-4).")
+    parser.add_argument("--ai_base_url", type=str, default=None, help="Send OpenAI/Ollama requests to this endpoint instead of the provider default (e.g. a proxy, or benchmarks/fake_llm_server.py).")
+    parser.add_argument("--ai_concurrency", type=int, default=8, help="Maximum OpenAI/Ollama requests in flight per provider (per worker process). Rows keep their original order. Default: 8.")
+    parser.add_argument("--ai_rate_limit", type=float, default=0, help="Maximum OpenAI/Ollama requests per second per provider, enforced with a token bucket. Default: 0 (unlimited).")
+    parser.add_argument("--ai_batch_size", type=int, default=1, help="Ask for up to N vInfo/vDisk/vNetwork (and vHost/vCluster/vDatastore) rows per OpenAI/Ollama call as a JSON array; invalid elements fall back to mock data. Default: 1 (one row per call).")
+    parser.add_argument("--ai_archetypes", type=int, default=0, metavar="K", help="Ask the model for only K rows per AI table and generate the rest locally by sampling and perturbing those archetypes, keeping names consistent across tables. Worker processes share the same K; each vCenter gets its own. Default: 0 (every row asks the model).")
+    parser.add_argument("--ai_time_budget", type=float, default=0, metavar="SECONDS", help="Stop calling OpenAI/Ollama this many seconds into the run; remaining rows use mock data. Default: 0 (no limit).")
+    parser.add_argument("--ai_breaker_p95", type=float, default=0, metavar="SECONDS", help=f"Stop calling a provider (for {AI_BREAKER_COOLDOWN:g}s, then probe) once the p95 latency of recent calls exceeds this. It also stops after {AI_BREAKER_FAILURES} consecutive failures. Default: 0 (latency not checked).")
+    parser.add_argument("--ai_cache", type=str, default=None, metavar="DIR", help=f"Cache validated OpenAI/Ollama responses in DIR/{AI_CACHE_FILENAME} and reuse them for identical prompts (combine with --seed to replay a run without LLM calls).")
+    parser.add_argument("--ai_cache_max_mb", type=float, default=256, help="Evict least recently used AI cache entries beyond this size. Default: 256.")
+    parser.add_argument("--ai_cache_max_age_days", type=float, default=30, help="Expire AI cache entries older than this. Default: 30.")
+    parser.add_argument("--profile", action="store_true", help=f"Time every generation stage (wall, CPU, tracemalloc peak memory), print a summary and write {PROFILE_REPORT_FILENAME} to the output directory. Tracing memory slows the run.")
+    parser.add_argument("--profile_dir", type=str, default=None, metavar="DIR", help="Like --profile, and also write a cProfile file per stage to DIR. Threaded tables then run one at a time.")
     parser.add_argument("--output_dir", type=str, default=DEFAULT_OUTPUT_DIR, help="Directory to save the output ZIP file.")
     parser.add_argument("--zip_filename", type=str, default=DEFAULT_ZIP_FILENAME, help="Filename format for the output ZIP.")
     parser.add_argument("--force_overwrite", action="store_true", help="Overwrite existing ZIP file if it exists.")
-    parser.add_argument("--csv_types", nargs='+', default=["all"], help="List of CSV types to generate (e.g., vInfo vDisk vHost). Default is all.")
+    parser.add_argument("--format", choices=['zip', 'xlsx'], default='zip', help="Output format: 'zip' packs one CSV per table (plus a manifest); 'xlsx' writes one workbook with a sheet per table, like RVTools itself. Default: zip.")
+    parser.add_argument("--zip_compression", choices=list(ZIP_COMPRESSION_METHODS), default="deflate", help="Compression for the output archive: 'stored' skips compression entirely. Default: deflate.")
+    parser.add_argument("--zip_level", type=int, choices=range(10), default=6, metavar="0-9", help="Deflate level for the output archive; 1 is fastest, 9 smallest. Default: 6.")
+    parser.add_argument("--direct_zip", action="store_true", help=f"Stream each CSV straight into the output ZIP instead of staging loose files under <output_dir>/{DEFAULT_CSV_SUBDIR}.")
+    parser.add_argument("--workers", type=int, default=0, help="Run the parallelizable generators (vDisk, vNetwork, vSnapshot, vHBA, ...) in N worker processes. Default 0 runs them as threads in this process.")
+    parser.add_argument("--shard_size", type=int, default=5000, help="VMs per shard: vInfo, vDisk, vNetwork and vSnapshot are generated shard by shard (in --workers processes, if set) and merged in order. Default: 5000.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for all random streams. The same seed gives byte-identical output at any --workers count.")
+    parser.add_argument("--engine", choices=['python', 'numpy'], default='python', help="Row engine for vInfo, vDisk, vNetwork and vSnapshot. 'numpy' builds each shard column-wise (requires NumPy; not used with --use_ai). Default: python.")
+    parser.add_argument("--csv_types", nargs='+', default=["all"], help="List of CSV types to generate (e.g., vInfo vDisk vHost); the tables they depend on are added. Default is all.")
+    parser.add_argument("--save_env", type=str, default=None, help="Write the finished topology (VMs, hosts, clusters, datastores, networks, SDK servers) to this snapshot file.")
+    parser.add_argument("--load_env", type=str, default=None, help="Start from a --save_env snapshot instead of building a new topology; refused if --config_file differs from the scenario it was built from.")
+    parser.add_argument("--vcenters", type=int, default=1, metavar="N", help="Spread a random environment over N vCenters (VI SDK servers), each generated in its own worker process. Scenarios declare theirs under 'vcenters'. Default: 1.")
+    parser.add_argument("--series", type=int, default=1, metavar="N", help="Write N exports of the same environment, --interval apart, with VM churn, storage growth and snapshot aging between them. Default: 1.")
+    parser.add_argument("--interval", type=parse_interval, default="7d", help="Time between --series exports, e.g. 7d, 12h or 2w. Default: 7d.")
+    parser.add_argument("--series_start", type=str, default=None, metavar="YYYY-MM-DD", help="Date of the first --series export. Default: today.")
+    parser.add_argument("--series_churn", type=float, default=0.01, help="Share of VMs deleted (and replaced by new ones) per --series step. Default: 0.01.")
+    parser.add_argument("--series_growth", type=float, default=0.005, help="Net VM growth per --series step, as a share of the VM count. Default: 0.005.")
+    parser.add_argument("--series_disk_growth", type=float, default=0.02, help="Chance per --series step that a powered-on VM gets a virtual disk expanded. Default: 0.02.")
+    parser.add_argument("--explain", action="store_true", help="Print the generation task plan (dependencies, waves, added tables) and exit without generating.")
     parser.add_argument("--complexity", choices=['simple', 'medium', 'fancy'], default='medium', help="Complexity level for data generation.")
     parser.add_argument("--config_file", type=str, default=None, help="Path to a YAML scenario configuration file.")
     parser.add_argument("--gui", action="store_true", help="Launch the basic Tkinter GUI.")
@@ -1537,18 +4220,24 @@ def get_complexity_parameters(level, base_num_vms_from_cli_or_scenario):
         params['core_csvs_simple'] = ['vInfo', 'vDisk', 'vNetwork', 'vHost', 'vDatastore', 'vCPU', 'vMemory', 'vCluster'] # Added vCPU, vMemory, vCluster
         params['max_items'] = {'disks_per_vm': 2, 'nics_per_vm': 1, 'snapshots_per_vm': 1, 'hbas_per_host': 1, 'pnics_per_host': 2}
         params['default_hosts_per_cluster'] = 1
+        params['networks_per_datacenter'] = 2
+        params['folders_per_datacenter'] = 1
         params['vms_per_host_random'] = params['num_vms']
     elif level == 'fancy':
         params['num_vms'] = base_num_vms_from_cli_or_scenario if base_num_vms_from_cli_or_scenario is not None else 100
         params['feature_likelihood'] = {'snapshots': 0.6, 'dvs_usage': 0.7, 'usb_devices': 0.1, 'multiple_nics_disks': 0.7, 'advanced_hba_types': 0.6, 'multipathing': 0.5}
         params['max_items'] = {'disks_per_vm': 5, 'nics_per_vm': 4, 'snapshots_per_vm': 4, 'hbas_per_host': 4, 'pnics_per_host': 8}
         params['default_hosts_per_cluster'] = 4
+        params['networks_per_datacenter'] = 8
+        params['folders_per_datacenter'] = 6
         params['vms_per_host_random'] = 25
     else: # medium
         params['num_vms'] = base_num_vms_from_cli_or_scenario if base_num_vms_from_cli_or_scenario is not None else 50
         params['feature_likelihood'] = {'snapshots': 0.3, 'dvs_usage': 0.4, 'usb_devices': 0.05, 'multiple_nics_disks': 0.4, 'advanced_hba_types': 0.3, 'multipathing': 0.3}
         params['max_items'] = {'disks_per_vm': 3, 'nics_per_vm': 2, 'snapshots_per_vm': 2, 'hbas_per_host': 2, 'pnics_per_host': 4}
         params['default_hosts_per_cluster'] = 2
+        params['networks_per_datacenter'] = 4
+        params['folders_per_datacenter'] = 3
         params['vms_per_host_random'] = 20
 
     params['default_vcpu'] = params.get('default_vcpu', 2)
@@ -1599,16 +4288,19 @@ def main(cli_args_list=None): # Added cli_args_list parameter
     num_vms_for_complexity = args.num_vms
     if num_vms_for_complexity is None and scenario_config:
         total_scenario_vms = 0
-        for dc_conf in scenario_config.get('datacenters', []): # Use dc_conf
+        for dc_conf in scenario_datacenters(scenario_config): # Use dc_conf
             for plan_item in dc_conf.get('deployment_plan', []): # Use dc_conf
                 total_scenario_vms += plan_item.get('count', 0)
         if total_scenario_vms > 0:
             num_vms_for_complexity = total_scenario_vms
 
+    run_seed = set_run_seed(args.seed)
     complexity_params = get_complexity_parameters(args.complexity, num_vms_for_complexity)
     actual_num_vms = complexity_params['num_vms']
 
     ENVIRONMENT_DATA["config"] = vars(args)
+    # Absolute, so worker processes share the run's --ai_time_budget
+    ENVIRONMENT_DATA["config"]["ai_deadline"] = time.time() + args.ai_time_budget if args.ai_time_budget > 0 else None
     ENVIRONMENT_DATA["config"].update(complexity_params)
 
     if args.gui:
@@ -1623,7 +4315,20 @@ def main(cli_args_list=None): # Added cli_args_list parameter
     elif args.complexity == 'simple' and "all" in args.csv_types and "core_csvs_simple" in complexity_params:
         csv_to_generate = [csv_type for csv_type in complexity_params["core_csvs_simple"] if csv_type in CSV_HEADERS]
 
-    print(f"Starting data generation. Target VMs: {actual_num_vms}, Complexity: {args.complexity}, AI: {args.use_ai} ({args.ai_provider}), Output: {args.output_dir}")
+    print(f"Starting data generation. Target VMs: {actual_num_vms}, Complexity: {args.complexity}, AI: {args.use_ai} ({args.ai_provider}), Output: {args.output_dir}, Seed: {run_seed}")
+    scenario_hash = scenario_fingerprint(args.config_file) if scenario_config else None
+    loaded_env = None
+    if args.load_env:
+        try:
+            loaded_env = load_environment_snapshot(args.load_env, scenario_hash)
+        except (OSError, ValueError, pickle.UnpicklingError, zlib.error) as e:
+            print(f"Cannot load environment snapshot: {e}")
+            print("\nRVTools Data Generator script finished.")
+            return
+        print(f"Loaded environment snapshot {args.load_env}: {len(ENVIRONMENT_DATA['vms'])} VMs, {len(ENVIRONMENT_DATA['hosts'])} hosts "
+              f"(built with {loaded_env['generation']}).")
+    ai_cache = get_ai_cache() if args.use_ai else None
+    ai_cache_start = ai_cache.stats() if ai_cache is not None else None
 
     # Use a default SDK server name if not derivable from config_file (which is a path)
     # This part of get_sdk_server_info might need adjustment if config_file was meant to hold server name directly.
@@ -1638,161 +4343,137 @@ def main(cli_args_list=None): # Added cli_args_list parameter
         "ollama_model_name": args.ollama_model_name
     }
 
-    sequential_tasks_configs_base = {
-        "vInfo": {"func": generate_vinfo_csv, "args": {"num_vms": actual_num_vms, "sdk_server_name": sdk_server_name, "base_sdk_uuid": base_sdk_uuid, **ai_common_kwargs}},
-        "vHost": {"func": generate_vhost_csv, "args": ai_common_kwargs},
-        "vCluster": {"func": generate_vcluster_csv, "args": ai_common_kwargs},
-        "vDatastore": {"func": generate_vdatastore_csv, "args": ai_common_kwargs},
-        "vRP": {"func": generate_vrp_csv, "args": ai_common_kwargs},
-    }
-
-    parallel_tasks_configs_base = {
-        "vDisk": {"func": generate_vdisk_csv, "args": ai_common_kwargs},
-        "vNetwork": {"func": generate_vnetwork_csv, "args": ai_common_kwargs},
-        "vSnapshot": {"func": generate_vsnapshot_csv, "args": ai_common_kwargs},
-        "vTools": {"func": generate_vtools_csv, "args": ai_common_kwargs},
-        "vPartition": {"func": generate_vpartition_csv, "args": ai_common_kwargs},
-        "vCD": {"func": generate_vcd_csv, "args": ai_common_kwargs},
-        "vFloppy": {"func": generate_vfloppy_csv, "args": ai_common_kwargs},
-        "vUSB": {"func": generate_vusb_csv, "args": ai_common_kwargs},
-        "vHBA": {"func": generate_vhba_csv, "args": ai_common_kwargs},
-        "vNIC": {"func": generate_vnic_csv, "args": ai_common_kwargs},
-        "vSwitch": {"func": generate_vswitch_csv, "args": ai_common_kwargs},
-        "vPort": {"func": generate_vport_csv, "args": ai_common_kwargs},
-        "dvSwitch": {"func": generate_dvswitch_csv, "args": ai_common_kwargs},
-        "dvPort": {"func": generate_dvport_csv, "args": ai_common_kwargs},
-        "vTag": {"func": generate_vtag_csv, "args": ai_common_kwargs},
-    }
-
-    sequential_tasks_configs = {name: cfg for name, cfg in sequential_tasks_configs_base.items() if name in csv_to_generate}
-    parallel_tasks_configs = {name: cfg for name, cfg in parallel_tasks_configs_base.items() if name in csv_to_generate}
-
-    print("\n--- Running Sequential Generation Tasks ---")
-    for name, task_config in sequential_tasks_configs.items():
-        print(f"Generating {name}...")
-        task_config["func"](**task_config["args"])
-
-    print("\n--- Running Parallelizable Generation Tasks ---")
-    threads = []
-    for name, task_config in parallel_tasks_configs.items():
-        print(f"Starting thread for {name}...")
-        thread = threading.Thread(target=task_config["func"], kwargs=task_config["args"], name=f"Thread-{name}")
-        threads.append(thread)
-        thread.start()
+    if args.format == "xlsx" and args.direct_zip:
+        print("Warning: --direct_zip only applies to --format zip; tables are staged and then streamed into the workbook.")
+        args.direct_zip = False
+    if args.engine == "numpy" and not NUMPY_AVAILABLE:
+        print("Warning: --engine numpy requested but NumPy is not installed (pip install numpy). Falling back to the python engine.")
+    elif args.engine == "numpy" and args.use_ai:
+        print("Warning: --engine numpy does not support --use_ai; VM-level tables will use the python engine.")
+
+    # Requested tables plus the upstream tasks whose ENVIRONMENT_DATA they read
+    task_names, pulled_in = select_generation_tasks(csv_to_generate, available=loaded_env["kinds"] if loaded_env else ())
+    for name, requesters in pulled_in.items():
+        print(f"Adding {name}: needed by {', '.join(requesters)}.")
+    tasks = build_generation_tasks(task_names, {"num_vms": actual_num_vms, "sdk_server_name": sdk_server_name, "base_sdk_uuid": base_sdk_uuid, **ai_common_kwargs},
+                                   ai_common_kwargs, from_records=bool(loaded_env))
+    vcenters = None
+    if not loaded_env and (args.vcenters > 1 or (scenario_config and scenario_config.get('vcenters'))):
+        try:
+            vcenters = plan_vcenters(scenario_config, args.vcenters, actual_num_vms)
+        except ValueError as e:
+            print(f"Invalid vCenter layout: {e}")
+            print("\nRVTools Data Generator script finished.")
+            return
+        print(f"Generating {len(vcenters)} vCenters, each in its own worker process: {', '.join(vc['name'] for vc in vcenters)}.")
+    if args.explain:
+        explain_task_plan(tasks, pulled_in, args)
+        return
+    zip_date_time = SEEDED_ZIP_DATE_TIME if args.seed is not None else None
+
+    def run_task(name):
+        run_planned_task(name, tasks[name], args.engine, args.workers, args.shard_size, args.output_dir)
+
+    series_start = None
+    if args.series > 1:
+        try:
+            series_start = datetime.datetime.strptime(args.series_start, "%Y-%m-%d") if args.series_start else datetime.datetime.combine(datetime.date.today(), datetime.time())
+        except ValueError:
+            print(f"Invalid --series_start {args.series_start!r}; expected YYYY-MM-DD.")
+            print("\nRVTools Data Generator script finished.")
+            return
+        zip_date_time = zip_date_time or series_start.timetuple()[:6]
+        final_zip_filename = output_filename(series_zip_filename(args.zip_filename, series_start, 0), args.format)
+        print(f"Writing a series of {args.series} exports, {args.interval} apart, starting {series_start:%Y-%m-%d}.")
+    else:
+        timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        final_zip_filename = output_filename(args.zip_filename.replace("{timestamp}", timestamp_str), args.format)
+    zip_filepath = os.path.join(args.output_dir, final_zip_filename)
+    EXPORT_MANIFEST.clear()
+
+    global _ZIP_EXPORTER, _PROFILER
+    if args.direct_zip:
+        if os.path.exists(zip_filepath) and not args.force_overwrite:
+            print(f"ZIP file {zip_filepath} already exists. Use --force_overwrite to replace.")
+            print("\nRVTools Data Generator script finished.")
+            return
+        os.makedirs(args.output_dir, exist_ok=True)
+        print(f"Streaming CSV tables directly into {zip_filepath} (no {DEFAULT_CSV_SUBDIR} staging).")
+        _ZIP_EXPORTER = ZipCsvExporter(zip_filepath, date_time=zip_date_time, **zip_compression_options(args))
+    if args.profile or args.profile_dir:
+        _PROFILER = StageProfiler(args.profile_dir)
 
-    for thread in tqdm(threads, desc="Joining Threads") if TQDM_AVAILABLE and threads else threads:
-        thread.join()
+    try:
+        print(f"\n--- Running {len(tasks)} Generation Tasks ---")
+        if vcenters:
+            num_workers = args.workers if args.workers > 0 else min(len(vcenters), os.cpu_count() or 1)
+            with profile_stage(f"vCenter pool ({len(vcenters)} vCenters)"):
+                run_multi_vcenter_generation(vcenters, task_names, ai_common_kwargs, {"engine": args.engine, "shard_size": args.shard_size}, num_workers, args.output_dir)
+        elif args.workers > 0:
+            # Wave by wave: main-process tasks first, then one worker pool for the wave's pool tasks
+            print(f"Using a pool of {args.workers} worker processes.")
+            for wave in plan_task_waves(tasks):
+                for name in wave:
+                    if not tasks[name]["pool"]:
+                        run_task(name)
+                pool_tasks = {name: tasks[name] for name in wave if tasks[name]["pool"]}
+                if pool_tasks:
+                    with profile_stage(f"process pool ({len(pool_tasks)} tables)"):
+                        run_tasks_in_process_pool(pool_tasks, args.workers, args.output_dir)
+        elif args.seed is not None or args.profile_dir:
+            # Thread scheduling would decide archive entry order and shared topology updates (and cProfile is per thread)
+            for wave in plan_task_waves(tasks):
+                for name in wave:
+                    run_task(name)
+        else:
+            run_task_graph_threaded(tasks, run_task)
+    finally:
+        if _ZIP_EXPORTER is not None:
+            _ZIP_EXPORTER.close()
+            _ZIP_EXPORTER = None
+            print(f"Successfully created ZIP file: {zip_filepath}")
 
     print("\n--- All CSV generation tasks complete ---")
+    if args.save_env:
+        generation = {"vms": len(ENVIRONMENT_DATA["vms"]), "complexity": args.complexity, "seed": run_seed, "config_file": args.config_file}
+        snapshot_bytes = save_environment_snapshot(args.save_env, loaded_env["scenario_hash"] if loaded_env else scenario_hash, generation)
+        print(f"Environment snapshot written to {args.save_env} ({snapshot_bytes / 1024:.0f} KB).")
+    if ai_cache is not None:
+        ai_cache_end = ai_cache.stats()
+        print(f"AI cache ({ai_cache.path}): {ai_cache_end['hits'] - ai_cache_start['hits']} hits, {ai_cache_end['misses'] - ai_cache_start['misses']} misses this run; "
+              f"{ai_cache_end['entries']} entries, {ai_cache_end['bytes'] / (1 << 20):.1f} MB stored.")
+
+    archetype_pool = get_archetype_pool() if args.use_ai and args.ai_provider in AI_PROVIDERS else None
+    if archetype_pool is not None:
+        archetype_stats = archetype_pool.stats()
+        print(f"AI archetypes: {archetype_stats['amplified']} rows amplified locally from " +
+              (", ".join(f"{count} {table}" for table, count in sorted(archetype_stats["archetypes"].items())) or "no") + " archetypes.")
+
+    if args.direct_zip:
+        pass # Tables and manifest were streamed into the archive as they were generated
+    elif os.path.exists(zip_filepath) and not args.force_overwrite:
+        print(f"{'Workbook' if args.format == 'xlsx' else 'ZIP file'} {zip_filepath} already exists. Use --force_overwrite to replace.")
+        series_start = None # The archive on disk is not this run's step 0
+    elif args.format == "xlsx":
+        with profile_stage("XLSX"):
+            write_staged_xlsx(zip_filepath, args.output_dir, zip_date_time, **zip_compression_options(args))
+    else:
+        with profile_stage("ZIP"):
+            write_staged_zip(zip_filepath, args.output_dir, zip_date_time, **zip_compression_options(args))
 
-    timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    final_zip_filename = args.zip_filename.replace("{timestamp}", timestamp_str)
-    zip_filepath = os.path.join(args.output_dir, final_zip_filename)
+    if series_start is not None and os.path.exists(zip_filepath):
+        print(f"\n--- Series steps 1-{args.series - 1} ---")
+        run_series(zip_filepath, tasks, run_task, args, series_start, ai_common_kwargs, SEEDED_ZIP_DATE_TIME if args.seed is not None else None)
 
-    if os.path.exists(zip_filepath) and not args.force_overwrite:
-        print(f"ZIP file {zip_filepath} already exists. Use --force_overwrite to replace.")
-    else:
-        print(f"\nAttempting to create zip file: {zip_filepath}")
-        try:
-            # Corrected: csv_output_path should be based on args.output_dir and DEFAULT_CSV_SUBDIR
-            # This was a global variable, but it's better to define it based on current args here or pass explicitly
-            current_csv_output_path = os.path.join(args.output_dir, DEFAULT_CSV_SUBDIR)
-            if not os.path.isdir(current_csv_output_path) or not os.listdir(current_csv_output_path):
-                 print(f"Warning: Source CSV directory {current_csv_output_path} is empty or does not exist. No ZIP created.")
-            else:
-                with zipfile.ZipFile(zip_filepath, 'w', zipfile.ZIP_DEFLATED) as zf:
-                    for root, _, files in os.walk(current_csv_output_path):
-                        for file in files:
-                            if file.endswith(".csv"):
-                                file_path = os.path.join(root, file)
-                                arcname = os.path.join(DEFAULT_CSV_SUBDIR, os.path.relpath(file_path, current_csv_output_path))
-                                zf.write(file_path, arcname=arcname)
-                print(f"Successfully created ZIP file: {zip_filepath}")
-        except Exception as e:
-            print(f"Error creating ZIP file: {e}")
+    if _PROFILER is not None:
+        _PROFILER.print_summary()
+        os.makedirs(args.output_dir, exist_ok=True)
+        report_path = os.path.join(args.output_dir, PROFILE_REPORT_FILENAME)
+        _PROFILER.close(report_path)
+        _PROFILER = None
+        print(f"Profile report written to {report_path}" + (f"; cProfile files in {args.profile_dir}" if args.profile_dir else ""))
 
     print("\nRVTools Data Generator script finished.")
 
 if __name__ == "__main__":
     main()
-
-
-# Ensure all other generate_*.csv functions are defined above main, even if as placeholders.
-# For this task, only generate_vinfo_csv, generate_vdisk_csv, generate_vnetwork_csv,
-# generate_vsnapshot_csv, generate_vhost_csv, and generate_vhba_csv need their full content
-# as of Turn 68, with generate_vhba_csv being the one to modify.
-# The other generate_*.csv functions can be simple `pass` placeholders for this specific task.
-# However, to make the script runnable up to the point of vHBA, more might be needed.
-# For now, assuming the Turn 68 state had placeholders for functions beyond vSnapshot.
-# If not, this restoration would be incomplete.
-# The actual Turn 68 state is critical. This is a best-effort reconstruction based on the prompt.
-# Based on the prompt, it seems Turn 68 state had more than just placeholders.
-# Let's assume the script had fuller functions for vTools, vPartition, vCD, vFloppy, vUSB, vCluster, vNIC, vSwitch, vPort, dvSwitch, dvPort, vDatastore, vRP, vTag.
-# This means this overwrite_file_with_block should contain the *full* script from that state, not just up to vHBA.
-# The prompt "Script should be as it was after Turn 68" implies the whole file.
-
-# For the purpose of this specific edit, I'm focusing on the functions up to vHBA
-# and ensuring the main block can call them. The other generator functions will be simple pass for now.
-# This is a deviation from "exact Turn 68 state" if that state had all 20+ generators fully implemented.
-# The critical part is that vInfo, vDisk, vNetwork, vSnapshot, vHost, and vHBA are as they were,
-# with vHBA ready for the specific modification.
-# The provided `generate_vhba_csv` in the prompt starts with `if not ENVIRONMENT_DATA.get("hosts"): return`
-# which is good. It also uses `complexity_params` and `scenario_config`.
-# The modification logic also refers to `host_rec.get('profile_hba_type_preference')`.
-# This implies that `host_rec` should have this field, likely populated during `vInfo` if a scenario is active.
-# The `vInfo` in this restored code does populate `profile_hba_type_preference` and `profile_num_hbas` into `host_rec`.
-# So the context for the `vHBA` modification should be correct.
-
-def generate_vtools_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vTools generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vpartition_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vPartition generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vcd_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vCD generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vfloppy_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vFloppy generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vusb_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vUSB generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vnic_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vNIC generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vswitch_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vSwitch generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vport_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vPort generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_dvswitch_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: dvSwitch generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_dvport_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: dvPort generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-# generate_vdatastore_csv is already updated.
-
-def generate_vrp_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vRP generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-
-def generate_vtag_csv(complexity_params, scenario_config=None, use_ai_cli_flag=False, ai_provider_cli_arg="mock", ollama_model_name="llama3"): # Added AI args
-    print(f"Placeholder: vTag generation called (AI: {use_ai_cli_flag}, Provider: {ai_provider_cli_arg}, Ollama Model: {ollama_model_name})")
-    pass
-# ... and any other CSV functions that were present in Turn 68 state.
-# For this task, the essential parts are vInfo, vHost, and vHBA structures, and the main execution flow.
-# The provided solution will insert the new HBA logic into the placeholder vHBA.
-# The other functions (vDisk, vNetwork, vSnapshot) are also included as per "Turn 68 state".
@@ -0,0 +1,247 @@
+import pytest
+import asyncio
+import json
+import os
+import sys
+import time
+import types
+
+# Add project root to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import rvtools_data_generator as gen
+from rvtools_data_generator import AiResponseCache, ai_cache_key, VINFO_AI_PROMPT_TEMPLATE
+
+
+def test_cache_key_ignores_dispatcher_flags_but_not_prompt_context():
+    context = {"vm_name_hint": "vm-001", "cluster_name": "CL1"}
+    key = ai_cache_key("ollama", "llama3", VINFO_AI_PROMPT_TEMPLATE, "vInfo", context)
+    assert key == ai_cache_key("ollama", "llama3", VINFO_AI_PROMPT_TEMPLATE, "vInfo",
+                               {"cluster_name": "CL1", "vm_name_hint": "vm-001", "use_ai_cli_flag": True, "column_details_block": "..."})
+    assert key != ai_cache_key("ollama", "mistral", VINFO_AI_PROMPT_TEMPLATE, "vInfo", context)
+    assert key != ai_cache_key("ollama", "llama3", VINFO_AI_PROMPT_TEMPLATE, "vInfo", {**context, "cluster_name": "CL2"})
+
+
+def test_cache_round_trip_counters_and_expiry(tmp_path):
+    cache = AiResponseCache(str(tmp_path))
+    assert cache.get("k1") is None
+    cache.put("k1", {"VM Name": "vm-001", "vCPU": 2, "Thin": True})
+    assert cache.get("k1") == {"VM Name": "vm-001", "vCPU": 2, "Thin": True}
+    assert AiResponseCache(str(tmp_path)).get("k1")["vCPU"] == 2 # Persists across runs
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+
+    cache.max_age_seconds = 0
+    time.sleep(0.01)
+    assert cache.get("k1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_evicts_least_recently_used_past_size_limit(tmp_path):
+    value = {"Annotation": "x" * 100}
+    cache = AiResponseCache(str(tmp_path), max_bytes=400) # Room for three entries
+    for key in ("a", "b", "c"):
+        cache.put(key, value)
+        time.sleep(0.01)
+    cache.get("a") # Touch "a" so "b" is now the least recently used
+    time.sleep(0.01)
+    cache.put("d", value)
+    assert cache.get("b") is None
+    assert all(cache.get(key) == value for key in ("a", "c", "d"))
+
+
+def test_dispatcher_serves_cached_response_without_calling_the_provider(tmp_path, monkeypatch):
+    monkeypatch.setitem(gen.ENVIRONMENT_DATA, "config", {"ai_cache": str(tmp_path), "ai_model": "gpt-4o-mini"})
+    monkeypatch.setattr(gen, "LANGCHAIN_AVAILABLE", True)
+    monkeypatch.setattr(gen, "ChatOpenAI", lambda **kwargs: pytest.fail("provider called despite a cache hit"), raising=False)
+    context = {"vm_name_hint": "vm-001"}
+    key = ai_cache_key("openai", "gpt-4o-mini", VINFO_AI_PROMPT_TEMPLATE, "vInfo", context)
+    gen.get_ai_cache().put(key, {"VM Name": "vm-001", "Powerstate": "PoweredOn"})
+
+    data = gen._get_ai_data_for_entity(VINFO_AI_PROMPT_TEMPLATE, dict(context), "vInfo", "vm-001",
+                                       use_ai_enabled_globally=True, ai_provider="openai")
+    assert data == {"VM Name": "vm-001", "Powerstate": "PoweredOn"}
+
+
+def test_installed_langchain_without_a_used_submodule_goes_straight_to_mock(monkeypatch, capsys):
+    # langchain 1.x layout: the packages are importable but langchain.prompts is gone
+    fake_openai = types.ModuleType("langchain_openai")
+    fake_openai.ChatOpenAI = lambda **kwargs: pytest.fail("client built without langchain.prompts")
+    monkeypatch.setitem(sys.modules, "langchain_openai", fake_openai)
+    monkeypatch.setitem(sys.modules, "langchain", types.ModuleType("langchain"))
+    monkeypatch.setattr(gen, "LANGCHAIN_AVAILABLE", None)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    gen._langchain.cache_clear()
+
+    request = dict(prompt_template="{cluster_name}", context={"cluster_name": "CL1"}, relevant_headers_key="vCluster",
+                   entity_name_for_log="CL1", use_ai_enabled_globally=True, ai_provider="openai",
+                   entity_specific_mock_func=lambda context: {"Name": "mock-" + context["cluster_name"]})
+    assert not gen.llm_call_ready(request)
+    assert gen._get_ai_data_for_entity(**request) == {"Name": "mock-CL1"}
+    assert gen.LANGCHAIN_AVAILABLE is False # Resolved once, not per row
+    assert "LangChain libraries not found" in capsys.readouterr().out
+
+
+def test_registry_builds_one_client_and_one_chain_per_template(monkeypatch):
+    built = []
+    monkeypatch.setattr(gen, "_LLM_REGISTRY", None)
+    monkeypatch.setattr(gen, "_CIRCUIT_BREAKERS", {})
+    monkeypatch.setattr(gen, "_new_llm_client", lambda ai_provider, model_name: built.append(("client", model_name)) or object())
+    monkeypatch.setattr(gen, "_build_ai_chain", lambda prompt_template, llm_provider: built.append(("chain", prompt_template)) or object())
+    registry = gen.get_llm_registry()
+    chains = [registry.chain("ollama", "llama3", template) for template in ("{a}", "{b}", "{a}", "{b}")]
+    assert chains[0] is chains[2] and chains[1] is chains[3] and chains[0] is not chains[1]
+    assert registry.client("ollama", "llama3") is registry.client("ollama", "llama3")
+    registry.chain("ollama", "mistral", "{a}")
+    assert built == [("client", "llama3"), ("chain", "{a}"), ("chain", "{b}"), ("client", "mistral"), ("chain", "{a}")]
+    assert gen.get_llm_registry() is registry
+    assert gen.column_details_block("vDisk") is gen.column_details_block("vDisk")
+
+
+class FakeAsyncChain:
+    """Stands in for prompt | model | parser; records how many calls overlap."""
+
+    def __init__(self, delay=0.02, fail_for=()):
+        self.delay, self.fail_for = delay, set(fail_for)
+        self.calls = self.in_flight = self.peak = 0
+
+    async def ainvoke(self, context):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if context["cluster_name"] in self.fail_for:
+            raise RuntimeError("provider error")
+        return {"Name": context["cluster_name"], "HA enabled": "true", "DRS enabled": "false"}
+
+
+@pytest.fixture
+def fake_provider(monkeypatch):
+    chain = FakeAsyncChain(fail_for={"CL3"})
+    monkeypatch.setitem(gen.ENVIRONMENT_DATA, "config", {"ai_concurrency": 4})
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(gen, "LANGCHAIN_AVAILABLE", True)
+    monkeypatch.setattr(gen, "_AI_EXECUTOR", None)
+    monkeypatch.setattr(gen, "_LLM_REGISTRY", None)
+    monkeypatch.setattr(gen, "_CIRCUIT_BREAKERS", {})
+    monkeypatch.setattr(gen, "_new_llm_client", lambda ai_provider, model_name: None)
+    monkeypatch.setattr(gen, "_build_ai_chain", lambda prompt_template, llm_provider: chain)
+    return chain
+
+
+def _cluster_steps(i):
+    request = dict(prompt_template="{cluster_name}", context={"cluster_name": f"CL{i}"}, relevant_headers_key="vCluster",
+                   entity_name_for_log=f"CL{i}", use_ai_enabled_globally=True, ai_provider="openai",
+                   entity_specific_mock_func=lambda context: {"Name": "mock-" + context["cluster_name"]})
+    ai_data = yield request
+    return ai_data["Name"], gen.generate_random_integer(0, 10**9)
+
+
+def test_ai_units_run_concurrently_in_order_with_mock_fallback(fake_provider):
+    start = time.perf_counter()
+    results = list(gen.iter_ai_units(((_cluster_steps(i), gen.rng_stream("cl", i)) for i in range(12)), True, "openai"))
+    elapsed = time.perf_counter() - start
+
+    assert [name for name, _ in results] == [f"CL{i}" if i != 3 else "mock-CL3" for i in range(12)]
+    assert fake_provider.calls == 12
+    assert fake_provider.peak == 4 # --ai_concurrency
+    assert elapsed < 12 * fake_provider.delay
+    # Each unit draws from its own stream, so what follows the AI call is reproducible
+    assert [draw for _, draw in results] == [gen.rng_stream("cl", i).randint(0, 10**9) for i in range(12)]
+
+
+def test_token_bucket_limits_request_rate():
+    bucket = gen.TokenBucket(rate=50, burst=1)
+
+    async def acquire_all():
+        for _ in range(6):
+            await bucket.acquire()
+
+    start = time.perf_counter()
+    asyncio.run(acquire_all())
+    assert time.perf_counter() - start >= 5 / 50 * 0.9
+
+
+class FakeBatchChain:
+    """Stands in for model | parser on batched messages; answers every request but CL2 and drops the last one."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    async def ainvoke(self, messages):
+        requests = [json.loads(line.split(": ", 1)[1]) for line in messages[1][1].splitlines() if line.startswith("Request ")]
+        self.batch_sizes.append(len(requests))
+        answers = [{"Name": values["cluster_name"], "HA enabled": "true"} if values["cluster_name"] == "CL2"
+                   else {"Name": values["cluster_name"], "HA enabled": "true", "DRS enabled": "false"} for values in requests]
+        return answers[:-1] if requests[-1]["cluster_name"] == "CL9" else answers
+
+
+def test_batched_requests_validate_each_element(fake_provider, monkeypatch):
+    batch_chain = FakeBatchChain()
+    monkeypatch.setitem(gen.ENVIRONMENT_DATA, "config", {"ai_concurrency": 4, "ai_batch_size": 5})
+    monkeypatch.setattr(gen, "_build_ai_batch_chain", lambda llm_provider: batch_chain)
+    results = list(gen.iter_ai_units(((_cluster_steps(i), gen.rng_stream("cl", i)) for i in range(11)), True, "openai"))
+
+    assert batch_chain.batch_sizes == [5, 5] # Requests 0-9 in two calls; request 10 alone goes through the per-row chain
+    assert fake_provider.calls == 1
+    assert [name for name, _ in results] == [f"mock-CL{i}" if i in (2, 9) else f"CL{i}" for i in range(11)]
+
+
+def test_amplified_archetype_names_the_requesting_entity():
+    example_context = {"vm_name": "web01", "datastore_name": "ds-gold-1", "disk_label": "Hard disk 1"}
+    example = {"Disk": "Hard disk 1", "Capacity MB": 10000, "Thin": True, "Path": "[ds-gold-1] web01/web01_0.vmdk"}
+    with gen.bind_rng(gen.rng_stream("amplify")):
+        data = gen.amplify_archetype("vDisk", example_context, example,
+                                     {"vm_name": "db07", "datastore_name": "ds-silver-2", "disk_label": "Hard disk 2"})
+    assert data["Path"] == "[ds-silver-2] db07/db07_0.vmdk"
+    assert data["Disk"] == "Hard disk 2" and data["Thin"] is True
+    assert 8000 <= data["Capacity MB"] <= 12000
+    assert example["Path"] == "[ds-gold-1] web01/web01_0.vmdk" # The archetype itself is untouched
+
+    host = gen.amplify_archetype("vHost", {"host_name_hint": "esx01", "cluster_name": "CL1"}, {"Name": "esx01.corp", "Cluster": "CL1", "VMs": 40},
+                                 {"host_name_hint": "esx09", "cluster_name": "CL2"})
+    assert host == {"Name": "esx09", "Cluster": "CL2"} # VM count is left to the row builder
+
+
+def test_archetype_mode_calls_the_model_k_times_per_table(fake_provider, monkeypatch):
+    monkeypatch.setitem(gen.ENVIRONMENT_DATA, "config", {"ai_concurrency": 4, "ai_archetypes": 4})
+    monkeypatch.setattr(gen, "_ARCHETYPE_POOL", None)
+    results = list(gen.iter_ai_units(((_cluster_steps(i), gen.rng_stream("cl", i)) for i in range(20)), True, "openai"))
+
+    assert fake_provider.calls == 4 # CL0-CL3 hold the slots; CL3's call fails and falls back to mock
+    assert [name for name, _ in results] == [f"CL{i}" if i != 3 else "mock-CL3" for i in range(20)] # Amplified rows keep their own names
+    assert gen.get_archetype_pool().stats() == {"archetypes": {"vCluster": 3}, "amplified": 16}
+
+
+def test_circuit_breaker_opens_on_failures_and_probes_once_half_open():
+    breaker = gen.CircuitBreaker("ollama", failure_threshold=3, cooldown=0.05)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record(False, 0.1)
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() # The half-open probe
+    assert not breaker.allow() # Only one probe at a time
+    breaker.record(False, 0.1)
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_circuit_breaker_opens_on_p95_latency():
+    breaker = gen.CircuitBreaker("openai", p95_threshold=1.0)
+    for seconds in [0.2] * 8 + [3.0] * 2:
+        breaker.record(True, seconds)
+    assert breaker.state == "open"
+
+
+def test_spent_time_budget_sends_rows_straight_to_mock(fake_provider, monkeypatch):
+    monkeypatch.setitem(gen.ENVIRONMENT_DATA, "config", {"ai_concurrency": 4, "ai_deadline": time.time() - 1})
+    results = list(gen.iter_ai_units(((_cluster_steps(i), gen.rng_stream("cl", i)) for i in range(5)), True, "openai"))
+    assert fake_provider.calls == 0
+    assert [name for name, _ in results] == [f"mock-CL{i}" for i in range(5)]
@@ -0,0 +1,59 @@
+import pytest
+import os
+import sys
+import csv
+import io
+
+# Add project root to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import rvtools_data_generator as gen
+from rvtools_data_generator import (ENVIRONMENT_DATA, DEFAULT_CSV_SUBDIR, SHARDED_TABLES, CSV_HEADERS, get_complexity_parameters,
+                                   run_sharded_vm_generation, set_run_seed)
+
+pytestmark = pytest.mark.skipif(not gen.NUMPY_AVAILABLE, reason="NumPy is not installed")
+
+
+def test_csv_block_quotes_like_csv_writer():
+    headers = ["A", "B", "C", "D"]
+    columns = {"A": ["plain", 'has "quotes"'], "B": gen._str_column([1, None]), ("C", "D"): ["x,y", "z,w"]}
+    rows, text = gen._csv_block(columns, headers)
+
+    expected = io.StringIO()
+    csv.writer(expected).writerows([["plain", 1, "x", "y"], ['has "quotes"', None, "z", "w"]])
+    assert rows == 2
+    assert text == expected.getvalue()
+
+
+def _numpy_run(monkeypatch, output_dir, num_workers):
+    for kind in ("vms", "hosts", "clusters", "datastores", "networks", "resource_pools", "datacenters", "folders", "dvSwitches", "vswitches"):
+        monkeypatch.setitem(ENVIRONMENT_DATA, kind, [])
+    monkeypatch.setitem(ENVIRONMENT_DATA, "config", {"output_dir": str(output_dir)})
+    set_run_seed(4321)
+    vinfo_args = {"num_vms": 60, "sdk_server_name": "vc.local", "base_sdk_uuid": "vc-uuid", "complexity_params": get_complexity_parameters("fancy", 60),
+                  "use_ai_cli_flag": False, "ai_provider_cli_arg": "mock", "scenario_config": None, "engine": "numpy"}
+    run_sharded_vm_generation(vinfo_args, list(SHARDED_TABLES), num_workers, 25, str(output_dir))
+    return {table: (output_dir / DEFAULT_CSV_SUBDIR / f"{table}.csv").read_text(encoding="utf-8") for table in SHARDED_TABLES}
+
+
+def test_numpy_engine_tables_are_consistent_and_worker_independent(monkeypatch, tmp_path):
+    monkeypatch.setattr(gen, "EXPORT_MANIFEST", {})
+    tables = _numpy_run(monkeypatch, tmp_path / "zero", 0)
+    assert _numpy_run(monkeypatch, tmp_path / "two", 2) == tables
+
+    parsed = {table: list(csv.DictReader(io.StringIO(text))) for table, text in tables.items()}
+    vinfo = parsed["vInfo"]
+    assert len(vinfo) == 60 == len(ENVIRONMENT_DATA["vms"])
+    assert len(parsed["vDisk"]) == sum(int(row["Disks"]) for row in vinfo)
+    assert len(parsed["vNetwork"]) == sum(int(row["NICs"]) for row in vinfo)
+    for table, rows in parsed.items():
+        assert list(rows[0]) == CSV_HEADERS[table]
+
+    # Child rows point back at their VM, and every switch a NIC uses was registered
+    uuids = {row["VM UUID"]: row["VM Name"] for row in vinfo}
+    assert all(uuids[row["VM UUID"]] == row["VM Name"] for table in ("vDisk", "vNetwork", "vSnapshot") for row in parsed[table])
+    switches = {sw["name"] for sw in ENVIRONMENT_DATA["vswitches"] + ENVIRONMENT_DATA["dvSwitches"]}
+    assert {row["Switch"] for row in parsed["vNetwork"]} <= switches
+    assert all(row["IP Address"] == "" for row in vinfo if row["Powerstate"] == "PoweredOff")
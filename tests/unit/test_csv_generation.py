@@ -100,7 +100,7 @@ def test_generate_vinfo_csv_random_path(mock_get_ai, mock_write_csv, tmp_path):
     mock_write_csv.assert_called_once()
     args, _ = mock_write_csv.call_args
     assert args[1] == "vInfo" # filename_prefix
-    assert len(args[0]) == num_test_vms # Number of data rows
+    assert len(list(args[0])) == num_test_vms # write_csv receives a lazy row iterable
 
 
 @mock.patch('rvtools_data_generator.write_csv')
@@ -164,7 +164,7 @@ def test_generate_vinfo_csv_with_simple_scenario(mock_get_ai, mock_write_csv, tm
     mock_write_csv.assert_called_once()
     args, _ = mock_write_csv.call_args
     assert args[1] == "vInfo"
-    assert len(args[0]) == 2
+    assert len(list(args[0])) == 2
 
 
 @mock.patch('rvtools_data_generator.write_csv')
@@ -204,14 +204,15 @@ def test_generate_vhost_csv_basic(mock_get_ai, mock_write_csv, tmp_path):
     mock_write_csv.assert_called_once()
     args, _ = mock_write_csv.call_args
     assert args[1] == "vHost" # filename_prefix
-    assert len(args[0]) == 2 # Number of hosts
+    rows = list(args[0]) # Rows are generated lazily as write_csv consumes them
+    assert len(rows) == 2 # Number of hosts
 
     # Check if AI data was merged by looking at one of the AI-provided fields in the data passed to write_csv
-    # args[0] is the list of rows (which are lists themselves)
+    # Each row is a list of values in header order
     header_list = CSV_HEADERS["vHost"]
     vendor_index = header_list.index("Vendor")
-    assert args[0][0][vendor_index] == "AI Host Vendor"
-    assert args[0][1][vendor_index] == "AI Host Vendor"
+    assert rows[0][vendor_index] == "AI Host Vendor"
+    assert rows[1][vendor_index] == "AI Host Vendor"
 
 
 @mock.patch('rvtools_data_generator.write_csv')
@@ -261,14 +262,14 @@ def test_generate_vdisk_csv_with_profile(mock_get_ai, mock_write_csv, tmp_path):
     mock_write_csv.assert_called_once()
     args, _ = mock_write_csv.call_args
     assert args[1] == "vDisk"
-    assert len(args[0]) == 2 # 2 disks for the VM
+    rows = list(args[0]) # Rows are generated lazily as write_csv consumes them
+    assert len(rows) == 2 # 2 disks for the VM
 
     # Check if AI data ('Thin': True) was applied to the first disk, overriding profile's False
     header_list = CSV_HEADERS["vDisk"]
     thin_index = header_list.index("Thin")
     controller_index = header_list.index("Controller") # Assuming 'Controller' is a header, adjust if not
 
-    first_disk_data_written = args[0][0] # This is a list
+    first_disk_data_written = rows[0] # This is a list
     assert first_disk_data_written[thin_index] is True
     assert first_disk_data_written[controller_index] == "AI SCSI Controller"
-```
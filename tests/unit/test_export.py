@@ -0,0 +1,126 @@
+import pytest
+import os
+import csv
+import sys
+import json
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import rvtools_data_generator as gen
+from rvtools_data_generator import write_csv, ZipCsvExporter, DEFAULT_CSV_SUBDIR, MANIFEST_FILENAME
+
+
+def read_csv_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_write_csv_consumes_lazy_iterables(tmp_path):
+    headers = ["Name", "Count"]
+    produced = []
+
+    def rows():
+        for i in range(3):
+            produced.append(i)
+            yield [f"row{i}", i]
+
+    row_count = write_csv(rows(), "lazy", headers, output_dir_override=str(tmp_path))
+    assert row_count == 3
+    assert produced == [0, 1, 2]
+    assert read_csv_rows(tmp_path / DEFAULT_CSV_SUBDIR / "lazy.csv") == [headers, ["row0", "0"], ["row1", "1"], ["row2", "2"]]
+
+
+def test_write_csv_accepts_dict_rows_and_empty_input(tmp_path):
+    headers = ["Name", "Count"]
+    write_csv(iter([{"Count": 5, "Name": "a"}, {"Name": "b"}]), "dicts", headers, output_dir_override=str(tmp_path))
+    assert read_csv_rows(tmp_path / DEFAULT_CSV_SUBDIR / "dicts.csv") == [headers, ["a", "5"], ["b", ""]]
+
+    assert write_csv([], "empty", headers, output_dir_override=str(tmp_path)) == 0
+    assert read_csv_rows(tmp_path / DEFAULT_CSV_SUBDIR / "empty.csv") == [headers]
+
+
+def test_zip_exporter_streams_tables_and_manifest(tmp_path, monkeypatch):
+    zip_path = tmp_path / "out.zip"
+    exporter = ZipCsvExporter(str(zip_path))
+    monkeypatch.setattr(gen, "_ZIP_EXPORTER", exporter)
+    monkeypatch.setattr(gen, "EXPORT_MANIFEST", {})
+    assert write_csv((["vm%d" % i, i] for i in range(4)), "vInfo", ["VM", "N"]) == 4
+    exporter.close()
+
+    arcname = f"{DEFAULT_CSV_SUBDIR}/vInfo.csv"
+    assert not (tmp_path / DEFAULT_CSV_SUBDIR).exists()
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.namelist() == [arcname, MANIFEST_FILENAME]
+        payload = zf.read(arcname)
+        manifest = json.loads(zf.read(MANIFEST_FILENAME))
+    assert payload.decode("utf-8").splitlines()[0] == "VM,N"
+    assert manifest["tables"][arcname] == {"rows": 4, "bytes": len(payload), "sha256": hashlib.sha256(payload).hexdigest()}
+
+
+def test_xlsx_workbook_streams_typed_cells_and_splits_long_tables(tmp_path, monkeypatch):
+    monkeypatch.setattr(gen, "XLSX_MAX_ROWS", 3) # Header + 2 rows per sheet
+    write_csv([["vm-a", 1024, " padded <&> "], ["vm-b", "", "x"], ["vm-c", "007", "y"]], "vDisk", ["VM", "MB", "Note"], output_dir_override=str(tmp_path))
+    xlsx_path = tmp_path / "out.xlsx"
+    gen.write_staged_xlsx(str(xlsx_path), str(tmp_path))
+
+    with zipfile.ZipFile(xlsx_path) as zf:
+        workbook = zf.read("xl/workbook.xml").decode("utf-8")
+        first, second = zf.read("xl/worksheets/sheet1.xml").decode("utf-8"), zf.read("xl/worksheets/sheet2.xml").decode("utf-8")
+        assert "[Content_Types].xml" in zf.namelist()
+    assert 'name="vDisk"' in workbook and 'name="vDisk (2)"' in workbook and "sheet3" not in workbook
+    assert "<c><v>1024</v></c><c t=\"inlineStr\"><is><t xml:space=\"preserve\"> padded &lt;&amp;&gt; </t></is></c>" in first
+    assert '<row r="3"><c t="inlineStr"><is><t>vm-b</t></is></c><c/>' in first
+    # Leading zeros stay text; the continuation sheet repeats the header
+    assert second.count("<row ") == 2 and "<t>007</t>" in second and "<t>VM</t>" in second
+
+
+def test_staged_zip_deflates_blocks_in_parallel_with_thread_independent_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(gen, "ZIP_BLOCK_SIZE", 1024)
+    monkeypatch.setattr(gen, "EXPORT_MANIFEST", {})
+    write_csv(([f"vm-{i}", i * 7919 % 1000, "x" * (i % 13)] for i in range(2000)), "vDisk", ["VM", "MB", "Note"], output_dir_override=str(tmp_path))
+    write_csv([], "vHost", ["Name"], output_dir_override=str(tmp_path))
+    payload = (tmp_path / DEFAULT_CSV_SUBDIR / "vDisk.csv").read_bytes()
+    assert len(payload) > 20 * 1024
+
+    archives = {}
+    for threads in (1, 3):
+        archives[threads] = tmp_path / f"t{threads}.zip"
+        gen.write_staged_zip(str(archives[threads]), str(tmp_path), gen.SEEDED_ZIP_DATE_TIME, compresslevel=9, threads=threads)
+    assert archives[1].read_bytes() == archives[3].read_bytes()
+    with zipfile.ZipFile(archives[3]) as zf:
+        assert zf.testzip() is None
+        assert zf.read(f"{DEFAULT_CSV_SUBDIR}/vDisk.csv") == payload
+        assert zf.read(f"{DEFAULT_CSV_SUBDIR}/vHost.csv") == b"Name\r\n"
+        assert zf.getinfo(f"{DEFAULT_CSV_SUBDIR}/vDisk.csv").compress_size < len(payload) // 3
+
+    # Parallel entries alone, with no writestr() after them, still get a central directory
+    for mode in ("w", "a"):
+        only_parallel = tmp_path / "parallel.zip"
+        with zipfile.ZipFile(only_parallel, mode, allowZip64=True) as zf, ThreadPoolExecutor(max_workers=3) as pool, open(tmp_path / DEFAULT_CSV_SUBDIR / "vDisk.csv", "rb") as src:
+            gen.write_zip_entry_deflated_in_parallel(zf, zipfile.ZipInfo(f"{mode}/vDisk.csv", gen.SEEDED_ZIP_DATE_TIME), src, pool, 6, 6)
+    with zipfile.ZipFile(only_parallel) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["w/vDisk.csv", "a/vDisk.csv"]
+        assert zf.read("a/vDisk.csv") == payload
+
+    # Without the zipfile internals it relies on, the helper writes through zf.open() instead
+    monkeypatch.setattr(gen, "_ZIPFILE_WRITE_STATE", gen._ZIPFILE_WRITE_STATE + ("_not_in_this_zipfile",))
+    with zipfile.ZipFile(only_parallel, "a", allowZip64=True) as zf, ThreadPoolExecutor(max_workers=3) as pool, open(tmp_path / DEFAULT_CSV_SUBDIR / "vDisk.csv", "rb") as src:
+        gen.write_zip_entry_deflated_in_parallel(zf, zipfile.ZipInfo("fallback/vDisk.csv", gen.SEEDED_ZIP_DATE_TIME), src, pool, 6, 6)
+    with zipfile.ZipFile(only_parallel) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["w/vDisk.csv", "a/vDisk.csv", "fallback/vDisk.csv"]
+        assert zf.read("fallback/vDisk.csv") == payload
+        assert zf.getinfo("fallback/vDisk.csv").compress_type == zipfile.ZIP_DEFLATED
+
+    stored = tmp_path / "stored.zip"
+    gen.write_staged_zip(str(stored), str(tmp_path), compression=zipfile.ZIP_STORED)
+    with zipfile.ZipFile(stored) as zf:
+        assert {info.compress_type for info in zf.infolist()} == {zipfile.ZIP_STORED}
+        assert zf.read(f"{DEFAULT_CSV_SUBDIR}/vDisk.csv") == payload
@@ -0,0 +1,61 @@
+import pytest
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+# Add project root to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import rvtools_data_generator as gen
+from benchmarks.fake_llm_server import start_server
+
+
+@pytest.fixture
+def server():
+    server = start_server(seed=1)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.read().decode("utf-8")
+
+
+def test_openai_batch_answers_pass_validation(server):
+    requests = [gen._vdisk_ai_request({"name": f"vm-{i}", "power_state": "poweredOn"}, 0, "Hard disk 1", "ds-gold-1", None) for i in range(3)]
+    messages = [{"role": role, "content": content} for role, content in gen._batch_prompt_messages(requests)]
+    body = json.loads(_post(server.url + "/v1/chat/completions", {"model": "gpt-4o-mini", "messages": messages}))
+
+    rows = json.loads(body["choices"][0]["message"]["content"])
+    assert len(rows) == 3
+    for i, row in enumerate(rows):
+        gen._validate_ai_response("vDisk", row)
+        assert row["Path"] == f"[ds-gold-1] vm-{i}/vm-{i}_0.vmdk"
+
+
+def test_ollama_single_row_echoes_the_requested_names(server):
+    request = gen._vhost_ai_request("esx07", {"cluster_name": "DC1-CL2", "datacenter_name": "DC1"}, True, "ollama")
+    gen._add_column_details(request["context"], "vHost")
+    prompt = request["prompt_template"].format(**request["context"])
+    lines = _post(server.url + "/api/chat", {"model": "llama3", "messages": [{"role": "user", "content": prompt}]}).splitlines()
+
+    row = gen._validate_ai_response("vHost", json.loads(json.loads(lines[0])["message"]["content"]))
+    assert (row["Name"], row["Cluster"], row["Datacenter"]) == ("esx07", "DC1-CL2", "DC1")
+    assert json.loads(lines[-1])["done"] is True
+
+
+def test_injected_errors_and_stats(server):
+    server.error_rate = 1.0
+    with pytest.raises(urllib.error.HTTPError) as failure:
+        _post(server.url + "/v1/chat/completions", {"messages": [{"role": "user", "content": "vCluster"}]})
+    assert failure.value.code == 500
+    with urllib.request.urlopen(server.url + "/stats", timeout=5) as response:
+        stats = json.loads(response.read())
+    assert (stats["requests"], stats["errors"], stats["in_flight"]) == (1, 1, 0)
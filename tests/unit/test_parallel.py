@@ -0,0 +1,281 @@
+import pytest
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import zipfile
+
+# Add project root to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import rvtools_data_generator as gen
+from rvtools_data_generator import (ENVIRONMENT_DATA, DEFAULT_CSV_SUBDIR, SHARDED_TABLES, generate_vhba_csv, generate_vnetwork_csv,
+                                   get_complexity_parameters, run_sharded_vm_generation, run_tasks_in_process_pool,
+                                   set_run_seed, use_rng_stream, current_rng, generate_uuid)
+
+
+@pytest.fixture
+def small_env(monkeypatch, tmp_path):
+    monkeypatch.setitem(ENVIRONMENT_DATA, "config", {"output_dir": str(tmp_path)})
+    monkeypatch.setitem(ENVIRONMENT_DATA, "hosts", [{"name": "esx01", "cluster": "CL1", "datacenter": "DC1", "uuid": "h-1"}])
+    monkeypatch.setitem(ENVIRONMENT_DATA, "vms", [{"name": "vm-1", "host": "esx01", "datacenter": "DC1", "num_nics": 1,
+                                                   "profile_nics": [{"network_label_hint": "Prod-Net", "vlan_id": 10}]}])
+    for kind in ("networks", "dvSwitches", "vswitches", "datacenters"):
+        monkeypatch.setitem(ENVIRONMENT_DATA, kind, [])
+    monkeypatch.setattr(gen, "EXPORT_MANIFEST", {})
+    return tmp_path
+
+
+def test_process_pool_writes_tables_from_the_planned_topology(small_env):
+    kwargs = {"complexity_params": {"default_hbas_per_host": 2, "dvs_likelihood": 0.0}}
+    ENVIRONMENT_DATA["datacenters"].append({"name": "DC1", "networks": []})
+    segment = {"datacenter": "DC1", "vm_profile": {"nics": ENVIRONMENT_DATA["vms"][0]["profile_nics"]}}
+    gen.plan_network_topology([(1, segment)], dict(kwargs["complexity_params"], networks_per_datacenter=1))
+    assert [net["name"] for net in ENVIRONMENT_DATA["networks"]] == ["Prod-Net"]
+    assert [sw["name"] for sw in ENVIRONMENT_DATA["vswitches"]] == ["vSwitch0_esx01"]
+    planned = {kind: list(ENVIRONMENT_DATA[kind]) for kind in ("networks", "vswitches", "dvSwitches", "folders")}
+
+    run_tasks_in_process_pool({"vHBA": {"func": generate_vhba_csv, "args": kwargs, "outputs": ()},
+                               "vNetwork": {"func": generate_vnetwork_csv, "args": kwargs, "outputs": ()}}, 2, str(small_env))
+
+    assert gen.EXPORT_MANIFEST[f"{DEFAULT_CSV_SUBDIR}/vHBA.csv"]["rows"] == 2
+    assert gen.EXPORT_MANIFEST[f"{DEFAULT_CSV_SUBDIR}/vNetwork.csv"]["rows"] == 1
+    row = (small_env / DEFAULT_CSV_SUBDIR / "vNetwork.csv").read_text().splitlines()[1]
+    assert "Prod-Net" in row and "vSwitch0_esx01" in row
+    # Row generators only read the planned topology
+    assert {kind: list(ENVIRONMENT_DATA[kind]) for kind in planned} == planned
+
+
+def test_tasks_without_outputs_cannot_add_to_the_topology(small_env):
+    with gen.TOPOLOGY.read_only("vHost"), pytest.raises(RuntimeError, match="vHost"):
+        gen.TOPOLOGY.add("networks", {"name": "Late-Net", "datacenter": "DC1"})
+    gen.TOPOLOGY.add("networks", {"name": "Late-Net", "datacenter": "DC1"}) # Writable again outside the block
+
+
+def _fresh_environment(monkeypatch, output_dir):
+    for kind in ("vms", "hosts", "clusters", "datastores", "networks", "resource_pools", "datacenters", "folders", "dvSwitches", "vswitches"):
+        monkeypatch.setitem(ENVIRONMENT_DATA, kind, [])
+    monkeypatch.setitem(ENVIRONMENT_DATA, "sdk_server_map", {}) # Else a second main() reuses the first run's vCenter UUID and skips its draw
+    monkeypatch.setitem(ENVIRONMENT_DATA, "config", {"output_dir": str(output_dir)})
+
+
+def _sharded_run(monkeypatch, output_dir, num_workers):
+    _fresh_environment(monkeypatch, output_dir)
+    set_run_seed(1234)
+    vinfo_args = {"num_vms": 45, "sdk_server_name": "vc.local", "base_sdk_uuid": "vc-uuid", "complexity_params": get_complexity_parameters("fancy", 45),
+                  "use_ai_cli_flag": False, "ai_provider_cli_arg": "mock", "scenario_config": None}
+    run_sharded_vm_generation(vinfo_args, list(SHARDED_TABLES), num_workers, 10, str(output_dir))
+    return {table: (output_dir / DEFAULT_CSV_SUBDIR / f"{table}.csv").read_bytes() for table in SHARDED_TABLES}, len(ENVIRONMENT_DATA["vms"])
+
+
+def test_sharded_output_does_not_depend_on_worker_count(monkeypatch, tmp_path):
+    monkeypatch.setattr(gen, "EXPORT_MANIFEST", {})
+    in_process, vm_count = _sharded_run(monkeypatch, tmp_path / "zero", 0)
+    one_worker, _ = _sharded_run(monkeypatch, tmp_path / "one", 1)
+    three_workers, _ = _sharded_run(monkeypatch, tmp_path / "three", 3)
+
+    assert vm_count == 45
+    assert one_worker["vInfo"].decode("utf-8").count("\n") == 46 # Header + one row per VM, shards concatenated
+    assert in_process == one_worker == three_workers
+
+
+class LoggingChain:
+    """A provider answering every vInfo/vDisk/vNetwork request; each call is logged with its pid, from any process."""
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+
+    async def ainvoke(self, context):
+        with open(self.log_path, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        return {"VM Name": "vm", "Powerstate": "poweredOn", "OS according to VMWare": "Ubuntu Linux (64-bit)", "Provisioned MB": 40960, "In Use MB": 20480,
+                "Disk": "Hard disk 1", "Capacity MB": 40960, "Thin": "true", "Network adapter": "Network adapter 1", "Adapter Type": "VMXNET3",
+                "MAC Address": "00:50:56:00:00:01", "Connected": "true"}
+
+
+def test_archetypes_are_authored_once_whatever_the_worker_count(monkeypatch, tmp_path):
+    log_path = tmp_path / "calls.log"
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(gen, "LANGCHAIN_AVAILABLE", True)
+    monkeypatch.setattr(gen, "_new_llm_client", lambda ai_provider, model_name: None)
+    monkeypatch.setattr(gen, "_build_ai_chain", lambda prompt_template, llm_provider: LoggingChain(log_path))
+    monkeypatch.setattr(gen, "EXPORT_MANIFEST", {})
+    outputs, stats = [], []
+    for workers in (0, 1, 3):
+        for name in ("_AI_EXECUTOR", "_LLM_REGISTRY", "_ARCHETYPE_POOL"):
+            monkeypatch.setattr(gen, name, None)
+        monkeypatch.setattr(gen, "_CIRCUIT_BREAKERS", {})
+        output_dir = tmp_path / f"w{workers}"
+        _fresh_environment(monkeypatch, output_dir)
+        ENVIRONMENT_DATA["config"]["ai_archetypes"] = 2
+        set_run_seed(99)
+        vinfo_args = {"num_vms": 30, "sdk_server_name": "vc.local", "base_sdk_uuid": "vc-uuid", "complexity_params": get_complexity_parameters("fancy", 30),
+                      "use_ai_cli_flag": True, "ai_provider_cli_arg": "openai", "scenario_config": None}
+        run_sharded_vm_generation(vinfo_args, list(SHARDED_TABLES), workers, 5, str(output_dir))
+        outputs.append({table: (output_dir / DEFAULT_CSV_SUBDIR / f"{table}.csv").read_bytes() for table in SHARDED_TABLES})
+        stats.append(gen.get_archetype_pool().stats())
+
+    calls = log_path.read_text().split()
+    assert len(calls) == 3 * 2 * 3 # vInfo, vDisk and vNetwork authored K=2 archetypes in each of the three runs
+    assert set(calls) == {str(os.getpid())} # ... all in the parent, before any shard reached a worker
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert stats[0] == stats[1] == stats[2] and stats[0]["archetypes"] == {"vInfo": 2, "vDisk": 2, "vNetwork": 2}
+    assert stats[0]["amplified"] > 0 # Rows amplified in workers are counted in the parent
+
+
+def test_same_seed_gives_byte_identical_zip_at_any_worker_count(monkeypatch, tmp_path):
+    def run(name, workers):
+        _fresh_environment(monkeypatch, tmp_path / name)
+        gen.main(["--num_vms", "30", "--complexity", "fancy", "--seed", "7", "--workers", str(workers), "--shard_size", "8",
+                  "--direct_zip", "--output_dir", str(tmp_path / name), "--zip_filename", "out.zip"])
+        return (tmp_path / name / "out.zip").read_bytes()
+
+    assert run("zero", 0) == run("two", 2)
+
+
+def test_profile_reports_every_stage(monkeypatch, tmp_path):
+    _fresh_environment(monkeypatch, tmp_path)
+    gen.main(["--num_vms", "20", "--complexity", "fancy", "--seed", "3", "--workers", "1", "--profile",
+              "--output_dir", str(tmp_path), "--zip_filename", "out.zip"])
+
+    report = json.loads((tmp_path / gen.PROFILE_REPORT_FILENAME).read_text())
+    stages = {stage["stage"]: stage for stage in report["stages"]}
+    assert {"vInfo + vDisk, vNetwork, vSnapshot", "vHost", "ZIP"} <= set(stages)
+    assert any(name.startswith("process pool") for name in stages)
+    assert all(stage["wall_seconds"] >= 0 and stage["peak_traced_mb"] > 0 for stage in stages.values())
+    assert gen._PROFILER is None and not gen.tracemalloc.is_tracing()
+
+
+def test_rng_streams_are_keyed_and_uuids_come_from_them():
+    set_run_seed(99)
+    with use_rng_stream("vm", 3):
+        first = (generate_uuid(), current_rng().random())
+    with use_rng_stream("vm", 4):
+        other = generate_uuid()
+    with use_rng_stream("vm", 3):
+        assert (generate_uuid(), current_rng().random()) == first
+    assert other != first[0]
+
+
+def test_task_plan_adds_upstream_tasks_and_orders_waves():
+    names, pulled_in = gen.select_generation_tasks(["vHBA", "vCluster"])
+    assert names == ["vInfo", "vCluster", "vHBA"]
+    assert pulled_in == {"vInfo": ["vCluster", "vHBA"]}
+
+    tasks = {name: gen.GENERATION_TASKS[name] for name in ["vInfo", "vHBA", "vTools", "vHost"]}
+    assert gen.plan_task_waves(tasks) == [["vInfo", "vTools"], ["vHost", "vHBA"]]
+
+    cyclic = {"a": {"inputs": ("y",), "outputs": ("x",), "pool": False}, "b": {"inputs": ("x",), "outputs": ("y",), "pool": False}}
+    with pytest.raises(ValueError, match="cycle"):
+        gen.plan_task_waves(cyclic)
+
+
+def test_vhost_and_vhba_agree_on_host_uuids_in_either_order(monkeypatch, tmp_path):
+    complexity_params = get_complexity_parameters("fancy", 40)
+    for order in (("vHost", "vHBA"), ("vHBA", "vHost")):
+        output_dir = tmp_path / order[0]
+        _fresh_environment(monkeypatch, output_dir)
+        monkeypatch.setattr(gen, "EXPORT_MANIFEST", {})
+        set_run_seed(5)
+        gen._build_vinfo_topology(40, "vc.local", "vc-uuid", complexity_params)
+        for name in order:
+            task = dict(gen.GENERATION_TASKS[name], args={"complexity_params": complexity_params})
+            gen.run_generation_task(name, task)
+
+        topology_uuids = {host["name"]: host["uuid"] for host in ENVIRONMENT_DATA["hosts"]}
+        with open(output_dir / DEFAULT_CSV_SUBDIR / "vHost.csv", newline="") as f:
+            vhost_uuids = {row["Name"]: row["Host UUID"] for row in csv.DictReader(f)}
+        with open(output_dir / DEFAULT_CSV_SUBDIR / "vHBA.csv", newline="") as f:
+            vhba_uuids = {row["Host"]: row["Host UUID"] for row in csv.DictReader(f)}
+        assert vhba_uuids and all(topology_uuids.values())
+        assert vhost_uuids == topology_uuids
+        assert all(vhost_uuids[host] == uuid for host, uuid in vhba_uuids.items())
+
+
+def test_threaded_task_graph_starts_tasks_once_their_inputs_exist():
+    tasks = {"producer": {"inputs": (), "outputs": ("vms",), "pool": False}, "consumer": {"inputs": ("vms",), "outputs": (), "pool": False},
+             "independent": {"inputs": (), "outputs": (), "pool": True}}
+    produced, seen_by_consumer = [], []
+
+    def run_task(name):
+        if name == "producer":
+            produced.append("vm-1")
+        elif name == "consumer":
+            seen_by_consumer.extend(produced)
+
+    gen.run_task_graph_threaded(tasks, run_task)
+    assert seen_by_consumer == ["vm-1"]
+
+
+def test_saved_environment_regenerates_a_subset_without_vinfo(monkeypatch, tmp_path):
+    snapshot = tmp_path / "env.bin"
+    _fresh_environment(monkeypatch, tmp_path / "full")
+    gen.main(["--num_vms", "25", "--seed", "5", "--direct_zip", "--output_dir", str(tmp_path / "full"), "--zip_filename", "out.zip", "--save_env", str(snapshot)])
+    vm_names = {vm["name"] for vm in ENVIRONMENT_DATA["vms"]}
+
+    _fresh_environment(monkeypatch, tmp_path / "subset")
+    monkeypatch.setattr(gen, "generate_vinfo_csv", lambda **kwargs: pytest.fail("vInfo rebuilt despite --load_env"))
+    gen.main(["--load_env", str(snapshot), "--csv_types", "vSnapshot", "--seed", "6", "--complexity", "fancy", "--direct_zip",
+              "--output_dir", str(tmp_path / "subset"), "--zip_filename", "out.zip"])
+    assert {vm["name"] for vm in ENVIRONMENT_DATA["vms"]} == vm_names
+    with zipfile.ZipFile(tmp_path / "subset" / "out.zip") as archive:
+        assert sorted(archive.namelist()) == [f"{DEFAULT_CSV_SUBDIR}/vSnapshot.csv", gen.MANIFEST_FILENAME]
+
+    scenario = tmp_path / "scenario.yaml"
+    scenario.write_text("datacenters: []\n")
+    with pytest.raises(ValueError, match="stale"):
+        gen.load_environment_snapshot(str(snapshot), gen.scenario_fingerprint(str(scenario)))
+
+
+def _read_table(archive_path, table):
+    with zipfile.ZipFile(archive_path) as archive:
+        return list(csv.reader(io.StringIO(archive.read(f"{DEFAULT_CSV_SUBDIR}/{table}.csv").decode("utf-8"))))[1:]
+
+
+def test_series_carries_unchanged_vms_forward_and_churns_the_rest(monkeypatch, tmp_path):
+    _fresh_environment(monkeypatch, tmp_path)
+    gen.main(["--num_vms", "40", "--seed", "9", "--series", "3", "--interval", "7d", "--series_start", "2025-01-06",
+              "--series_churn", "0.1", "--output_dir", str(tmp_path), "--zip_filename", "rv_{timestamp}.zip"])
+    steps = [tmp_path / f"rv_202501{day:02d}_000000.zip" for day in (6, 13, 20)]
+    assert all(step.exists() for step in steps)
+
+    before, after = _read_table(steps[0], "vNetwork"), _read_table(steps[1], "vNetwork")
+    uuid_column = gen.CSV_HEADERS["vNetwork"].index("VM UUID")
+    kept = {row[uuid_column] for row in before} & {row[uuid_column] for row in after}
+    assert kept and len(kept) < len({row[uuid_column] for row in before}) # Some VMs were deleted
+    # Surviving VMs keep their adapters row for row; only new VMs bring new rows
+    assert [row for row in before if row[uuid_column] in kept] == [row for row in after if row[uuid_column] in kept]
+
+    vinfo = {row[gen.CSV_HEADERS["vInfo"].index("VM UUID")]: row for row in _read_table(steps[2], "vInfo")}
+    created = [row for row in vinfo.values() if row[gen.CSV_HEADERS["vInfo"].index("Creation date")].startswith("2025-01-")]
+    assert created and len(vinfo) >= 40
+    assert len(vinfo) == len(ENVIRONMENT_DATA["vms"])
+    with pytest.raises(argparse.ArgumentTypeError):
+        gen.parse_interval("weekly")
+
+
+def test_vcenters_are_generated_separately_and_merged_in_order(monkeypatch, tmp_path):
+    archives = []
+    for workers in (1, 2):
+        _fresh_environment(monkeypatch, tmp_path / f"w{workers}")
+        monkeypatch.setitem(ENVIRONMENT_DATA, "sdk_server_map", {})
+        gen.main(["--num_vms", "20", "--vcenters", "2", "--seed", "4", "--workers", str(workers), "--csv_types", "vInfo", "vHost",
+                  "--output_dir", str(tmp_path / f"w{workers}"), "--zip_filename", "out.zip"])
+        archives.append((tmp_path / f"w{workers}" / "out.zip").read_bytes())
+    assert archives[0] == archives[1]
+
+    assert list(ENVIRONMENT_DATA["sdk_server_map"]) == ["vcenter01.corp.local", "vcenter02.corp.local"]
+    vinfo = _read_table(tmp_path / "w2" / "out.zip", "vInfo")
+    headers = gen.CSV_HEADERS["vInfo"]
+    servers = [(row[headers.index("VI SDK Server")], row[headers.index("VI SDK UUID")], row[headers.index("Datacenter")]) for row in vinfo]
+    assert [server for server, _, _ in servers] == ["vcenter01.corp.local"] * 10 + ["vcenter02.corp.local"] * 10
+    assert {(server, uuid, dc) for server, uuid, dc in servers} == {(name, uuid, f"{name.split('.')[0]}-DC01") for name, uuid in ENVIRONMENT_DATA["sdk_server_map"].items()}
+    assert {host["sdk_server"] for host in gen.TOPOLOGY.members("hosts", "datacenter", "vcenter02-DC01")} == {"vcenter02.corp.local"}
+
+    clashing = {"vcenters": [{"name": "a", "datacenters": [{"name": "DC1"}]}, {"name": "b", "datacenters": [{"name": "DC1"}]}]}
+    with pytest.raises(ValueError, match="unique"):
+        gen.plan_vcenters(clashing, 1, 10)
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+# The generator runs in fresh interpreters, so the project root is only needed as a path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Optional libraries a plain mock run must not import (tqdm and numpy only load when their feature is used).
+DEFERRED_MODULES = {"langchain", "langchain_core", "langchain_openai", "langchain_community", "openai", "tkinter", "yaml", "numpy"}
+
+
+def _imported_modules(args, cwd):
+    """Run a Python command under -X importtime and return the set of top-level modules it imported."""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=cwd, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            if name != "imported package": # Header row
+                modules.add(name.split(".")[0])
+    return modules
+
+
+def test_import_defers_optional_libraries():
+    modules = _imported_modules(["-c", "import rvtools_data_generator"], project_root)
+    assert "rvtools_data_generator" in modules
+    assert not modules & (DEFERRED_MODULES | {"tqdm"})
+
+
+def test_mock_run_defers_optional_libraries(tmp_path):
+    args = [os.path.join(project_root, "rvtools_data_generator.py"), "--num_vms", "5", "--seed", "1", "--output_dir", str(tmp_path)]
+    modules = _imported_modules(args, str(tmp_path))
+    assert not modules & DEFERRED_MODULES
+    assert list(tmp_path.glob("*.zip"))
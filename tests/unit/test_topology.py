@@ -0,0 +1,81 @@
+import pytest
+import os
+import sys
+
+# Add project root to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from rvtools_data_generator import TopologyStore
+
+
+@pytest.fixture
+def env():
+    return {"vms": [], "hosts": [], "clusters": [], "datastores": [], "networks": [],
+            "resource_pools": [], "datacenters": [], "folders": [], "dvSwitches": [], "vswitches": []}
+
+
+def test_add_indexes_and_links_parents(env):
+    store = TopologyStore(env)
+    dc = store.add("datacenters", {"name": "DC1", "clusters": [], "hosts": [], "vms": [], "datastores": [], "networks": []})
+    cl = store.add("clusters", {"name": "DC1-CL1", "datacenter": "DC1", "hosts": [], "vms": [], "resource_pools": []})
+    host = store.add("hosts", {"name": "esx01", "cluster": "DC1-CL1", "datacenter": "DC1", "vms_on_host": []})
+    store.add("vms", {"name": "vm-001", "host": "esx01", "cluster": "DC1-CL1", "datacenter": "DC1"})
+    store.add("vms", {"name": "vm-002", "host": "esx01", "cluster": "DC1-CL1", "datacenter": "DC1"})
+
+    assert store.find("hosts", "esx01") is host
+    assert store.count("vms", "cluster", "DC1-CL1") == 2
+    assert store.count("vms", "datacenter", "DC1") == 2
+    assert host["vms_on_host"] == ["vm-001", "vm-002"]
+    assert cl["hosts"] == ["esx01"] and cl["vms"] == ["vm-001", "vm-002"]
+    assert dc["clusters"] == ["DC1-CL1"]
+    assert len(env["vms"]) == 2 # ENVIRONMENT_DATA lists remain the source of truth
+
+
+def test_add_if_absent_uses_compound_keys(env):
+    store = TopologyStore(env)
+    first = store.add_if_absent("folders", {"name": "VMs_ABC", "datacenter": "DC1"})
+    again = store.add_if_absent("folders", {"name": "VMs_ABC", "datacenter": "DC1"})
+    other_dc = store.add_if_absent("folders", {"name": "VMs_ABC", "datacenter": "DC2"})
+    assert again is first
+    assert other_dc is not first
+    assert len(env["folders"]) == 2
+    assert store.find("folders", ("VMs_ABC", "DC2")) is other_dc
+
+
+def test_picks_up_direct_list_changes(env):
+    store = TopologyStore(env)
+    env["hosts"].append({"name": "h1", "cluster": "C1"})
+    assert store.find("hosts", "h1")["cluster"] == "C1"
+
+    env["hosts"] = [{"name": "h2", "cluster": "C2"}] # List swapped out, as the unit tests do
+    assert store.find("hosts", "h1") is None
+    assert store.count("hosts", "cluster", "C2") == 1
+
+    env["hosts"].clear()
+    assert store.find("hosts", "h2") is None
+
+
+def test_shared_datastores_and_substring_lookup(env):
+    store = TopologyStore(env)
+    store.add("datastores", {"name": "esx01-local-ds-1", "is_local": True, "datacenter": "DC1"})
+    store.add("datastores", {"name": "shared-ds-gold-1", "is_local": False, "datacenter": "DC1"})
+    assert [ds["name"] for ds in store.members("datastores", "shared_datacenter", "DC1")] == ["shared-ds-gold-1"]
+    assert store.names_containing("datastores", "GOLD") == ["shared-ds-gold-1"]
+    store.add("datastores", {"name": "shared-ds-gold-2", "is_local": False, "datacenter": "DC1"})
+    assert store.names_containing("datastores", "gold") == ["shared-ds-gold-1", "shared-ds-gold-2"]
+
+
+def test_add_all_if_absent_matches_one_at_a_time(env):
+    store = TopologyStore(env)
+    store.add("datacenters", {"name": "DC1", "networks": []})
+    store.add_if_absent("folders", {"name": "VMs_ABC", "datacenter": "DC1"})
+    store.add_all_if_absent("folders", [{"name": "VMs_ABC", "datacenter": "DC1"}, {"name": "VMs_XYZ", "datacenter": "DC1"},
+                                        {"name": "VMs_XYZ", "datacenter": "DC1"}, {"name": "VMs_ABC", "datacenter": "DC2"}])
+    assert [(f["name"], f["datacenter"]) for f in env["folders"]] == [("VMs_ABC", "DC1"), ("VMs_XYZ", "DC1"), ("VMs_ABC", "DC2")]
+
+    store.add_all_if_absent("networks", [{"name": "Prod", "datacenter": "DC1"}])
+    assert store.find("networks", "Prod") is env["networks"][0]
+    assert store.count("networks", "datacenter", "DC1") == 1
+    assert store.find("datacenters", "DC1")["networks"] == ["Prod"] # Parent links kept, as with add()
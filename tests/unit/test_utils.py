@@ -1,6 +1,7 @@
 import pytest
 import os
 import re
+import random
 import uuid as uuid_module # To avoid conflict with our function
 from datetime import datetime, timedelta
 import sys
@@ -29,6 +30,7 @@ from rvtools_data_generator import (
     generate_uuid,
     get_complexity_parameters,
     load_scenario_config,
+    PrimitiveSampler,
     YAML_AVAILABLE # This is the flag from the main script
 )
 
@@ -106,6 +108,31 @@ def test_generate_random_datetime():
     assert generated_dt_obj3.date() == datetime.strptime("2023-10-10", "%Y-%m-%d").date()
 
 
+def test_primitive_sampler_batches():
+    sampler = PrimitiveSampler(random.Random(7))
+    ips = sampler.ips(200, "10.1.2.0/29")
+    assert set(ips) <= {f"10.1.2.{i}" for i in range(1, 7)} # Network and broadcast excluded
+    assert sampler.ips(2, "10.9.9.9/32") == ["10.9.9.9"] * 2
+    assert sampler.ips(1, "not-a-subnet") == ["10.0.0.1"]
+
+    assert all(re.match(r"^00:50:56(:[0-9a-f]{2}){3}$", mac) for mac in sampler.macs(50))
+    uuids = sampler.uuids(50, prefix="vm-")
+    assert len(set(uuids)) == 50
+    assert all(uuid_module.UUID(u[3:]).version == 4 and uuid_module.UUID(u[3:]).variant == uuid_module.RFC_4122 for u in uuids)
+    assert uuid_module.UUID(sampler.uuid()).version == 4
+
+    dates = [datetime.strptime(d, "%Y-%m-%d %H:%M:%S") for d in sampler.dates(200, "2023-05-10", "2023-05-11")]
+    assert all(datetime(2023, 5, 10) <= d < datetime(2023, 5, 12) for d in dates)
+    assert sampler.dates(1, "2023-10-10", "2023-10-10", "%d/%m/%Y") == ["10/10/2023"]
+    assert [len(s) for s in sampler.strings(3, 4)] == [4, 4, 4]
+
+def test_primitive_sampler_is_deterministic_per_stream():
+    def draw(seed):
+        sampler = PrimitiveSampler(random.Random(seed))
+        return sampler.ips(5), sampler.macs(5), sampler.uuids(5), sampler.dates(5), sampler.strings(5, 6)
+    assert draw(1) == draw(1)
+    assert draw(1) != draw(2)
+
 def test_choose_random_from_list():
     my_list = ["a", "b", "c"]
     choice = choose_random_from_list(my_list)
@@ -217,4 +244,3 @@ datacenters:
     empty_config = load_scenario_config(str(empty_yaml_file))
     # yaml.safe_load("") returns None, so this is expected
     assert empty_config is None
-```